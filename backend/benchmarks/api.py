@@ -0,0 +1,344 @@
+"""Нагрузочный прогон API смешанной нагрузкой.
+
+Заполняет базу сгенерированными фондами (create_bulk_test_data, одинаковые
+данные при одном --seed) и гоняет параллельных клиентов по сценарию:
+список, карточка фонда, список категории, пожертвование, логин, /auth/me.
+Печатает пропускную способность и p50/p95/p99 по каждой операции.
+
+Приложение запускается в процессе через httpx ASGITransport или, с --server,
+настоящим uvicorn с --workers воркерами. База - SQLite или Postgres.
+
+--admission local или postgres включает utils/admission.py с пределами,
+которых нагрузка не достигает: отказов нет, и разница с прогоном
+--admission off (по умолчанию) - накладной расход самой проверки.
+
+Результат сохраняется в JSON (--save) и сравнивается с прошлым прогоном
+(--baseline): падение rps или рост p95/p99 больше --tolerance считается
+регрессией, и бенчмарк завершается с кодом 1.
+
+    BENCH_DATABASE_URL=sqlite+aiosqlite:///bench.db python -m benchmarks.api --dataset 10k
+    BENCH_DATABASE_URL=postgresql+asyncpg://... python -m benchmarks.api --dataset 1m --server --workers 4
+    python -m benchmarks.api --dataset 100k --save baseline.json
+    python -m benchmarks.api --dataset 100k --baseline baseline.json --tolerance 0.15
+    python -m benchmarks.api --workload write --admission postgres --baseline baseline.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import platform
+import subprocess
+from datetime import datetime, timezone
+from benchmarks.common import use_bench_database, reset_database, percentile, print_table, BACKEND_DIR
+
+use_bench_database()
+
+import httpx
+from sqlalchemy import select, func
+from database import engine, new_session, dialect_insert
+from models.auth import UserOrm
+from models.funds import FundOrm, CategoryOrm
+from utils.create_test_data import create_bulk_test_data
+from utils.migrations import migrate
+from utils.passwords import password_hasher
+from utils.security import create_access_token
+from config import settings
+
+
+
+
+DATASETS = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+
+# Доли операций в сценарии
+WORKLOADS = {
+    'mixed': {'list': 30, 'detail': 30, 'category': 15, 'donate': 10, 'me': 10, 'login': 5},
+    'read': {'list': 40, 'detail': 40, 'category': 20},
+    'write': {'donate': 100},
+    'auth': {'login': 20, 'me': 80},
+}
+for operation in ('list', 'detail', 'category', 'donate', 'login', 'me'):
+    WORKLOADS[operation] = {operation: 1}
+
+PASSWORD = 'bench'
+
+
+def use_admission(mode: str):
+    # До импорта main: синглтон admission читает пределы из settings при импорте.
+    # Переменные окружения нужны воркерам uvicorn с --server
+    values = {'rate_limit_enabled': mode != 'off'}
+    if mode != 'off':
+        values['rate_limit_backend'] = mode
+        for name in type(settings).model_fields:
+            if name.startswith('rate_limit_') and name.endswith(('_per_minute', '_burst')):
+                values[name] = 10 ** 9
+            elif name.startswith('max_in_flight_'):
+                values[name] = 10 ** 9
+    for name, value in values.items():
+        setattr(settings, name, value)
+        os.environ[name.upper()] = str(value)
+
+
+class Dataset:
+    def __init__(self, fund_ids: tuple[int, int], category_ids: list[int], emails: list[str]):
+        self.fund_ids = fund_ids
+        self.category_ids = category_ids
+        self.emails = emails
+        self.tokens = [create_access_token(data={'sub': email}) for email in emails]
+
+
+async def prepare(funds: int, users: int, seed: int, reset: bool) -> Dataset:
+    if reset:
+        await reset_database()
+    else:
+        await migrate()
+
+    started = time.perf_counter()
+    added = await create_bulk_test_data(funds, seed=seed)
+    if added:
+        print(f'Добавлено {added} фондов за {time.perf_counter() - started:.1f} с')
+
+    # Пользователи с одним паролем: хэш считается один раз
+    emails = [f'bench{number}@example.com' for number in range(users)]
+    hashed = await password_hasher.hash(PASSWORD)
+    async with new_session() as session:
+        await session.execute(
+            dialect_insert(UserOrm)
+            .values([{'username': email.split('@')[0], 'email': email, 'hashed_password': hashed} for email in emails])
+            .on_conflict_do_nothing(index_elements=['email'])
+        )
+        await session.commit()
+        fund_ids = tuple((await session.execute(select(func.min(FundOrm.id), func.max(FundOrm.id)))).one())
+        category_ids = list((await session.execute(select(CategoryOrm.id))).scalars())
+    return Dataset(fund_ids, category_ids, emails)
+
+
+async def op_list(client: httpx.AsyncClient, rng: random.Random, dataset: Dataset) -> httpx.Response:
+    # Ключ запроса меняется, чтобы замерять не только кэш ответов
+    order_by = rng.choice(['created_at', 'target_date', 'collected', 'progress'])
+    return await client.get('/funds/', params={'limit': 20, 'order_by': order_by, 'order': rng.choice(['asc', 'desc'])})
+
+
+async def op_detail(client: httpx.AsyncClient, rng: random.Random, dataset: Dataset) -> httpx.Response:
+    return await client.get(f'/funds/{rng.randint(*dataset.fund_ids)}')
+
+
+async def op_category(client: httpx.AsyncClient, rng: random.Random, dataset: Dataset) -> httpx.Response:
+    # Страница категории, а не /funds/categories/{id}: тот отдает категорию целиком
+    return await client.get('/funds/', params={'limit': 20, 'category_id': rng.choice(dataset.category_ids)})
+
+
+async def op_donate(client: httpx.AsyncClient, rng: random.Random, dataset: Dataset) -> httpx.Response:
+    return await client.post(f'/funds/{rng.randint(*dataset.fund_ids)}/donate', json={'amount': rng.randint(1, 1000)})
+
+
+async def op_login(client: httpx.AsyncClient, rng: random.Random, dataset: Dataset) -> httpx.Response:
+    return await client.post('/auth/login', json={'email': rng.choice(dataset.emails), 'password': PASSWORD})
+
+
+async def op_me(client: httpx.AsyncClient, rng: random.Random, dataset: Dataset) -> httpx.Response:
+    return await client.get('/auth/me', headers={'Authorization': f'Bearer {rng.choice(dataset.tokens)}'})
+
+
+OPERATIONS = {
+    'list': op_list,
+    'detail': op_detail,
+    'category': op_category,
+    'donate': op_donate,
+    'login': op_login,
+    'me': op_me,
+}
+
+
+async def load(client: httpx.AsyncClient, dataset: Dataset, workload: dict, concurrency: int, duration: float, seed: int) -> dict:
+    """Гоняет concurrency клиентов duration секунд; возвращает {операция: ([задержки], ошибки)}."""
+    names = list(workload)
+    weights = [workload[name] for name in names]
+    latencies = {name: [] for name in names}
+    errors = dict.fromkeys(names, 0)
+    stop = time.perf_counter() + duration
+
+    async def worker(number: int):
+        rng = random.Random(seed * 1000 + number)
+        while time.perf_counter() < stop:
+            name = rng.choices(names, weights)[0]
+            started = time.perf_counter()
+            try:
+                response = await OPERATIONS[name](client, rng, dataset)
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            latencies[name].append(time.perf_counter() - started)
+            errors[name] += failed
+
+    await asyncio.gather(*(worker(number) for number in range(concurrency)))
+    return {name: (latencies[name], errors[name]) for name in names}
+
+
+def summarize(latencies: list[float], errors: int, duration: float) -> dict:
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': round(len(latencies) / duration, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def start_server(workers: int) -> tuple[subprocess.Popen, str]:
+    port = free_port()
+    env = {**os.environ, 'SEED_TEST_DATA': '0'}
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'main:app', '--port', str(port), '--workers', str(workers), '--log-level', 'warning'],
+        cwd=BACKEND_DIR, env=env,
+    )
+    base_url = f'http://127.0.0.1:{port}'
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        for _ in range(600):
+            if process.poll() is not None:
+                raise SystemExit(f'uvicorn завершился с кодом {process.returncode}')
+            try:
+                if (await client.get('/funds/', params={'limit': 1})).status_code == 200:
+                    return process, base_url
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.1)
+    process.terminate()
+    raise SystemExit('uvicorn не ответил за минуту')
+
+
+async def run(args, dataset: Dataset, workload: dict) -> dict:
+    if not args.server:
+        from main import app
+
+        async with app.router.lifespan_context(app):
+            # Необработанное исключение приложения - это ответ 500, а не падение клиента
+            transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+            async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+                if args.warmup:
+                    await load(client, dataset, workload, args.concurrency, args.warmup, args.seed + 1)
+                return await load(client, dataset, workload, args.concurrency, args.duration, args.seed)
+
+    process, base_url = await start_server(args.workers)
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+            if args.warmup:
+                await load(client, dataset, workload, args.concurrency, args.warmup, args.seed + 1)
+            return await load(client, dataset, workload, args.concurrency, args.duration, args.seed)
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Печатает изменения относительно baseline и возвращает список регрессий."""
+    for key in ('funds', 'workload', 'mode', 'concurrency', 'database', 'admission'):
+        if result['meta'].get(key) != baseline['meta'].get(key):
+            print(f'Внимание: {key} отличается от базового прогона: '
+                  f'{baseline["meta"].get(key)} -> {result["meta"].get(key)}')
+
+    regressions = []
+    rows = []
+    for name, current in {**result['operations'], 'всего': result['total']}.items():
+        previous = baseline['total'] if name == 'всего' else baseline['operations'].get(name)
+        if not previous or not previous['requests']:
+            continue
+        changes = {
+            'rps': current['rps'] / previous['rps'] - 1 if previous['rps'] else 0.0,
+            'p95_ms': current['p95_ms'] / previous['p95_ms'] - 1 if previous['p95_ms'] else 0.0,
+            'p99_ms': current['p99_ms'] / previous['p99_ms'] - 1 if previous['p99_ms'] else 0.0,
+        }
+        worse = [
+            key for key, change in changes.items()
+            if (change < -tolerance if key == 'rps' else change > tolerance)
+        ]
+        regressions += [f'{name}: {key} {changes[key]:+.0%}' for key in worse]
+        rows.append([name] + [f'{change:+.0%}' for change in changes.values()] + ['РЕГРЕССИЯ' if worse else ''])
+    print_table(['операция', 'rps', 'p95', 'p99', ''], rows)
+    return regressions
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dataset', choices=DATASETS, default='10k', help='число фондов')
+    parser.add_argument('--funds', type=int, help='число фондов вместо --dataset')
+    parser.add_argument('--workload', choices=WORKLOADS, default='mixed')
+    parser.add_argument('--concurrency', type=int, default=32, help='параллельных клиентов')
+    parser.add_argument('--duration', type=float, default=20, help='секунд замера')
+    parser.add_argument('--warmup', type=float, default=3, help='секунд прогрева без замера')
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--reset', action='store_true', help='пересоздать таблицы перед заполнением')
+    parser.add_argument('--server', action='store_true', help='настоящий uvicorn вместо ASGITransport')
+    parser.add_argument('--workers', type=int, default=1, help='воркеров uvicorn с --server')
+    parser.add_argument('--admission', choices=['off', 'local', 'postgres'], default='off',
+                        help='ограничитель частоты с недостижимыми пределами, для замера его накладного расхода')
+    parser.add_argument('--save', help='сохранить результат в JSON')
+    parser.add_argument('--baseline', help='JSON прошлого прогона для сравнения')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='допустимое ухудшение, доля')
+    args = parser.parse_args()
+
+    use_admission(args.admission)
+    funds = args.funds or DATASETS[args.dataset]
+    workload = WORKLOADS[args.workload]
+    dataset = await prepare(funds, args.users, args.seed, args.reset)
+    await engine.dispose()
+
+    try:
+        results = await run(args, dataset, workload)
+    finally:
+        # Иначе потоки aiosqlite не дают интерпретатору завершиться
+        await engine.dispose()
+
+    operations = {name: summarize(latencies, errors, args.duration) for name, (latencies, errors) in results.items()}
+    all_latencies = [latency for latencies, _ in results.values() for latency in latencies]
+    total = summarize(all_latencies, sum(errors for _, errors in results.values()), args.duration)
+    result = {
+        'meta': {
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'funds': funds,
+            'workload': args.workload,
+            'mode': f'uvicorn x{args.workers}' if args.server else 'asgi',
+            'concurrency': args.concurrency,
+            'duration': args.duration,
+            'database': engine.dialect.name,
+            'admission': args.admission,
+            'python': platform.python_version(),
+        },
+        'operations': operations,
+        'total': total,
+    }
+
+    print(f"\n{result['meta']['mode']}, {engine.dialect.name}, {funds} фондов, "
+          f"{args.workload}, {args.concurrency} клиентов, {args.duration:g} с, ограничитель {args.admission}")
+    headers = ['операция', 'запросов', 'ошибок', 'rps', 'p50 мс', 'p95 мс', 'p99 мс']
+    keys = ['requests', 'errors', 'rps', 'p50_ms', 'p95_ms', 'p99_ms']
+    print_table(headers, [[name] + [stats[key] for key in keys] for name, stats in {**operations, 'всего': total}.items()])
+
+    if args.save:
+        with open(args.save, 'w') as file:
+            json.dump(result, file, ensure_ascii=False, indent=2)
+        print(f'Результат сохранен в {args.save}')
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        print(f'\nСравнение с {args.baseline} (допуск {args.tolerance:.0%}):')
+        regressions = compare(result, baseline, args.tolerance)
+        if regressions:
+            raise SystemExit('Регрессии: ' + '; '.join(regressions))
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,43 @@
+import os
+import sys
+from pathlib import Path
+
+
+
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+
+def use_bench_database():
+    # Бенчмарки пересоздают таблицы, поэтому работают только с отдельной базой.
+    # Вызывать до импорта config.py
+    url = os.getenv('BENCH_DATABASE_URL')
+    if not url:
+        raise SystemExit('Укажите BENCH_DATABASE_URL: бенчмарк пересоздает все таблицы в этой базе')
+    os.environ['DATABASE_URL'] = url
+
+
+async def reset_database():
+    from database import delete_tables
+    from utils.migrations import migrate
+
+    await delete_tables()
+    await migrate()
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def print_table(headers: list[str], rows: list[list]):
+    widths = [max(len(str(cell)) for cell in column) for column in zip(headers, *rows)]
+    line = '  '.join(f'{{:>{w}}}' for w in widths)
+    print(line.format(*headers))
+    for row in rows:
+        print(line.format(*row))
@@ -0,0 +1,104 @@
+"""Бенчмарк очереди развертывания кампаний (utils/deployer.py).
+
+Ставит --funds фондов в очередь и гоняет FundDeployer, пока все не
+развернутся, на настоящем узле RPC_URL: hardhat node или anvil с
+развернутым PlatformRegistry и верифицированной организацией.
+Печатает время, транзакций в секунду и сколько HTTP-запросов и
+JSON-RPC вызовов ушло к узлу.
+
+    npx hardhat node
+    npx hardhat run scripts/deploy.js --network localhost
+    BENCH_DATABASE_URL=postgresql+asyncpg://... RPC_URL=http://127.0.0.1:8545 \\
+        PLATFORM_REGISTRY_ADDRESS=0x... ORGANIZATION_PRIVATE_KEY=0x... python -m benchmarks.deployments
+"""
+import time
+import asyncio
+import argparse
+from datetime import datetime, timedelta, timezone
+from benchmarks.common import use_bench_database, reset_database, print_table
+
+use_bench_database()
+
+from database import engine
+from repositories.funds import FundRepository
+from repositories.deployments import DeploymentRepository
+from utils.deployer import FundDeployer
+from web3 import RpcClient
+
+
+
+
+class CountingRpc(RpcClient):
+    def __init__(self):
+        super().__init__()
+        self.requests = 0
+        self.calls = 0
+
+    async def batch(self, calls: list[tuple[str, list]]) -> list:
+        if calls:
+            self.requests += 1
+            self.calls += len(calls)
+        return await super().batch(calls)
+
+
+async def run(args) -> list:
+    await reset_database()
+    target_date = datetime.now(timezone.utc) + timedelta(days=30)
+    await FundRepository.create_funds([
+        {
+            'category_id': 1,
+            'title': f'Кампания {number}',
+            'description': 'Бенчмарк развертывания',
+            'target': 1 + number % 10,
+            'target_date': target_date,
+            'location': '',
+            'team_info': '',
+            'link': '',
+            'contract_address': '',
+            'deploy_status': 'pending',
+        }
+        for number in range(args.funds)
+    ])
+
+    rpc = CountingRpc()
+    deployer = FundDeployer(rpc, batch_size=args.batch_size, max_in_flight=args.max_in_flight)
+    started = time.perf_counter()
+    try:
+        while time.perf_counter() - started < args.timeout:
+            await deployer.step()
+            if not await DeploymentRepository.count('pending') and not await DeploymentRepository.count('submitted'):
+                break
+            await asyncio.sleep(args.poll)
+        elapsed = time.perf_counter() - started
+    finally:
+        await deployer.stop()
+
+    return [
+        args.funds,
+        deployer.deployed,
+        deployer.failed,
+        round(elapsed, 2),
+        round(deployer.deployed / elapsed, 1),
+        rpc.requests,
+        rpc.calls,
+    ]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--funds', type=int, default=100)
+    parser.add_argument('--batch-size', type=int, default=20, help='DEPLOYER_BATCH_SIZE')
+    parser.add_argument('--max-in-flight', type=int, default=64, help='DEPLOYER_MAX_IN_FLIGHT')
+    parser.add_argument('--poll', type=float, default=0.2, help='пауза между шагами, с')
+    parser.add_argument('--timeout', type=float, default=300)
+    args = parser.parse_args()
+
+    try:
+        row = await run(args)
+    finally:
+        await engine.dispose()
+    print_table(['фондов', 'развернуто', 'ошибок', 'секунд', 'tx/с', 'HTTP-запросов', 'RPC-вызовов'], [row])
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
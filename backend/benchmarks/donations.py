@@ -0,0 +1,135 @@
+"""Конкурентный бенчмарк POST /funds/{fund_id}/donate.
+
+Проверяет, что суммы на фонде сходятся при 1, 50 и 500 одновременных
+донорах, и печатает пропускную способность для каждого режима, включая
+шардированные счетчики (DONATION_COUNTER_SHARDS).
+
+    BENCH_DATABASE_URL=postgresql+asyncpg://... python -m benchmarks.donations
+"""
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from benchmarks.common import use_bench_database, reset_database, print_table
+
+use_bench_database()
+
+from sqlalchemy import select
+from database import new_session, engine
+from models.funds import FundOrm, CategoryOrm
+from utils.donations import DonationEngine
+from config import settings
+
+
+
+
+class LegacyEngine:
+    """Старый путь: SELECT, инкремент в Python, commit. Для сравнения."""
+
+    async def start(self):
+        pass
+
+    async def donate(self, fund_id: int, amount: int):
+        async with new_session() as session:
+            result = await session.execute(select(FundOrm).where(FundOrm.id == fund_id))
+            fund = result.scalars().first()
+            fund.collected += amount
+            fund.donate_count += 1
+            await session.commit()
+            return fund
+
+    async def drain(self):
+        pass
+
+
+async def create_fund() -> int:
+    async with new_session() as session:
+        category = CategoryOrm(category='Бенчмарк')
+        session.add(category)
+        await session.flush()
+        fund = FundOrm(
+            category_id=category.id,
+            title='Бенчмарк',
+            description='Фонд для нагрузочного теста',
+            target=10**9,
+            target_date=datetime.now(timezone.utc) + timedelta(days=30),
+            location='',
+            team_info='',
+            link='',
+            contract_address='',
+        )
+        session.add(fund)
+        await session.commit()
+        return fund.id
+
+
+async def read_totals(fund_id: int) -> tuple[int, int]:
+    async with new_session() as session:
+        result = await session.execute(
+            select(FundOrm.collected, FundOrm.donate_count).where(FundOrm.id == fund_id)
+        )
+        return tuple(result.one())
+
+
+async def run_level(donation_engine, donors: int, total: int) -> list:
+    fund_id = await create_fund()
+    per_donor = max(1, total // donors)
+    amounts = [[random.randint(1, 100) for _ in range(per_donor)] for _ in range(donors)]
+
+    async def donor(own_amounts):
+        for amount in own_amounts:
+            await donation_engine.donate(fund_id, amount)
+
+    await donation_engine.start()
+    start = time.perf_counter()
+    await asyncio.gather(*(donor(a) for a in amounts))
+    await donation_engine.drain()
+    elapsed = time.perf_counter() - start
+
+    expected_sum = sum(map(sum, amounts))
+    expected_count = donors * per_donor
+    collected, donate_count = await read_totals(fund_id)
+    exact = collected == expected_sum and donate_count == expected_count
+    return [
+        donors,
+        expected_count,
+        f'{expected_count / elapsed:.0f}',
+        f'{collected}/{expected_sum}',
+        f'{donate_count}/{expected_count}',
+        'да' if exact else 'НЕТ',
+    ]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--total', type=int, default=2000, help='пожертвований на один уровень')
+    parser.add_argument('--levels', type=int, nargs='+', default=[1, 50, 500])
+    parser.add_argument('--window-ms', type=float, default=5, help='окно батчинга')
+    parser.add_argument('--shards', type=int, default=8, help='шардов счетчиков, 0 - без этого режима')
+    parser.add_argument('--legacy', action='store_true', help='прогнать также старый SELECT + commit')
+    args = parser.parse_args()
+
+    await reset_database()
+    modes = [
+        ('журнал + UPDATE', DonationEngine(), 0),
+        (f'батчинг {args.window_ms:g} мс', DonationEngine(batch_window=args.window_ms / 1000), 0),
+    ]
+    if args.shards:
+        # Итог сверяется после drain, который переносит шарды в funds
+        modes.append((f'{args.shards} шардов счетчиков', DonationEngine(counter_shards=args.shards), args.shards))
+    if args.legacy:
+        modes.append(('старый SELECT + commit', LegacyEngine(), 0))
+
+    headers = ['доноров', 'запросов', 'rps', 'collected', 'donate_count', 'точно']
+    for title, donation_engine, shards in modes:
+        settings.donation_counter_shards = shards
+        print(f'\n== {title}')
+        rows = [await run_level(donation_engine, donors, args.total) for donors in args.levels]
+        print_table(headers, rows)
+
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,202 @@
+"""Бенчмарк рассылки изменений фондов (utils/fund_events.py).
+
+По умолчанию без сети и базы: --subscribers подписчиков в одном процессе
+слушают --funds фондов через хаб, часть из них (--slow) медленные.
+Публикации идут с частотой --rate в секунду. Печатает задержку доставки,
+сколько событий склеено, память на подписчика и время раздачи одного
+сообщения всем подписчикам.
+
+С --server подписчики - настоящие SSE-клиенты uvicorn, а изменения -
+пожертвования через POST /funds/{id}/donate; нужна BENCH_DATABASE_URL.
+Задержка считается от отправки пожертвования до события с его donate_count.
+
+    python -m benchmarks.fund_events --subscribers 10000
+    BENCH_DATABASE_URL=postgresql+asyncpg://... python -m benchmarks.fund_events --server --subscribers 2000
+"""
+import os
+import sys
+import time
+import json
+import asyncio
+import argparse
+import tracemalloc
+import subprocess
+from types import SimpleNamespace
+from benchmarks.common import percentile, print_table, BACKEND_DIR
+
+
+
+
+async def run_hub(args) -> dict:
+    os.environ['PUBSUB_BACKEND'] = 'local'
+    os.environ['FUND_EVENTS_INTERVAL'] = str(args.interval)
+    os.environ['FUND_EVENTS_MAX_SUBSCRIBERS'] = str(args.subscribers)
+    from utils.fund_events import fund_events
+
+    await fund_events.start()
+    funds = [SimpleNamespace(id=number, collected=0, donate_count=0, target=10 ** 9, revision=0) for number in range(1, args.funds + 1)]
+    # Момент публикации и доставки по (фонд, donate_count): в событии нет времени
+    published_at, received = {}, []
+    ready = asyncio.Event()
+    started = 0
+
+    async def subscriber(number: int):
+        nonlocal started
+        fund = funds[number % len(funds)]
+        slow = number < args.subscribers * args.slow
+        listener = fund_events.listen(fund)
+        await anext(listener)
+        started += 1
+        if started == args.subscribers:
+            ready.set()
+        async for state in listener:
+            if state is None:
+                continue
+            received.append(((state['id'], state['donate_count']), time.time()))
+            if slow:
+                await asyncio.sleep(0.5)
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    tasks = [asyncio.create_task(subscriber(number)) for number in range(args.subscribers)]
+    await ready.wait()
+    memory = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    # Раздача одного сообщения: все подписчики одного фонда. Первый вызов - прогрев
+    fund_events._on_message(json.dumps([{**vars(funds[0]), 'id': 0}]))
+    message = json.dumps([{**vars(funds[0]), 'revision': 1}])
+    fanout_started = time.perf_counter()
+    fund_events._on_message(message)
+    fanout = time.perf_counter() - fanout_started
+    fund_events.latest[funds[0].id] = (0, 0)
+    await asyncio.sleep(0.1)
+    received.clear()
+
+    stop = time.perf_counter() + args.duration
+    published = 0
+    while time.perf_counter() < stop:
+        fund = funds[published % len(funds)]
+        fund.collected += 1
+        fund.donate_count += 1
+        published_at[(fund.id, fund.donate_count)] = time.time()
+        await fund_events.publish(fund)
+        published += 1
+        await asyncio.sleep(1 / args.rate)
+    await asyncio.sleep(args.interval + 0.6)
+
+    snapshot = fund_events.snapshot()
+    await fund_events.stop()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return {
+        'published': published,
+        'messages': snapshot['delivered'],
+        'coalesced': snapshot['coalesced'],
+        'latencies': [at - published_at[key] for key, at in received if key in published_at],
+        'memory_per_subscriber': memory / args.subscribers,
+        'fanout_ms': fanout * 1000,
+    }
+
+
+async def run_server(args) -> dict:
+    from benchmarks.common import use_bench_database
+
+    use_bench_database()
+    import httpx
+    from benchmarks.api import free_port
+
+    env = {**os.environ, 'SEED_TEST_DATA': '1', 'FUND_EVENTS_INTERVAL': str(args.interval)}
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'main:app', '--port', str(port), '--workers', str(args.workers), '--log-level', 'warning'],
+        cwd=BACKEND_DIR, env=env,
+    )
+    base_url = f'http://127.0.0.1:{port}'
+    sent_at, received = {}, []
+    connected = 0
+    try:
+        limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+            for _ in range(600):
+                try:
+                    if (await client.get('/funds/1')).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                await asyncio.sleep(0.1)
+            fund_ids = [fund['id'] for fund in (await client.get('/funds/', params={'limit': args.funds})).json()['items']]
+
+            async def subscriber(number: int):
+                nonlocal connected
+                first = True
+                async with client.stream('GET', f'/funds/{fund_ids[number % len(fund_ids)]}/events') as response:
+                    async for line in response.aiter_lines():
+                        if not line.startswith('data:'):
+                            continue
+                        if first:
+                            first = False
+                            connected += 1
+                            continue
+                        state = json.loads(line[5:])
+                        received.append(((state['id'], state['donate_count']), time.time()))
+
+            tasks = [asyncio.create_task(subscriber(number)) for number in range(args.subscribers)]
+            while connected < args.subscribers:
+                if all(task.done() for task in tasks):
+                    raise SystemExit('Все подписчики отключились')
+                await asyncio.sleep(0.1)
+
+            stop = time.perf_counter() + args.duration
+            published = 0
+            while time.perf_counter() < stop:
+                started = time.time()
+                response = await client.post(f'/funds/{fund_ids[published % len(fund_ids)]}/donate', json={'amount': 1})
+                if response.status_code == 200:
+                    fund = response.json()
+                    sent_at[(fund['id'], fund['donate_count'])] = started
+                published += 1
+                await asyncio.sleep(1 / args.rate)
+            await asyncio.sleep(args.interval + 1)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        process.terminate()
+        process.wait()
+    latencies = [at - sent_at[key] for key, at in received if key in sent_at]
+    return {'published': published, 'messages': len(received), 'latencies': latencies}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--subscribers', type=int, default=10000)
+    parser.add_argument('--funds', type=int, default=10, help='между сколькими фондами поделены подписчики')
+    parser.add_argument('--rate', type=float, default=50, help='изменений в секунду')
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--interval', type=float, default=0.25, help='FUND_EVENTS_INTERVAL')
+    parser.add_argument('--slow', type=float, default=0.1, help='доля медленных подписчиков, без --server')
+    parser.add_argument('--server', action='store_true', help='SSE-клиенты настоящего uvicorn')
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args()
+
+    result = await (run_server(args) if args.server else run_hub(args))
+    latencies = result['latencies']
+    mode = f'uvicorn x{args.workers}, SSE' if args.server else 'хаб в процессе'
+    print(f'\n{mode}: {args.subscribers} подписчиков, {args.funds} фондов, {args.rate:g} изменений/с, окно {args.interval:g} с')
+    rows = [
+        ['изменений опубликовано', result['published']],
+        ['событий доставлено', result['messages']],
+        ['p50 задержки, мс', round(percentile(latencies, 50) * 1000, 1)],
+        ['p99 задержки, мс', round(percentile(latencies, 99) * 1000, 1)],
+    ]
+    if not args.server:
+        rows += [
+            ['склеено у медленных', result['coalesced']],
+            ['память на подписчика, КБ', round(result['memory_per_subscriber'] / 1024, 2)],
+            [f'раздача {args.subscribers // args.funds} подписчикам, мс', round(result['fanout_ms'], 2)],
+        ]
+    print_table(['', 'значение'], rows)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,74 @@
+"""Время холодного импорта main:app по python -X importtime.
+
+Каждый запуск - отдельный процесс без кэша модулей в памяти, из запусков
+берется самый быстрый. Печатает самые тяжелые модули и завершается с
+кодом 1, если импорт дольше бюджета, чтобы тяжелая зависимость, случайно
+импортированная при старте, ловилась в CI.
+
+База не нужна: движок создается без подключения, но DATABASE_URL
+должен быть задан, как и для самого приложения.
+
+    python -m benchmarks.importtime --budget-ms 1200
+"""
+import re
+import sys
+import argparse
+import subprocess
+from benchmarks.common import print_table, BACKEND_DIR
+
+
+
+
+LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def measure() -> list[tuple[str, int, int, int]]:
+    # [(модуль, глубина, собственное время, время с зависимостями)] в микросекундах
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import main'],
+        cwd=BACKEND_DIR, capture_output=True, text=True,
+    )
+    if process.returncode != 0:
+        raise SystemExit(f'Импорт main завершился с кодом {process.returncode}:\n{process.stderr[-2000:]}')
+    modules = []
+    for line in process.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            own, cumulative, indent, name = match.groups()
+            modules.append((name, len(indent) // 2, int(own), int(cumulative)))
+    return modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5, help='запусков, берется самый быстрый')
+    parser.add_argument('--budget-ms', type=float, default=1200, help='допустимое время импорта main')
+    parser.add_argument('--top', type=int, default=15, help='сколько модулей показать')
+    args = parser.parse_args()
+
+    runs = [measure() for _ in range(args.repeat)]
+    total = {id(run): next(cumulative for name, depth, _, cumulative in run if name == 'main' and depth == 0) for run in runs}
+    fastest = min(runs, key=lambda run: total[id(run)])
+    main_ms = total[id(fastest)] / 1000
+
+    # Прямые импорты main и их зависимости первого уровня
+    direct = sorted((module for module in fastest if module[1] in (1, 2)), key=lambda module: -module[3])
+    print_table(
+        ['модуль', 'уровень', 'свое мс', 'всего мс'],
+        [[name, depth, f'{own / 1000:.1f}', f'{cumulative / 1000:.1f}'] for name, depth, own, cumulative in direct[:args.top]],
+    )
+    heaviest = sorted(fastest, key=lambda module: -module[2])[:args.top]
+    print('Самые тяжелые модули без зависимостей:')
+    print_table(
+        ['модуль', 'свое мс'],
+        [[name, f'{own / 1000:.1f}'] for name, _, own, _ in heaviest],
+    )
+
+    runs_ms = ', '.join(f'{total[id(run)] / 1000:.0f}' for run in runs)
+    print(f'import main: {main_ms:.0f} мс (запуски: {runs_ms}), бюджет {args.budget_ms:.0f} мс')
+    if main_ms > args.budget_ms:
+        raise SystemExit(f'Импорт main дольше бюджета на {main_ms - args.budget_ms:.0f} мс')
+
+
+if __name__ == '__main__':
+    main()
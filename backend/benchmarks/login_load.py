@@ -0,0 +1,102 @@
+"""Задержка GET /funds/ под параллельными логинами.
+
+Гоняет приложение в процессе через httpx ASGITransport: несколько
+клиентов непрерывно логинятся, а один читает список фондов и меряет
+p50/p99. Сравнивает пул хэширования с bcrypt прямо в event loop.
+
+    BENCH_DATABASE_URL=postgresql+asyncpg://... python -m benchmarks.login_load
+"""
+import argparse
+import asyncio
+import time
+from benchmarks.common import use_bench_database, percentile, print_table
+
+use_bench_database()
+
+import httpx
+from main import app
+from repositories import auth as auth_repository
+from utils import passwords
+from utils.passwords import PasswordHasher
+
+
+
+
+class InlineHasher(PasswordHasher):
+    """Старое поведение: bcrypt выполняется прямо в event loop."""
+
+    async def _run(self, operation, fn, *args):
+        result, hash_time = fn(*args)
+        self.metrics.observe(0.0, hash_time)
+        return result
+
+
+async def run(client: httpx.AsyncClient, logins: int, duration: float) -> list:
+    stop = time.perf_counter() + duration
+    login_count = 0
+    rejected = 0
+
+    async def login_loop(number: int):
+        nonlocal login_count, rejected
+        while time.perf_counter() < stop:
+            response = await client.post('/auth/login', json={'email': f'bench{number}@example.com', 'password': 'bench'})
+            if response.status_code == 503:
+                rejected += 1
+                await asyncio.sleep(0.01)
+            else:
+                login_count += 1
+
+    latencies = []
+
+    async def read_loop():
+        while time.perf_counter() < stop:
+            started = time.perf_counter()
+            response = await client.get('/funds/')
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - started)
+            await asyncio.sleep(0.005)
+
+    await asyncio.gather(read_loop(), *(login_loop(number) for number in range(logins)))
+    return [
+        logins,
+        len(latencies),
+        f'{percentile(latencies, 50) * 1000:.1f}',
+        f'{percentile(latencies, 99) * 1000:.1f}',
+        f'{login_count / duration:.1f}',
+        rejected,
+    ]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--duration', type=float, default=5, help='секунд на один уровень')
+    parser.add_argument('--logins', type=int, nargs='+', default=[0, 4, 16])
+    args = parser.parse_args()
+
+    pool_hasher = passwords.password_hasher
+    modes = [
+        ('bcrypt в event loop', InlineHasher(pool='inline', workers=1, max_queue=0)),
+        (f'пул {pool_hasher.pool} x{pool_hasher.workers}', pool_hasher),
+    ]
+    headers = ['логинов', 'чтений', 'p50 мс', 'p99 мс', 'логинов/с', '503']
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+            # У каждого клиента свой пользователь: логины одного пользователя
+            # конкурируют за его refresh-токен
+            for number in range(max(args.logins)):
+                await client.post('/auth/register', json={
+                    'username': f'bench{number}', 'email': f'bench{number}@example.com',
+                    'password': 'bench', 'password_confirm': 'bench',
+                })
+            for title, hasher in modes:
+                # Репозиторий держит ссылку на объект, поэтому подменяем его там
+                auth_repository.password_hasher = hasher
+                print(f'\n== {title}')
+                rows = [await run(client, logins, args.duration) for logins in args.logins]
+                print_table(headers, rows)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,67 @@
+"""Накладные расходы MetricsMiddleware на запрос.
+
+Гоняет пустое ASGI-приложение с middleware и без него и печатает разницу
+на запрос в микросекундах, а также время сборки /metrics. Цель - меньше
+20 мкс на запрос. База не нужна.
+
+    python -m benchmarks.metrics
+"""
+import time
+import asyncio
+import argparse
+from benchmarks.common import print_table
+from utils.metrics import MetricsMiddleware, registry
+
+
+
+
+class Route:
+    path = '/funds/{fund_id}'
+
+
+async def endpoint(scope, receive, send):
+    scope['route'] = Route
+    await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+    await send({'type': 'http.response.body', 'body': b'{}'})
+
+
+async def receive():
+    return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+
+async def send(message):
+    pass
+
+
+async def run(app, requests: int) -> float:
+    started = time.perf_counter()
+    for _ in range(requests):
+        scope = {'type': 'http', 'method': 'GET', 'path': '/funds/1', 'root_path': '', 'headers': []}
+        await app(scope, receive, send)
+    return (time.perf_counter() - started) / requests
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=200_000)
+    parser.add_argument('--repeat', type=int, default=5, help='замеров, берется лучший')
+    args = parser.parse_args()
+
+    wrapped = MetricsMiddleware(endpoint)
+    bare = min([await run(endpoint, args.requests) for _ in range(args.repeat)])
+    metered = min([await run(wrapped, args.requests) for _ in range(args.repeat)])
+
+    started = time.perf_counter()
+    body = registry.render()
+    render = time.perf_counter() - started
+
+    print_table(['', 'мкс'], [
+        ['без middleware', f'{bare * 1e6:.2f}'],
+        ['с middleware', f'{metered * 1e6:.2f}'],
+        ['накладные расходы', f'{(metered - bare) * 1e6:.2f}'],
+        [f'/metrics ({len(body)} байт)', f'{render * 1e6:.0f}'],
+    ])
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,107 @@
+"""Бенчмарк чтения состояния кампаний (utils/onchain.py).
+
+Читает контракты фондов, развернутых benchmarks.deployments, двумя
+способами: по одному eth_call на HTTP-запрос, как делал фронтенд через
+ethers, и через OnchainReader (batch на одном блоке, кэш по блоку,
+single-flight). Для каждого печатает время каталога из --funds фондов и
+--visitors одновременных открытий карточек, а также сколько HTTP-запросов
+и JSON-RPC вызовов ушло к узлу.
+
+    python -m benchmarks.deployments --funds 100
+    BENCH_DATABASE_URL=postgresql+asyncpg://... RPC_URL=http://127.0.0.1:8545 python -m benchmarks.onchain
+"""
+import time
+import asyncio
+import argparse
+from benchmarks.common import use_bench_database, print_table
+from benchmarks.deployments import CountingRpc
+
+use_bench_database()
+
+from sqlalchemy import select
+from database import engine, new_session
+from models.funds import FundOrm
+from utils.onchain import OnchainReader, SUMMARY_SELECTORS, is_address, eth_call
+
+
+
+
+async def get_addresses(limit: int) -> list[str]:
+    async with new_session() as session:
+        result = await session.scalars(
+            select(FundOrm.contract_address).where(FundOrm.deploy_status == 'deployed').order_by(FundOrm.id).limit(limit)
+        )
+        return [address for address in result.all() if is_address(address)]
+
+
+async def read_naive(rpc: CountingRpc, address: str, block: int):
+    await asyncio.gather(*(rpc.call(*eth_call(address, selector, block)) for selector in SUMMARY_SELECTORS))
+
+
+async def run_naive(addresses: list[str], visitors: int) -> list:
+    rpc = CountingRpc()
+    try:
+        started = time.perf_counter()
+        block = int(await rpc.call('eth_blockNumber'), 16)
+        await asyncio.gather(*(read_naive(rpc, address, block) for address in addresses))
+        catalog = time.perf_counter() - started
+
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            read_naive(rpc, addresses[number % len(addresses)], block) for number in range(visitors)
+        ))
+        details = time.perf_counter() - started
+    finally:
+        await rpc.close()
+    return ['по одному', round(catalog * 1000), round(details * 1000), rpc.requests, rpc.calls]
+
+
+async def run_reader(addresses: list[str], visitors: int, args) -> list:
+    rpc = CountingRpc()
+    reader = OnchainReader(
+        rpc,
+        block_ttl=args.block_ttl,
+        cache_size=10000,
+        batch_calls=args.batch_calls,
+        max_requests=args.max_requests,
+    )
+    try:
+        started = time.perf_counter()
+        await reader.read_summaries(addresses)
+        catalog = time.perf_counter() - started
+
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            reader.read_campaign(addresses[number % len(addresses)]) for number in range(visitors)
+        ))
+        details = time.perf_counter() - started
+    finally:
+        await reader.stop()
+    return ['OnchainReader', round(catalog * 1000), round(details * 1000), rpc.requests, rpc.calls]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--funds', type=int, default=100)
+    parser.add_argument('--visitors', type=int, default=500, help='одновременных открытий карточек')
+    parser.add_argument('--block-ttl', type=float, default=1, help='ONCHAIN_BLOCK_TTL')
+    parser.add_argument('--batch-calls', type=int, default=500, help='ONCHAIN_BATCH_CALLS')
+    parser.add_argument('--max-requests', type=int, default=50, help='ONCHAIN_MAX_REQUESTS')
+    args = parser.parse_args()
+
+    try:
+        addresses = await get_addresses(args.funds)
+    finally:
+        await engine.dispose()
+    if not addresses:
+        raise SystemExit('В базе нет развернутых фондов, сначала запустите benchmarks.deployments')
+
+    rows = [
+        await run_naive(addresses, args.visitors),
+        await run_reader(addresses, args.visitors, args),
+    ]
+    print_table(['способ', 'каталог, мс', 'карточки, мс', 'HTTP-запросов', 'RPC-вызовов'], rows)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
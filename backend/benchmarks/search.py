@@ -0,0 +1,113 @@
+"""Задержка /funds/search на большом числе фондов.
+
+Заполняет базу синтетическими фондами (по умолчанию 1 000 000) прямо
+в SQL через generate_series и меряет p50/p99 поиска для редких и частых
+слов, фраз и запросов с опечаткой. Цель - p99 меньше 20 мс.
+
+База должна быть в кодировке UTF8, иначе to_tsvector не видит кириллицу.
+
+    BENCH_DATABASE_URL=postgresql+asyncpg://... python -m benchmarks.search
+"""
+import time
+import asyncio
+import argparse
+from benchmarks.common import use_bench_database, reset_database, percentile, print_table
+
+use_bench_database()
+
+from sqlalchemy import text
+from database import engine
+from utils.create_test_data import create_test_data
+from utils.search import FundSearch
+
+
+
+
+WORDS = (
+    'помощь дети сироты больница лечение животные приют корм школа образование книги экология лес река '
+    'парк уборка пожилые люди продукты лекарства волонтеры реабилитация операция инвалиды коляска спорт '
+    'площадка музыка театр библиотека компьютеры ремонт крыша храм памятник собаки кошки лошади птицы '
+    'пожар наводнение беженцы одежда обувь зима отопление вода колодец деревня село город район область '
+    'семья многодетная мама малыш кровь донор онкология слух зрение протез учитель студент стипендия'
+).split()
+RARE_WORDS = ['эндопротезирование', 'орнитологический', 'гидротерапия', 'хоспис']
+
+QUERIES = [
+    ('редкое слово', 'хоспис'),
+    ('частое слово', 'помощь'),
+    ('два слова', 'лечение собаки'),
+    ('фраза', '"приют для кошки"'),
+    ('с опечаткой', 'реабилитацыя'),
+    ('нет совпадений', 'космодром'),
+]
+
+
+def random_words(count: int) -> str:
+    # SQL-выражение из count случайных слов словаря :words
+    return " || ' ' || ".join(['(CAST(:words AS text[]))[1 + floor(random() * CAST(:word_count AS integer))::int]'] * count)
+
+
+async def fill(funds: int, batch: int):
+    query = text(f"""
+        INSERT INTO funds (
+            category_id, title, description, target, collected, donate_count, target_date,
+            location, team_info, link, contract_address, created_at
+        )
+        SELECT
+            1 + i % 7,
+            {random_words(3)} || CASE WHEN i % 5000 = 0 THEN ' ' || (CAST(:rare AS text[]))[1 + (i / 5000) % 4] ELSE '' END,
+            {random_words(25)},
+            100000, i % 100000, i % 500, now() + (i % 400) * interval '1 day',
+            {random_words(2)}, {random_words(4)}, 'https://example.com', '0x0', now()
+        FROM generate_series(CAST(:start AS integer), CAST(:stop AS integer)) AS i
+    """)
+    async with engine.begin() as conn:
+        for start in range(1, funds + 1, batch):
+            await conn.execute(query, {
+                'words': WORDS, 'word_count': len(WORDS), 'rare': RARE_WORDS,
+                'start': start, 'stop': min(start + batch - 1, funds),
+            })
+    # VACUUM не работает внутри транзакции
+    async with engine.connect() as conn:
+        await conn.execution_options(isolation_level='AUTOCOMMIT')
+        await conn.execute(text('VACUUM ANALYZE funds'))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--funds', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=200, help='запусков каждого запроса')
+    parser.add_argument('--limit', type=int, default=10)
+    args = parser.parse_args()
+
+    if engine.dialect.name != 'postgresql':
+        raise SystemExit('Бенчмарк поиска рассчитан на Postgres')
+
+    await reset_database()
+    await create_test_data()
+    started = time.perf_counter()
+    await fill(args.funds, 50_000)
+    print(f'Заполнено {args.funds} фондов за {time.perf_counter() - started:.1f} с')
+
+    search = FundSearch('postgres')
+    await search.start()
+    print(f'pg_trgm: {"есть" if search.trigram else "нет, опечатки не ищутся"}')
+
+    rows = []
+    for title, q in QUERIES:
+        latencies = []
+        for _ in range(args.repeat):
+            query_started = time.perf_counter()
+            hits = await search.search(q, args.limit, 0)
+            latencies.append(time.perf_counter() - query_started)
+        rows.append([
+            title, q, len(hits),
+            f'{percentile(latencies, 50) * 1000:.1f}',
+            f'{percentile(latencies, 99) * 1000:.1f}',
+        ])
+    print_table(['запрос', 'q', 'найдено', 'p50 мс', 'p99 мс'], rows)
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,105 @@
+"""Стоимость сериализации списка фондов в пересчете на один фонд.
+
+Сравнивает три пути на объектах FundOrm в памяти (база не нужна):
+
+- старый: SFund.model_validate на каждый фонд, затем FastAPI еще раз
+  валидирует список по response_model и кодирует стандартным json;
+- pydantic: SFund.model_validate и TypeAdapter(list[SFund]).dump_json;
+- быстрый: utils.serialization.dump_funds (атрибуты + orjson).
+
+    python -m benchmarks.serialization
+"""
+import time
+import asyncio
+import argparse
+from datetime import datetime, timedelta, timezone
+from benchmarks.common import print_table
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+from pydantic import TypeAdapter
+from models.funds import FundOrm
+from schemas.funds import SFund
+from utils.serialization import dump_funds
+
+
+
+
+def make_funds(count: int) -> list[FundOrm]:
+    now = datetime.now(timezone.utc)
+    return [
+        FundOrm(
+            id=number,
+            category_id=number % 7 + 1,
+            title=f'Фонд {number}',
+            description='Сбор на корм и лечение бездомных животных.',
+            target=100000 + number,
+            collected=number * 3 % 100000,
+            donate_count=number % 500,
+            photo_url=f'/uploads/{number:032x}.jpg',
+            photo_variants={'card_webp': f'/uploads/{number:032x}-card.webp'} if number % 2 else None,
+            target_date=now + timedelta(days=number % 400 - 50, seconds=number),
+            created_at=now - timedelta(days=number % 30),
+            location='Москва, Россия',
+            team_info='Команда из 5 волонтеров',
+            link='https://example.com',
+            contract_address='0x71C7656EC7ab88b098defB751B7401B5f6d8976F',
+        )
+        for number in range(1, count + 1)
+    ]
+
+
+response_field = create_model_field(name='Response', type_=list[SFund], mode='serialization')
+fund_list = TypeAdapter(list[SFund])
+
+
+async def old_path(funds: list) -> bytes:
+    content = [SFund.model_validate(fund) for fund in funds]
+    value = await serialize_response(field=response_field, response_content=content)
+    return JSONResponse(value).body
+
+
+async def pydantic_path(funds: list) -> bytes:
+    return fund_list.dump_json([SFund.model_validate(fund) for fund in funds])
+
+
+async def fast_path(funds: list) -> bytes:
+    return dump_funds(funds)
+
+
+async def measure(fn, funds: list, min_time: float) -> float:
+    # Повторяем, пока не наберется min_time, и берем лучший прогон
+    best = None
+    spent = 0.0
+    while spent < min_time or best is None:
+        started = time.perf_counter()
+        await fn(funds)
+        elapsed = time.perf_counter() - started
+        spent += elapsed
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(funds) * 1e6
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 1000, 100000])
+    parser.add_argument('--min-time', type=float, default=1.0, help='секунд на одну ячейку')
+    args = parser.parse_args()
+
+    rows = []
+    for size in args.sizes:
+        funds = make_funds(size)
+        # Быстрый путь обязан выдавать тот же JSON, что и pydantic
+        if await fast_path(funds[:1000]) != await pydantic_path(funds[:1000]):
+            raise SystemExit('dump_funds расходится с SFund.model_dump_json')
+        old = await measure(old_path, funds, args.min_time)
+        pydantic = await measure(pydantic_path, funds, args.min_time)
+        fast = await measure(fast_path, funds, args.min_time)
+        rows.append([size, f'{old:.2f}', f'{pydantic:.2f}', f'{fast:.2f}', f'{old / fast:.1f}x'])
+
+    print_table(['фондов', 'старый мкс', 'pydantic мкс', 'orjson мкс', 'ускорение'], rows)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
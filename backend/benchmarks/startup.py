@@ -0,0 +1,119 @@
+"""Время холодного и повторного запуска приложения по фазам.
+
+Каждый запуск - отдельный процесс: импорт main и lifespan до yield.
+Сценарии:
+
+- холодный: пустая база, применяются все миграции;
+- повторный: схема уже на месте, миграций нет;
+- N воркеров: N процессов стартуют одновременно, миграции применяет
+  только один, остальные ждут его на advisory lock.
+
+С --json результат пишется в файл, чтобы следить за временем запуска в CI.
+
+    BENCH_DATABASE_URL=postgresql+asyncpg://... python -m benchmarks.startup
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from benchmarks.common import use_bench_database, print_table, BACKEND_DIR
+
+
+
+
+def child(timings_file: str):
+    started = time.perf_counter()
+    import main
+    imported = time.perf_counter() - started
+
+    from utils.startup import startup_timer
+
+    async def run():
+        async with main.app.router.lifespan_context(main.app):
+            pass
+
+    asyncio.run(run())
+    snapshot = startup_timer.snapshot()
+    snapshot['import_ms'] = round(imported * 1000, 1)
+    with open(timings_file, 'w') as file:
+        json.dump(snapshot, file)
+
+
+def spawn(workers: int, seed: bool, warmup: bool) -> list[dict]:
+    env = {**os.environ, 'SEED_TEST_DATA': '1' if seed else '0', 'STARTUP_WARMUP': '1' if warmup else '0'}
+    with tempfile.TemporaryDirectory() as directory:
+        files = [os.path.join(directory, f'{number}.json') for number in range(workers)]
+        processes = [
+            subprocess.Popen(
+                [sys.executable, '-m', 'benchmarks.startup', '--child', path],
+                cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            )
+            for path in files
+        ]
+        for process in processes:
+            if process.wait() != 0:
+                raise SystemExit(f'Запуск завершился с кодом {process.returncode}')
+        results = []
+        for path in files:
+            with open(path) as file:
+                results.append(json.load(file))
+        return results
+
+
+def row(title: str, result: dict, phase_names: list[str]) -> list:
+    phases = {phase['name']: phase['ms'] for phase in result['phases']}
+    return [title, f"{result['import_ms']:.0f}", f"{result['total_ms']:.0f}"] + [
+        f'{phases[name]:.0f}' if name in phases else '-' for name in phase_names
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4, help='одновременных процессов в последнем сценарии')
+    parser.add_argument('--repeat', type=int, default=3, help='повторных запусков')
+    parser.add_argument('--no-warmup', action='store_true', help='без прогрева')
+    parser.add_argument('--json', help='файл для результатов')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # Один запуск приложения в этом процессе
+    if args.child:
+        child(args.child)
+        return
+
+    use_bench_database()
+    from database import delete_tables, engine
+
+    async def clear():
+        await delete_tables()
+        await engine.dispose()
+
+    warmup = not args.no_warmup
+    asyncio.run(clear())
+    runs = [('холодный', spawn(1, seed=True, warmup=warmup)[0])]
+    for number in range(args.repeat):
+        runs.append((f'повторный {number + 1}', spawn(1, seed=True, warmup=warmup)[0]))
+
+    asyncio.run(clear())
+    for number, result in enumerate(spawn(args.workers, seed=True, warmup=warmup), 1):
+        runs.append((f'воркер {number}/{args.workers}', result))
+
+    phase_names = []
+    for _, result in runs:
+        for phase in result['phases']:
+            if phase['name'] not in phase_names:
+                phase_names.append(phase['name'])
+    print('Время в мс; import - импорт main, всего - от импорта utils.startup до готовности')
+    print_table(['запуск', 'import', 'всего'] + phase_names, [row(title, result, phase_names) for title, result in runs])
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump([{'run': title, **result} for title, result in runs], file, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
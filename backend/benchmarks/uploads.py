@@ -0,0 +1,184 @@
+"""Раздача /uploads: StaticFiles против UploadsApp.
+
+Генерирует набор картинок во временной папке, поднимает uvicorn
+с каждым вариантом раздачи и гоняет по нему клиентов по HTTP:
+
+- "первый визит" - запросы без кэша браузера;
+- "повторный визит" - клиент ведет себя как браузер: свежие ответы
+  (immutable / max-age) берет из кэша, остальные перепроверяет по ETag.
+
+Каждый клиент смотрит одинаковое число картинок; считаются время,
+запросы в секунду, сколько запросов дошло до сервера и сколько байт
+тела передано. База не нужна.
+
+    python -m benchmarks.uploads
+"""
+import os
+import sys
+import time
+import random
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from benchmarks.common import BACKEND_DIR, print_table
+
+
+
+
+def generate_files(directory: str, count: int) -> list[str]:
+    from PIL import Image
+
+    # Как после загрузки: оригинал по хэшу и его уменьшенные копии
+    names = []
+    for number in range(count):
+        stem = f'{number:032x}'
+        color = (number * 37 % 256, number * 91 % 256, number * 13 % 256)
+        image = Image.effect_noise((1600, 1000), 64).convert('RGB')
+        image.paste(color, (0, 0, 400, 400))
+        for suffix, side in (('-thumb', 320), ('-card', 800), ('', 1600)):
+            copy = image.copy()
+            copy.thumbnail((side, side))
+            name = f'{stem}{suffix}.webp'
+            copy.save(os.path.join(directory, name), format='WEBP', quality=80)
+            names.append(name)
+    return names
+
+
+def serve(mode: str, directory: str, port: int):
+    os.environ['UPLOADS_DIR'] = directory
+    sys.path.insert(0, str(BACKEND_DIR))
+
+    import uvicorn
+    from starlette.applications import Starlette
+    from starlette.routing import Mount
+    from starlette.staticfiles import StaticFiles
+
+    if mode == 'static':
+        app = Starlette(routes=[Mount('/uploads', StaticFiles(directory=directory))])
+    else:
+        from utils.uploads import uploads_app
+
+        uploads_app.index.scan()
+        app = Starlette(routes=[Mount('/uploads', uploads_app)])
+    uvicorn.run(app, host='127.0.0.1', port=port, log_level='warning', access_log=False)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def wait_ready(client, url: str):
+    for _ in range(100):
+        try:
+            await client.get(url)
+            return
+        except Exception:
+            await asyncio.sleep(0.1)
+    raise SystemExit(f'Сервер {url} не поднялся')
+
+
+class BrowserCache:
+    def __init__(self):
+        self.entries: dict[str, tuple[str | None, bool]] = {}
+
+    def remember(self, url: str, headers):
+        cache_control = headers.get('cache-control', '')
+        fresh = 'immutable' in cache_control or ('max-age=' in cache_control and 'max-age=0' not in cache_control)
+        self.entries[url] = (headers.get('etag'), fresh)
+
+
+async def run(base_url: str, names: list[str], clients: int, views: int, repeat: bool) -> list:
+    import httpx
+
+    stats = {'requests': 0, 'not_modified': 0, 'bytes': 0}
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits) as client:
+        await wait_ready(client, f'/uploads/{names[0]}')
+
+        caches = [BrowserCache() for _ in range(clients)]
+        if repeat:
+            # Повторный визит: кэш уже прогрет прошлой загрузкой страницы
+            for cache in caches:
+                for name in names:
+                    response = await client.get(f'/uploads/{name}')
+                    cache.remember(name, response.headers)
+
+        async def visitor(number: int):
+            rng = random.Random(number)
+            cache = caches[number]
+            for _ in range(views):
+                name = rng.choice(names)
+                headers = {}
+                if repeat:
+                    etag, fresh = cache.entries.get(name, (None, False))
+                    if fresh:
+                        continue
+                    if etag:
+                        headers['if-none-match'] = etag
+                response = await client.get(f'/uploads/{name}', headers=headers)
+                stats['requests'] += 1
+                stats['bytes'] += len(response.content)
+                if response.status_code == 304:
+                    stats['not_modified'] += 1
+                if repeat:
+                    cache.remember(name, response.headers)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(visitor(number) for number in range(clients)))
+        elapsed = time.perf_counter() - started
+
+    return [
+        f'{elapsed:.2f}',
+        f'{stats["requests"] / elapsed:.0f}',
+        stats['requests'],
+        stats['not_modified'],
+        f'{stats["bytes"] / 1024 / 1024:.1f}',
+    ]
+
+
+async def compare(args):
+    headers = ['раздача', 'визит', 'время с', 'запросов/с', 'запросов', '304', 'МБ тела']
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        names = generate_files(directory, args.files)
+        for mode, title in (('static', 'StaticFiles'), ('uploads', 'UploadsApp')):
+            port = free_port()
+            server = subprocess.Popen(
+                [sys.executable, '-m', 'benchmarks.uploads', '--serve', mode, '--dir', directory, '--port', str(port)],
+                cwd=BACKEND_DIR,
+            )
+            try:
+                for repeat, visit in ((False, 'первый'), (True, 'повторный')):
+                    row = await run(f'http://127.0.0.1:{port}', names, args.clients, args.views, repeat)
+                    rows.append([title, visit, *row])
+            finally:
+                server.terminate()
+                server.wait()
+
+    print_table(headers, rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=20, help='сколько оригиналов сгенерировать')
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--views', type=int, default=300, help='просмотров картинок на клиента')
+    parser.add_argument('--serve', choices=['static', 'uploads'], help=argparse.SUPPRESS)
+    parser.add_argument('--dir', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # Сервер запускается этим же модулем в отдельном процессе
+    if args.serve:
+        serve(args.serve, args.dir, args.port)
+    else:
+        asyncio.run(compare(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+import os
+from pathlib import Path
+from typing import Annotated, Literal
+from pydantic import Field, field_validator, model_validator
+from pydantic_settings import BaseSettings, NoDecode, SettingsConfigDict
+
+
+
+
+BACKEND_DIR = Path(__file__).resolve().parent
+
+
+class Settings(BaseSettings):
+    """Настройки из переменных окружения и .env, читаются один раз при импорте.
+
+    Имена полей совпадают с переменными окружения без учета регистра:
+    db_pool_size <- DB_POOL_SIZE. Списки задаются через запятую.
+    """
+
+    # .env лежит в корне репозитория, backend/.env переопределяет его
+    model_config = SettingsConfigDict(
+        env_file=(BACKEND_DIR.parent / '.env', BACKEND_DIR / '.env'),
+        extra='ignore',
+    )
+
+    # База и пул соединений
+    database_url: str | None = None
+    # Сверху на процесс открывается db_pool_size + db_max_overflow соединений,
+    # на все воркеры - столько же, умноженное на их число
+    db_pool_size: int = 10
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    # Кэш подготовленных выражений asyncpg на соединение, 0 - выключен (нужно за pgbouncer)
+    db_statement_cache_size: int = 500
+    # Одно соединение на HTTP-запрос для всех репозиториев
+    db_request_scope: bool = True
+
+    # Реплики для чтения; пусто - все запросы идут в database_url
+    database_replica_urls: Annotated[list[str], NoDecode] = []
+    db_replica_balance: Literal['round_robin', 'least_connections'] = 'round_robin'
+    # Реплика с отставанием больше стольких секунд выводится из ротации, 0 - отставание не проверяется
+    db_replica_max_lag: float = 5
+    db_replica_check_interval: float = 1
+
+    # Токены
+    secret_key: str | None = None
+    algorithm: str = 'HS256'
+    access_token_expire_minutes: int = 30
+    refresh_token_expire_days: int = 7
+    # Сессий (устройств) на пользователя; при входе сверх лимита закрывается самая старая
+    refresh_token_max_sessions: int = 10
+    # Сколько секунд замененный токен помнится для обнаружения повторного использования
+    refresh_token_reuse_window: int = 86400
+    # Истекшие refresh-токены удаляются раз в столько секунд пачками по refresh_token_sweep_batch
+    refresh_token_sweep_interval: float = 300
+    refresh_token_sweep_batch: int = 5000
+    blacklist_cleanup_interval: int = 60
+    user_cache_ttl: int = 60
+    user_cache_size: int = 10000
+
+    # bcrypt: пул thread или process; очередь по умолчанию - 8 задач на воркер
+    password_hash_pool: Literal['thread', 'process'] = 'thread'
+    password_hash_workers: int = Field(default_factory=lambda: os.cpu_count() or 1)
+    password_hash_max_queue: int | None = None
+
+    # postgres или local; по умолчанию postgres, если база Postgres
+    pubsub_backend: Literal['postgres', 'local'] | None = None
+    # Проверка соединения LISTEN и предел паузы между попытками переподключения, секунды
+    pubsub_ping_interval: float = 15
+    pubsub_max_reconnect_delay: float = 30
+
+    # Ограничение частоты и параллельности дорогих ручек (utils/admission.py).
+    # Ведра токенов по клиенту: local - в памяти воркера, postgres - общие в базе;
+    # по умолчанию postgres, если база Postgres
+    rate_limit_enabled: bool = True
+    rate_limit_backend: Literal['postgres', 'local'] | None = None
+    # Вход и регистрация (bcrypt), по IP
+    rate_limit_auth_per_minute: float = Field(default=20, gt=0)
+    rate_limit_auth_burst: int = Field(default=10, ge=1)
+    max_in_flight_auth: int = 64
+    # Загрузка фото (диск и обработка изображений)
+    rate_limit_upload_per_minute: float = Field(default=30, gt=0)
+    rate_limit_upload_burst: int = Field(default=10, ge=1)
+    max_in_flight_upload: int = 16
+    # Пожертвования (запись в горячую строку фонда)
+    rate_limit_donate_per_minute: float = Field(default=120, gt=0)
+    rate_limit_donate_burst: int = Field(default=30, ge=1)
+    max_in_flight_donate: int = 256
+    # Создание фондов и развертывание кампаний (газ за счет ORGANIZATION_PRIVATE_KEY)
+    rate_limit_deploy_per_minute: float = Field(default=10, gt=0)
+    rate_limit_deploy_burst: int = Field(default=5, ge=1)
+    max_in_flight_deploy: int = 8
+    # Сколько ведер держит local; самые давние вытесняются
+    rate_limit_max_keys: int = 100000
+
+    # Фонды
+    fund_stats_shards: int = 8
+    # Окно склейки пожертвований в миллисекундах, 0 - батчинг выключен
+    donation_batch_window_ms: int = 0
+    # Шарды счетчиков пожертвований фонда, 0 - пожертвование сразу обновляет строку фонда.
+    # Шарды переносятся в funds раз в donation_rollup_interval секунд
+    donation_counter_shards: int = 0
+    donation_rollup_interval: float = 1
+    response_cache_ttl: float = 30
+    response_cache_size: int = 1000
+    # Массовый импорт: строк в одном INSERT и одной транзакции, сколько ошибок вернуть в отчете
+    bulk_import_chunk: int = 1000
+    bulk_import_max_errors: int = 1000
+    # Push-обновления сборов (SSE, WebSocket): окно склейки публикаций, пинг,
+    # сколько ждать медленного клиента до отключения, подписок на воркер
+    fund_events_interval: float = 0.25
+    fund_events_heartbeat: float = 15
+    fund_events_send_timeout: float = 10
+    fund_events_max_subscribers: int = 20000
+
+    # postgres - tsvector + pg_trgm, memory - индекс в процессе; по умолчанию по диалекту базы
+    search_backend: Literal['postgres', 'memory'] | None = None
+    # Сколько совпадений максимум ранжировать. Для частых слов совпадают сотни
+    # тысяч строк, и ts_rank по всем стоит сотни миллисекунд; с лимитом ранжируется
+    # первая порция совпадений, зато время запроса не зависит от размера базы
+    search_rank_candidates: int = 2000
+
+    # Загрузки
+    uploads_dir: str = 'uploads'
+    max_upload_bytes: int = 10 * 1024 * 1024
+    uploads_memory_bytes: int = 64 * 1024 * 1024
+    uploads_memory_max_file: int = 512 * 1024
+
+    # Запуск
+    # Тестовые фонды при старте, только если их еще нет
+    seed_test_data: bool = False
+    # Прогрев пула соединений, пула bcrypt и кэша ответов до приема трафика
+    startup_warmup: bool = True
+    startup_warmup_paths: Annotated[list[str], NoDecode] = ['/funds/', '/funds/stats', '/categories/']
+    # Куда записать длительность фаз запуска в JSON, например для CI
+    startup_timings_file: str | None = None
+    # Готовая схема OpenAPI (python -m utils.openapi), иначе строится при первом запросе
+    openapi_schema_file: str | None = None
+
+    # Метрики для /metrics; metrics_dir нужен при нескольких воркерах, пусто - один процесс
+    metrics_enabled: bool = True
+    metrics_dir: str | None = None
+    metrics_flush_interval: float = 1
+
+    # Значение заголовка X-Admin-Token для /system/*; пусто - берется PROFILING_TOKEN,
+    # если нет и его - эти ручки отвечают 404
+    admin_token: str | None = None
+
+    # Профилирование запросов, см. utils/profiling.py
+    profiling_enabled: bool = False
+    profiling_sample_rate: float = 0
+    # Значение заголовка X-Profile; пусто - профиль по заголовку не снимается
+    profiling_token: str | None = None
+    profiling_slow_request_ms: float = 500
+    profiling_interval: float = 0.001
+    profiling_buffer_size: int = 100
+    # Одинаковое выражение столько раз за запрос считается N+1
+    profiling_n_plus_one: int = 5
+    # SQL дольше стольких миллисекунд пишется в журнал медленных запросов, 0 - выключено
+    slow_query_ms: float = 0
+
+    # Блокчейн
+    rpc_url: str = 'http://localhost:8545'
+    platform_registry_address: str = ''
+    indexer_enabled: bool = False
+    indexer_start_block: int = 0
+    indexer_batch_blocks: int = 2000
+    indexer_max_batch_blocks: int = 10000
+    indexer_ranges_per_request: int = 8
+    indexer_addresses_per_filter: int = 500
+    indexer_reorg_depth: int = 12
+    indexer_poll_interval: float = 5
+    # Развертывание кампаний новых фондов через PlatformRegistry.createCampaign,
+    # подписывает ключ организации (должна быть верифицирована в реестре)
+    organization_private_key: str | None = None
+    deployer_enabled: bool = False
+    deployer_poll_interval: float = 2
+    # Сколько транзакций отправить одним batch и сколько держать неподтвержденными
+    deployer_batch_size: int = 20
+    deployer_max_in_flight: int = 64
+    # Сколько секунд кэшируются цена газа и оценка газа createCampaign
+    deployer_gas_price_ttl: float = 15
+    deployer_gas_estimate_ttl: float = 600
+    deployer_gas_multiplier: float = 1.2
+    # Транзакция, которой узел не знает дольше стольких секунд, отправляется заново
+    deployer_resubmit_after: float = 120
+    # Чтение состояния кампаний: голова цепочки переиспользуется столько секунд,
+    # результаты кэшируются по адресу и блоку
+    onchain_block_ttl: float = 1
+    onchain_cache_size: int = 10000
+    # Сколько eth_call в одном JSON-RPC batch и сколько последних запросов на расходование читать
+    onchain_batch_calls: int = 500
+    onchain_max_requests: int = 50
+
+    @field_validator('database_replica_urls', 'startup_warmup_paths', mode='before')
+    @classmethod
+    def split_comma_list(cls, value):
+        if isinstance(value, str):
+            return [item.strip() for item in value.split(',') if item.strip()]
+        return value
+
+    @model_validator(mode='after')
+    def default_hash_queue(self):
+        if self.password_hash_max_queue is None:
+            self.password_hash_max_queue = self.password_hash_workers * 8
+        return self
+
+
+settings = Settings()
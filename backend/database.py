@@ -1,18 +1,312 @@
-import os
-from dotenv import load_dotenv
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
-from sqlalchemy.orm import DeclarativeBase
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, AsyncSession, create_async_engine, async_sessionmaker
+from sqlalchemy.orm import DeclarativeBase, Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from config import settings
 
 
 
 
-load_dotenv()
+class PoolMetrics:
+    """Счетчики выдачи соединений из пула и ожидания свободного соединения."""
 
-engine = create_async_engine(
-    os.getenv('DATABASE_URL')
-)
+    def __init__(self):
+        self.checkouts = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.waits = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.timeouts = 0
+
+    def snapshot(self) -> dict:
+        return {
+            'checkouts': self.checkouts,
+            'waiting': self.waiting,
+            'max_waiting': self.max_waiting,
+            'waits': self.waits,
+            'wait_total_ms': round(self.wait_total * 1000, 3),
+            'wait_avg_ms': round(self.wait_total / self.waits * 1000, 3) if self.waits else 0.0,
+            'wait_max_ms': round(self.wait_max * 1000, 3),
+            'timeouts': self.timeouts,
+        }
+
+
+class MeteredPool(AsyncAdaptedQueuePool):
+    """Очередь соединений, которая считает, сколько корутин ждут свободное соединение и сколько."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def recreate(self):
+        # engine.dispose() пересоздает пул, счетчики переносим
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+    def _do_get(self):
+        metrics = self.metrics
+        metrics.checkouts += 1
+        # Ждать приходится, только когда свободных нет и overflow исчерпан
+        exhausted = self.checkedin() == 0 and 0 <= self._max_overflow <= self.overflow()
+        if not exhausted:
+            return super()._do_get()
+
+        metrics.waiting += 1
+        metrics.max_waiting = max(metrics.max_waiting, metrics.waiting)
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeout:
+            metrics.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            metrics.waiting -= 1
+            metrics.waits += 1
+            metrics.wait_total += waited
+            metrics.wait_max = max(metrics.wait_max, waited)
+
+
+def engine_options(url: str) -> dict:
+    database_url = make_url(url)
+    if database_url.get_backend_name() == 'sqlite':
+        # SQLite: один файл, пул по умолчанию
+        return {}
+
+    options = {
+        'poolclass': MeteredPool,
+        'pool_size': settings.db_pool_size,
+        'max_overflow': settings.db_max_overflow,
+        'pool_timeout': settings.db_pool_timeout,
+        'pool_recycle': settings.db_pool_recycle,
+        'pool_pre_ping': settings.db_pool_pre_ping,
+    }
+    if database_url.get_driver_name() == 'asyncpg':
+        options['connect_args'] = {'prepared_statement_cache_size': settings.db_statement_cache_size}
+        if settings.db_statement_cache_size == 0:
+            options['connect_args']['statement_cache_size'] = 0
+    return options
+
+
+engine = create_async_engine(settings.database_url, **engine_options(settings.database_url))
+session_factory = async_sessionmaker(engine, expire_on_commit=False)
+
+
+class Replica:
+    """Реплика для чтения: свой движок, счетчики и последнее измеренное отставание."""
+
+    def __init__(self, name: str, url: str):
+        self.name = name
+        self.engine = create_async_engine(url, **engine_options(url))
+        self.session_factory = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.in_flight = 0
+        self.reads = 0
+        # Отставание в секундах; None - еще не измерено или реплика недоступна
+        self.lag: float | None = None
+        self.error: str | None = None
+
+    def available(self, max_lag: float) -> bool:
+        if self.error is not None:
+            return False
+        return max_lag <= 0 or (self.lag is not None and self.lag <= max_lag)
+
+    def snapshot(self, max_lag: float) -> dict:
+        return {
+            'name': self.name,
+            'available': self.available(max_lag),
+            'lag': self.lag,
+            'error': self.error,
+            'in_flight': self.in_flight,
+            'reads': self.reads,
+            'pool': pool_snapshot(self.engine),
+        }
+
+
+class ReplicaSet:
+    """Выбор реплики для чтения.
+
+    Реплика, которая отстала больше max_lag или не отвечает, пропускается;
+    если подходящих нет, чтение уходит на основную базу.
+    """
+
+    def __init__(self, urls: list[str], balance: str, max_lag: float):
+        if balance not in ('round_robin', 'least_connections'):
+            raise ValueError(f'Неизвестная балансировка реплик: {balance}')
+        self.replicas = [Replica(f'replica{number}', url) for number, url in enumerate(urls, 1)]
+        self.balance = balance
+        self.max_lag = max_lag
+        self.primary_reads = 0
+        self.sticky_reads = 0
+        self.fallbacks = 0
+        self._next = 0
+
+    def __bool__(self) -> bool:
+        return bool(self.replicas)
+
+    def choose(self) -> Replica | None:
+        candidates = [replica for replica in self.replicas if replica.available(self.max_lag)]
+        if not candidates:
+            self.fallbacks += 1
+            return None
+        if self.balance == 'least_connections':
+            return min(candidates, key=lambda replica: replica.in_flight)
+        self._next += 1
+        return candidates[self._next % len(candidates)]
+
+    def snapshot(self) -> dict:
+        return {
+            'balance': self.balance,
+            'max_lag': self.max_lag,
+            'primary_reads': self.primary_reads,
+            'sticky_reads': self.sticky_reads,
+            'fallbacks': self.fallbacks,
+            'replicas': [replica.snapshot(self.max_lag) for replica in self.replicas],
+        }
+
+    async def dispose(self):
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+
+replicas = ReplicaSet(settings.database_replica_urls, settings.db_replica_balance, settings.db_replica_max_lag)
+
+
+class RequestScope:
+    """Соединение, общее для всех репозиториев в пределах одного запроса.
+
+    Соединение берется из пула при первом new_session() и возвращается
+    в конце запроса. Сессии по-прежнему короткие и коммитятся сами,
+    общее у них только соединение. Задачи, запущенные из запроса
+    (батчи пожертвований, стриминг ответа), работают со своими сессиями.
+    """
+
+    def __init__(self):
+        self.task = asyncio.current_task()
+        self.connection: AsyncConnection | None = None
+        self.active = False
+        # После записи чтения этого запроса идут только в основную базу
+        self.wrote = False
+
+    def owns_current_task(self) -> bool:
+        return self.task is asyncio.current_task()
+
+    async def release(self):
+        if self.connection is not None:
+            connection, self.connection = self.connection, None
+            await connection.close()
+
+
+_request_scope: ContextVar[RequestScope | None] = ContextVar('request_scope', default=None)
+
+
+@asynccontextmanager
+async def request_scope():
+    scope = RequestScope()
+    token = _request_scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _request_scope.reset(token)
+        await scope.release()
+
+
+@asynccontextmanager
+async def new_session():
+    scope = _request_scope.get()
+    # Вложенные сессии и чужие задачи получают отдельное соединение, как раньше
+    if scope is None or scope.active or not scope.owns_current_task():
+        async with session_factory() as session:
+            yield session
+        return
+
+    if scope.connection is None:
+        scope.connection = await engine.connect()
+    scope.active = True
+    try:
+        async with AsyncSession(bind=scope.connection, expire_on_commit=False) as session:
+            yield session
+    finally:
+        scope.active = False
+
+
+@asynccontextmanager
+async def read_session():
+    """Сессия только для чтения: на реплику, если она есть и в запросе еще не было записи."""
+    scope = _request_scope.get()
+    replica = None
+    if replicas:
+        if scope is not None and scope.wrote:
+            replicas.sticky_reads += 1
+        else:
+            replica = replicas.choose()
+    if replica is None:
+        replicas.primary_reads += 1
+        async with new_session() as session:
+            yield session
+        return
+
+    replica.in_flight += 1
+    replica.reads += 1
+    try:
+        async with replica.session_factory() as session:
+            yield session
+    finally:
+        replica.in_flight -= 1
+
+
+@event.listens_for(Session, 'after_commit')
+def stick_to_primary(session):
+    scope = _request_scope.get()
+    if scope is not None:
+        scope.wrote = True
+
+
+async def release_request_connection():
+    # Отдает соединение запроса в пул раньше, например перед долгим bcrypt;
+    # следующий new_session() возьмет новое
+    scope = _request_scope.get()
+    if scope is not None and scope.owns_current_task() and not scope.active:
+        await scope.release()
+
+
+class RequestScopeMiddleware:
+    """ASGI-middleware: открывает RequestScope на каждый HTTP-запрос."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not settings.db_request_scope:
+            await self.app(scope, receive, send)
+            return
+        async with request_scope():
+            await self.app(scope, receive, send)
+
+
+def pool_snapshot(engine: AsyncEngine = engine) -> dict:
+    pool = engine.pool
+    snapshot = {'pool': type(pool).__name__}
+    if isinstance(pool, MeteredPool):
+        snapshot.update(pool.metrics.snapshot())
+    if isinstance(pool, QueuePool):
+        snapshot.update({
+            'size': pool.size(),
+            'max_overflow': pool._max_overflow,
+            'checked_out': pool.checkedout(),
+            'checked_in': pool.checkedin(),
+            'overflow': max(pool.overflow(), 0),
+            'timeout': pool.timeout(),
+        })
+    return snapshot
 
-new_session = async_sessionmaker(engine, expire_on_commit=False)
 
 class Model(DeclarativeBase):
     pass
@@ -24,4 +318,13 @@ async def create_tables():
 
 async def delete_tables():
     async with engine.begin() as conn:
-        await conn.run_sync(Model.metadata.drop_all)
\ No newline at end of file
+        await conn.run_sync(Model.metadata.drop_all)
+
+
+def dialect_insert(model):
+    # INSERT с поддержкой ON CONFLICT для текущего диалекта (Postgres или SQLite)
+    if engine.dialect.name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        from sqlalchemy.dialects.postgresql import insert
+    return insert(model)
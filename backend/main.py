@@ -1,67 +1,114 @@
-import uvicorn
 from fastapi import FastAPI
-from fastapi.openapi.utils import get_openapi
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from utils.create_test_data import create_test_data
 from contextlib import asynccontextmanager
-from database import create_tables, delete_tables
+from database import RequestScopeMiddleware
+from utils.admission import admission, AdmissionMiddleware
 from router.auth import router as auth_router
+from router.categories import router as categories_router
+from router.donations import router as donations_router
 from router.funds import router as funds_router
+from router.metrics import router as metrics_router
+from router.system import router as system_router
+from utils.donations import donation_engine
+from utils.deployer import fund_deployer
+from utils.onchain import onchain_reader
+from utils.fund_events import fund_events
+from utils.media import media_worker
+from utils.metrics import registry as metrics_registry, MetricsMiddleware
+from utils.indexer import chain_indexer
+from utils.passwords import password_hasher
+from utils.profiling import ProfilingMiddleware
+from utils.pubsub import pubsub
+from utils.replicas import replica_monitor
+from utils.revocation import token_revocation, refresh_token_sweeper
+from utils.search import fund_search
+from utils.migrations import leader_lock, migrate
+from utils.openapi import install_openapi
+from utils.startup import startup_timer, warm_up
+from utils.uploads import uploads_app
+from config import settings
 
 
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    await delete_tables()
-    print('База очищена')
-    await create_tables()
-    print('База готова к работе')
-    await create_test_data()
-    print('Тестовые данные загружены')
+    # Схему меняет только один воркер, остальные ждут его на блокировке
+    async with leader_lock() as waited:
+        startup_timer.record('leader_lock', waited)
+        async with startup_timer.phase('migrations'):
+            applied = await migrate()
+        if applied:
+            print(f'Применены миграции: {applied}')
+        if settings.seed_test_data:
+            from utils.create_test_data import create_test_data
+
+            async with startup_timer.phase('seed'):
+                if await create_test_data():
+                    print('Тестовые данные загружены')
+    async with startup_timer.phase('metrics'):
+        await metrics_registry.start()
+    async with startup_timer.phase('pubsub'):
+        await pubsub.start()
+    async with startup_timer.phase('fund_events'):
+        await fund_events.start()
+    async with startup_timer.phase('replicas'):
+        await replica_monitor.start()
+    async with startup_timer.phase('donations'):
+        await donation_engine.start()
+    async with startup_timer.phase('token_revocation'):
+        await token_revocation.start()
+    async with startup_timer.phase('refresh_token_sweeper'):
+        await refresh_token_sweeper.start()
+    async with startup_timer.phase('admission'):
+        await admission.start()
+    async with startup_timer.phase('media_worker'):
+        await media_worker.start()
+    async with startup_timer.phase('uploads'):
+        await uploads_app.start()
+    async with startup_timer.phase('search'):
+        await fund_search.start()
+    if settings.indexer_enabled:
+        async with startup_timer.phase('indexer'):
+            await chain_indexer.start()
+    if settings.deployer_enabled:
+        async with startup_timer.phase('deployer'):
+            await fund_deployer.start()
+    if settings.startup_warmup:
+        async with startup_timer.phase('warmup'):
+            await warm_up(app)
+    startup_timer.finish()
+    print(f'База готова к работе, запуск за {startup_timer.total * 1000:.0f} мс')
     yield
+    await chain_indexer.stop()
+    await fund_deployer.stop()
+    await onchain_reader.stop()
+    await token_revocation.stop()
+    await refresh_token_sweeper.stop()
+    await admission.stop()
+    await media_worker.stop()
+    await donation_engine.drain()
+    await fund_events.stop()
+    await pubsub.stop()
+    await replica_monitor.stop()
+    password_hasher.shutdown()
+    await metrics_registry.stop()
     print('Выключение')
 
 
-def custom_openapi():
-    if app.openapi_schema:
-        return app.openapi_schema
-    openapi_schema = get_openapi(
-        title="CharityChain",
-        version="beta",
-        description="Документация к API CharityChain",
-        routes=app.routes,
-    )
-    openapi_schema["components"]["securitySchemes"] = {
-        "Bearer": {
-            "type": "http",
-            "scheme": "bearer",
-            "bearerFormat": "JWT"
-        }
-    }
-    
-    secured_paths = {
-        #Авторизация
-        "/auth/me": {"method": "get", "security": [{"Bearer": []}]},
-        "/auth/logout": {"method": "post", "security": [{"Bearer": []}]},
-    }
-    
-    for path, config in secured_paths.items():
-        if path in openapi_schema["paths"]:
-            openapi_schema["paths"][path][config["method"]]["security"] = config["security"]
-    
-    app.openapi_schema = openapi_schema
-    return app.openapi_schema
-
-
 app = FastAPI(lifespan=lifespan)
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
-app.openapi = custom_openapi
+app.mount("/uploads", uploads_app, name="uploads")
+install_openapi(app)
 app.include_router(auth_router)
 app.include_router(funds_router)
+app.include_router(categories_router)
+app.include_router(donations_router)
+app.include_router(system_router)
+app.include_router(metrics_router)
 
 
+# Внутри CORS, чтобы браузер мог прочитать 429 и 503
+app.add_middleware(AdmissionMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[
@@ -72,11 +119,16 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(RequestScopeMiddleware)
+app.add_middleware(ProfilingMiddleware)
+app.add_middleware(MetricsMiddleware)
 
 
 
 #Раскоментить, когда будешь писать докер.
 if __name__ == "__main__":
+    import uvicorn
+
     uvicorn.run(
         "main:app",
         reload=True,
@@ -1,5 +1,5 @@
 from datetime import datetime, timezone
-from sqlalchemy import ForeignKey, DateTime
+from sqlalchemy import ForeignKey, DateTime, String, Index
 from sqlalchemy.orm import Mapped, mapped_column
 from database import Model
 
@@ -17,19 +17,35 @@ class UserOrm(Model):
 
 
 class RefreshTokenOrm(Model):
+    """Refresh-токен одной сессии (устройства).
+
+    Храним только sha256 токена. Вход открывает семейство (family_id),
+    каждый /auth/refresh заменяет токен новым в том же семействе, а старый
+    помечается rotated_at и держится REFRESH_TOKEN_REUSE_WINDOW: его
+    повторное предъявление значит кражу, и семейство удаляется целиком.
+    """
     __tablename__ = 'refresh_tokens'
     
     id: Mapped[int] = mapped_column(primary_key=True)
     user_id: Mapped[int] = mapped_column(ForeignKey('users.id'))
-    token: Mapped[str] = mapped_column(unique=True)
+    token_hash: Mapped[str] = mapped_column(String(64), unique=True)
+    family_id: Mapped[str] = mapped_column(String(16))
     expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+    rotated_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True))
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
 
+    __table_args__ = (
+        # Сессии пользователя и одно семейство: выход, лимит сессий, отзыв при краже
+        Index('ix_refresh_tokens_user_id_family_id', 'user_id', 'family_id'),
+        # Очистка истекших пачками
+        Index('ix_refresh_tokens_expires_at', 'expires_at'),
+    )
+
 
 class BlacklistedTokenOrm(Model):
     __tablename__ = 'blacklisted_tokens'
     
     id: Mapped[int] = mapped_column(primary_key=True)
-    token: Mapped[str] = mapped_column(unique=True)
-    expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+    token_hash: Mapped[str] = mapped_column(String(64), unique=True) # sha256 от токена, сам токен не храним
+    expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), index=True)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
\ No newline at end of file
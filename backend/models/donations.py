@@ -0,0 +1,34 @@
+from datetime import datetime, timezone
+from sqlalchemy import ForeignKey, DateTime, String, BigInteger, Index
+from sqlalchemy.orm import Mapped, mapped_column
+from database import Model
+
+
+
+
+class DonationOrm(Model):
+    """Журнал пожертвований, строки только добавляются.
+
+    fund_id без внешнего ключа: история остается и после удаления фонда.
+    Повтор запроса с тем же idempotency_key упирается в уникальный индекс
+    и не учитывается второй раз.
+    """
+    __tablename__ = 'donations'
+    
+    id: Mapped[int] = mapped_column(primary_key=True)
+    fund_id: Mapped[int]
+    user_id: Mapped[int | None] = mapped_column(ForeignKey('users.id'), nullable=True)
+    amount: Mapped[int] = mapped_column(BigInteger)
+    tx_hash: Mapped[str | None] = mapped_column(String(66), nullable=True)
+    idempotency_key: Mapped[str | None] = mapped_column(String(64), unique=True, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        default=lambda: datetime.now(timezone.utc)
+    )
+
+
+# Keyset-пагинация истории по id; INCLUDE (только Postgres) делает индексы
+# покрывающими: страница истории читается без обращения к таблице
+HISTORY_COLUMNS = ['amount', 'tx_hash', 'created_at']
+Index('ix_donations_user_id_id', DonationOrm.user_id, DonationOrm.id, postgresql_include=['fund_id', *HISTORY_COLUMNS])
+Index('ix_donations_fund_id_id', DonationOrm.fund_id, DonationOrm.id, postgresql_include=['user_id', *HISTORY_COLUMNS])
@@ -0,0 +1,92 @@
+from datetime import datetime, timezone
+from sqlalchemy import BigInteger, DateTime, Numeric, String, Index, UniqueConstraint
+from sqlalchemy.orm import Mapped, mapped_column, declared_attr
+from database import Model
+
+
+
+
+# uint256 целиком не влезает в BIGINT
+Uint256 = Numeric(78, 0)
+
+
+class ChainEventMixin:
+    """Общие поля событий из логов блокчейна.
+
+    Пара (tx_hash, log_index) однозначно задает лог, по ней идет upsert,
+    а block_number нужен для отката при реорганизации цепочки.
+    """
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    contract_address: Mapped[str] = mapped_column(String(42))
+    block_number: Mapped[int] = mapped_column(BigInteger, index=True)
+    block_hash: Mapped[str] = mapped_column(String(66))
+    tx_hash: Mapped[str] = mapped_column(String(66))
+    log_index: Mapped[int]
+
+    @declared_attr.directive
+    def __table_args__(cls):
+        return (
+            UniqueConstraint('tx_hash', 'log_index', name=f'uq_{cls.__tablename__}_log'),
+            Index(f'ix_{cls.__tablename__}_contract_block', 'contract_address', 'block_number'),
+        )
+
+
+class ChainDonationOrm(ChainEventMixin, Model):
+    __tablename__ = 'chain_donations'
+
+    donor: Mapped[str] = mapped_column(String(42), index=True)
+    amount: Mapped[int] = mapped_column(Uint256)
+    fee: Mapped[int] = mapped_column(Uint256)
+
+
+class ChainRefundOrm(ChainEventMixin, Model):
+    __tablename__ = 'chain_refunds'
+
+    donor: Mapped[str] = mapped_column(String(42), index=True)
+    amount: Mapped[int] = mapped_column(Uint256)
+
+
+class ChainSpendingRequestOrm(ChainEventMixin, Model):
+    __tablename__ = 'chain_spending_requests'
+
+    request_id: Mapped[int] = mapped_column(Uint256)
+    description: Mapped[str]
+    amount: Mapped[int] = mapped_column(Uint256)
+    recipient: Mapped[str] = mapped_column(String(42))
+
+
+class ChainRequestVoteOrm(ChainEventMixin, Model):
+    __tablename__ = 'chain_request_votes'
+
+    request_id: Mapped[int] = mapped_column(Uint256)
+    voter: Mapped[str] = mapped_column(String(42))
+    vote_weight: Mapped[int] = mapped_column(Uint256)
+
+
+class ChainRequestExecutionOrm(ChainEventMixin, Model):
+    __tablename__ = 'chain_request_executions'
+
+    request_id: Mapped[int] = mapped_column(Uint256)
+    amount: Mapped[int] = mapped_column(Uint256)
+
+
+class ChainCampaignOrm(ChainEventMixin, Model):
+    __tablename__ = 'chain_campaigns'
+
+    campaign_id: Mapped[int] = mapped_column(Uint256)
+    campaign_address: Mapped[str] = mapped_column(String(42), index=True)
+    creator: Mapped[str] = mapped_column(String(42))
+
+
+class IndexerCheckpointOrm(Model):
+    __tablename__ = 'indexer_checkpoints'
+
+    contract_address: Mapped[str] = mapped_column(String(42), primary_key=True)
+    block_number: Mapped[int] = mapped_column(BigInteger)  # последний полностью обработанный блок
+    block_hash: Mapped[str] = mapped_column(String(66))
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        default=lambda: datetime.now(timezone.utc),
+        onupdate=lambda: datetime.now(timezone.utc),
+    )
@@ -1,6 +1,7 @@
 from datetime import datetime, timezone
-from sqlalchemy import ForeignKey, DateTime, String, Integer, func, text
+from sqlalchemy import ForeignKey, DateTime, String, Integer, BigInteger, Float, JSON, Index, DDL, cast, event, func, text
 from sqlalchemy.orm import Mapped, mapped_column, column_property
+from sqlalchemy.ext.hybrid import hybrid_property
 from database import Model
 
 
@@ -16,19 +17,111 @@ class FundOrm(Model):
     target: Mapped[int] = mapped_column(nullable=False)
     collected: Mapped[int] = mapped_column(default=0)
     donate_count: Mapped[int] = mapped_column(default=0)
+    # Номер правки фонда (PATCH): вместе с donate_count упорядочивает состояния в utils/fund_events.py
+    revision: Mapped[int] = mapped_column(BigInteger, default=0, server_default=text('0'))
     photo_url: Mapped[str] = mapped_column(nullable=True, default=None)
+    photo_variants: Mapped[dict | None] = mapped_column(JSON, nullable=True, default=None) # уменьшенные копии фото, заполняет media_worker
     target_date: Mapped[datetime] = mapped_column(DateTime(timezone=True))
     location: Mapped[str] #Добавил локацию (просто строка без ограничений)
     team_info: Mapped[str] #Добавил инфу о команде (просто строка без ограничений)
     link: Mapped[str] #Добавил ссылку (просто строка без ограничений)
     contract_address: Mapped[str]
+    # Развертывание кампании очередью utils/deployer.py: pending -> submitted -> deployed
+    # или failed. NULL - адрес контракта задан вручную
+    deploy_status: Mapped[str | None] = mapped_column(String(16), nullable=True, default=None)
+    deploy_tx_hash: Mapped[str | None] = mapped_column(String(66), nullable=True, default=None)
+    deploy_nonce: Mapped[int | None] = mapped_column(nullable=True, default=None)
+    deploy_error: Mapped[str | None] = mapped_column(nullable=True, default=None)
+    # Подписанная транзакция: потерянную узлом отправляют заново ее же, с тем же nonce
+    deploy_raw_tx: Mapped[str | None] = mapped_column(nullable=True, default=None)
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), 
         default=lambda: datetime.now(timezone.utc)
     )
 
+    @hybrid_property
+    def progress(self) -> float:
+        return self.collected / self.target
+
+    @progress.inplace.expression
+    @classmethod
+    def _progress_expression(cls):
+        return cast(cls.collected, Float) / cast(cls.target, Float)
+
+
+# Составные индексы под keyset-пагинацию листинга фондов: (ключ сортировки, id),
+# и те же ключи с префиксом category_id для фильтра по категории
+Index('ix_funds_created_at_id', FundOrm.created_at, FundOrm.id)
+Index('ix_funds_target_date_id', FundOrm.target_date, FundOrm.id)
+Index('ix_funds_collected_id', FundOrm.collected, FundOrm.id)
+Index('ix_funds_progress_id', FundOrm.progress, FundOrm.id)
+Index('ix_funds_category_created_at_id', FundOrm.category_id, FundOrm.created_at, FundOrm.id)
+Index('ix_funds_category_target_date_id', FundOrm.category_id, FundOrm.target_date, FundOrm.id)
+Index('ix_funds_category_collected_id', FundOrm.category_id, FundOrm.collected, FundOrm.id)
+Index('ix_funds_category_progress_id', FundOrm.category_id, FundOrm.progress, FundOrm.id)
+Index('ix_funds_location_created_at_id', FundOrm.location, FundOrm.created_at, FundOrm.id)
+# Очередь развертывания: частичный индекс только по незавершенным, поэтому крошечный
+DEPLOY_QUEUE_STATUSES = ('pending', 'submitted')
+Index(
+    'ix_funds_deploy_queue',
+    FundOrm.deploy_status, FundOrm.id,
+    postgresql_where=FundOrm.deploy_status.in_(DEPLOY_QUEUE_STATUSES),
+    sqlite_where=FundOrm.deploy_status.in_(DEPLOY_QUEUE_STATUSES),
+)
+
+# Полнотекстовый поиск (только Postgres): вектор с русской морфологией хранится
+# в генерируемой колонке под GIN-индексом. В ORM колонка не отображается,
+# ее читает repositories/search.py
+SEARCH_VECTOR_SQL = (
+    "setweight(to_tsvector('russian', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('russian', coalesce(description, '')), 'B') || "
+    "setweight(to_tsvector('russian', coalesce(location, '') || ' ' || coalesce(team_info, '')), 'C')"
+)
+event.listen(
+    FundOrm.__table__, 'after_create',
+    DDL(f"ALTER TABLE funds ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ({SEARCH_VECTOR_SQL}) STORED")
+    .execute_if(dialect='postgresql'),
+)
+event.listen(
+    FundOrm.__table__, 'after_create',
+    DDL("CREATE INDEX ix_funds_search_vector ON funds USING gin (search_vector)").execute_if(dialect='postgresql'),
+)
+
+
 class CategoryOrm(Model):
     __tablename__ = 'categories'
     
     id: Mapped[int] = mapped_column(primary_key=True)
-    category: Mapped[str] = mapped_column(default="Другое")
\ No newline at end of file
+    category: Mapped[str] = mapped_column(default="Другое")
+
+
+class FundStatsOrm(Model):
+    """Агрегаты по фондам категории, поддерживаются инкрементально.
+
+    Строки категории разбиты на шарды: параллельные пожертвования
+    обновляют разные строки и не ждут блокировку одной общей.
+    """
+    __tablename__ = 'fund_stats'
+    
+    category_id: Mapped[int] = mapped_column(ForeignKey('categories.id'), primary_key=True)
+    shard: Mapped[int] = mapped_column(primary_key=True)
+    fund_count: Mapped[int] = mapped_column(BigInteger, default=0)
+    total_collected: Mapped[int] = mapped_column(BigInteger, default=0)
+    total_target: Mapped[int] = mapped_column(BigInteger, default=0)
+    donation_count: Mapped[int] = mapped_column(BigInteger, default=0)
+
+
+class FundCounterOrm(Model):
+    """Пожертвования фонда, еще не перенесенные в funds.collected.
+
+    При DONATION_COUNTER_SHARDS > 0 пожертвование увеличивает случайный шард,
+    а не строку фонда, поэтому доноры одного фонда не ждут друг друга.
+    Фоновая задача периодически переносит шарды в funds; чтение одного
+    фонда складывает funds.collected и еще не перенесенные шарды.
+    """
+    __tablename__ = 'fund_counters'
+    
+    fund_id: Mapped[int] = mapped_column(primary_key=True)
+    shard: Mapped[int] = mapped_column(primary_key=True)
+    collected: Mapped[int] = mapped_column(BigInteger, default=0)
+    donate_count: Mapped[int] = mapped_column(BigInteger, default=0)
@@ -0,0 +1,16 @@
+from datetime import datetime, timezone
+from sqlalchemy import DateTime, Float
+from sqlalchemy.orm import Mapped, mapped_column
+from database import Model
+
+
+
+
+class SchemaVersionOrm(Model):
+    """Примененные миграции схемы, по строке на версию."""
+    __tablename__ = 'schema_version'
+
+    version: Mapped[int] = mapped_column(primary_key=True, autoincrement=False)
+    description: Mapped[str]
+    applied_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    duration_ms: Mapped[float] = mapped_column(Float, default=0)
@@ -0,0 +1,20 @@
+from sqlalchemy import String
+from sqlalchemy.orm import Mapped, mapped_column
+from database import Model
+
+
+
+
+class RateLimitBucketOrm(Model):
+    """Token bucket одного клиента для одного класса ручек, общий для всех воркеров.
+
+    Время - unix-секунды, а не DateTime: пополнение считается прямо
+    в UPSERT арифметикой над updated_at. Строка без обращений дольше
+    времени полного пополнения ничем не отличается от отсутствующей
+    и удаляется фоновой очисткой.
+    """
+    __tablename__ = 'rate_limit_buckets'
+
+    key: Mapped[str] = mapped_column(String(160), primary_key=True)
+    tokens: Mapped[float]
+    updated_at: Mapped[float] = mapped_column(index=True)
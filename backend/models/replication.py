@@ -0,0 +1,18 @@
+from datetime import datetime
+from sqlalchemy import DateTime
+from sqlalchemy.orm import Mapped, mapped_column
+from database import Model
+
+
+
+
+class ReplicaHeartbeatOrm(Model):
+    """Отметка времени, которую основная база пишет, а реплики получают через репликацию.
+
+    Разница между последней записанной отметкой и той, что видна
+    на реплике, и есть отставание реплики.
+    """
+    __tablename__ = 'replica_heartbeat'
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    beat_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
@@ -1,23 +1,21 @@
-import os
-from dotenv import load_dotenv
-from database import new_session
+from database import new_session, read_session, release_request_connection
 from models.auth import UserOrm, RefreshTokenOrm, BlacklistedTokenOrm
 from schemas.auth import SUserRegister
-from sqlalchemy import select, delete
-from passlib.context import CryptContext
-from jose import jwt, JWTError
+from sqlalchemy import select, delete, update, func, case
+from utils.passwords import password_hasher
+from utils.metrics import REFRESH_TOKENS
 from datetime import datetime, timezone, timedelta
+from config import settings
+import hashlib
+import secrets
 
 
 
 
-load_dotenv()
+def refresh_token_key(refresh_token: str) -> str:
+    # В базе только хэш фиксированной длины: утечка таблицы не дает рабочих токенов
+    return hashlib.sha256(refresh_token.encode()).hexdigest()
 
-SECRET_KEY = os.getenv('SECRET_KEY')
-ALGORITHM = os.getenv('ALGORITHM')
-REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv('REFRESH_TOKEN_EXPIRE_DAYS'))
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 class UserRepository:
     @classmethod
@@ -28,7 +26,7 @@ class UserRepository:
             if result.scalars().first():
                 raise ValueError("Пользователь с таким email уже существует")
               
-            hashed_password = pwd_context.hash(user_data.password)
+            hashed_password = await password_hasher.hash(user_data.password)
             
             user = UserOrm(
                 username=user_data.username,
@@ -42,82 +40,198 @@ class UserRepository:
     
     @classmethod
     async def authenticate_user(cls, email: str, password: str) -> UserOrm | None:
-        async with new_session() as session:
+        async with read_session() as session:
             query = select(UserOrm).where(UserOrm.email == email)
             result = await session.execute(query)
             user = result.scalars().first()
-            
-            if not user or not pwd_context.verify(password, user.hashed_password):
-                return None
-            
-            return user
+        if not user:
+            return None
+        
+        # Проверка идет вне сессии, чтобы не держать соединение на время bcrypt
+        await release_request_connection()
+        is_valid, new_hash = await password_hasher.verify_and_update(password, user.hashed_password)
+        if not is_valid:
+            return None
+        
+        # Хэш устаревшей схемы или стоимости пересчитываем прозрачно при входе
+        if new_hash:
+            async with new_session() as session:
+                query = update(UserOrm).where(UserOrm.id == user.id).values(hashed_password=new_hash)
+                await session.execute(query)
+                await session.commit()
+            user.hashed_password = new_hash
+            # Кэш пользователей во всех воркерах держит старый хэш; импорт здесь,
+            # потому что utils.revocation сам импортирует этот модуль
+            from utils.revocation import token_revocation
+
+            await token_revocation.invalidate_user(user.email)
+        
+        return user
     
     @classmethod
     async def get_user_by_email(cls, email: str) -> UserOrm | None:
-        async with new_session() as session:
+        async with read_session() as session:
             query = select(UserOrm).where(UserOrm.email == email)
             result = await session.execute(query)
             return result.scalars().first()
     
     @classmethod
     async def get_user_by_id(cls, user_id: int) -> UserOrm | None:
-        async with new_session() as session:
+        async with read_session() as session:
             query = select(UserOrm).where(UserOrm.id == user_id)
             result = await session.execute(query)
             return result.scalars().first()
     
     @classmethod
-    async def get_user_by_refresh_token(cls, refresh_token: str) -> UserOrm | None:
-        async with new_session() as session:
-            query = select(RefreshTokenOrm).where(RefreshTokenOrm.token == refresh_token)
-            result = await session.execute(query)
-            refresh_token_orm = result.scalars().first()
-            
-            if not refresh_token_orm or refresh_token_orm.expires_at < datetime.now(timezone.utc):
-                return None
-            
-            return await cls.get_user_by_id(refresh_token_orm.user_id)
-    
+    def _issue_refresh_token(cls, session, user_id: int, family_id: str, now: datetime) -> str:
+        refresh_token = secrets.token_urlsafe(32)
+        session.add(RefreshTokenOrm(
+            user_id=user_id,
+            token_hash=refresh_token_key(refresh_token),
+            family_id=family_id,
+            expires_at=now + timedelta(days=settings.refresh_token_expire_days),
+            created_at=now,
+        ))
+        return refresh_token
+
     @classmethod
     async def create_refresh_token(cls, user_id: int) -> str:
+        """Открывает новую сессию; остальные сессии пользователя остаются."""
+        now = datetime.now(timezone.utc)
         async with new_session() as session:
-            # Удаляем старый refresh токен пользователя, если он существует
-            delete_query = delete(RefreshTokenOrm).where(RefreshTokenOrm.user_id == user_id)
-            await session.execute(delete_query)
-            
-            # Создаем новый refresh токен
-            refresh_token = jwt.encode({"sub": str(user_id)}, SECRET_KEY, algorithm=ALGORITHM)
-            expires_at = datetime.now(timezone.utc) + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
-            
-            refresh_token_orm = RefreshTokenOrm(
-                user_id=user_id,
-                token=refresh_token,
-                expires_at=expires_at
+            # Сессии сверх лимита, начиная с давно не обновлявшихся, закрываем
+            stale = (
+                select(RefreshTokenOrm.family_id)
+                .where(RefreshTokenOrm.user_id == user_id)
+                .group_by(RefreshTokenOrm.family_id)
+                .order_by(func.max(RefreshTokenOrm.id).desc())
+                .offset(max(settings.refresh_token_max_sessions - 1, 0))
+            )
+            query = delete(RefreshTokenOrm).where(
+                RefreshTokenOrm.user_id == user_id,
+                RefreshTokenOrm.family_id.in_(stale.scalar_subquery()),
             )
-            session.add(refresh_token_orm)
+            await session.execute(query)
+
+            refresh_token = cls._issue_refresh_token(session, user_id, secrets.token_hex(8), now)
             await session.commit()
-            return refresh_token
+        REFRESH_TOKENS.inc('issued')
+        return refresh_token
 
     @classmethod
-    async def revoke_refresh_token(cls, user_id: int):
+    async def rotate_refresh_token(cls, refresh_token: str) -> tuple[UserOrm, str] | None:
+        """Меняет refresh-токен на новый в той же сессии и отдает его вместе с пользователем.
+
+        None, если токен неизвестен или истек. Повторное предъявление уже
+        замененного токена закрывает всю сессию: им пользуется кто-то еще.
+        """
+        now = datetime.now(timezone.utc)
+        async with new_session() as session:
+            # Токен и пользователь одним запросом по уникальному индексу token_hash
+            query = (
+                select(RefreshTokenOrm.id, RefreshTokenOrm.family_id, RefreshTokenOrm.rotated_at, UserOrm)
+                .join(UserOrm, UserOrm.id == RefreshTokenOrm.user_id)
+                .where(
+                    RefreshTokenOrm.token_hash == refresh_token_key(refresh_token),
+                    RefreshTokenOrm.expires_at > now,
+                )
+            )
+            row = (await session.execute(query)).first()
+            if not row:
+                REFRESH_TOKENS.inc('invalid')
+                return None
+            token_id, family_id, rotated_at, user = row
+
+            rotated = False
+            if rotated_at is None:
+                # Условный UPDATE: из двух одновременных обменов одного токена проходит один.
+                # Замененный токен нужен только для обнаружения кражи, поэтому живет меньше
+                reuse_until = now + timedelta(seconds=settings.refresh_token_reuse_window)
+                query = (
+                    update(RefreshTokenOrm)
+                    .where(RefreshTokenOrm.id == token_id, RefreshTokenOrm.rotated_at.is_(None))
+                    .values(
+                        rotated_at=now,
+                        expires_at=case(
+                            (RefreshTokenOrm.expires_at > reuse_until, reuse_until),
+                            else_=RefreshTokenOrm.expires_at,
+                        ),
+                    )
+                    .execution_options(synchronize_session=False)
+                )
+                rotated = (await session.execute(query)).rowcount == 1
+
+            if not rotated:
+                query = delete(RefreshTokenOrm).where(
+                    RefreshTokenOrm.user_id == user.id,
+                    RefreshTokenOrm.family_id == family_id,
+                )
+                await session.execute(query)
+                await session.commit()
+                REFRESH_TOKENS.inc('reused')
+                return None
+
+            new_token = cls._issue_refresh_token(session, user.id, family_id, now)
+            await session.commit()
+        REFRESH_TOKENS.inc('rotated')
+        return user, new_token
+
+    @classmethod
+    async def revoke_refresh_token(cls, user_id: int, refresh_token: str | None = None):
+        """Закрывает сессию этого refresh-токена, без токена - все сессии пользователя."""
         async with new_session() as session:
             query = delete(RefreshTokenOrm).where(RefreshTokenOrm.user_id == user_id)
+            if refresh_token is not None:
+                family = select(RefreshTokenOrm.family_id).where(
+                    RefreshTokenOrm.token_hash == refresh_token_key(refresh_token),
+                    RefreshTokenOrm.user_id == user_id,
+                )
+                query = query.where(RefreshTokenOrm.family_id.in_(family.scalar_subquery()))
             await session.execute(query)
             await session.commit()
 
     @classmethod
-    async def add_to_blacklist(cls, token: str):
+    async def delete_expired_refresh_tokens(cls, limit: int) -> int:
+        # Не больше limit строк за транзакцию, чтобы не держать блокировки долго;
+        # SKIP LOCKED разводит воркеры, чистящие одновременно
         async with new_session() as session:
-            try:
-                payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-                expires_at = datetime.fromtimestamp(payload["exp"], tz=timezone.utc)
-            except JWTError:
-                return
+            expired = (
+                select(RefreshTokenOrm.id)
+                .where(RefreshTokenOrm.expires_at < datetime.now(timezone.utc))
+                .limit(limit)
+                .with_for_update(skip_locked=True)
+            )
+            query = delete(RefreshTokenOrm).where(RefreshTokenOrm.id.in_(expired.scalar_subquery()))
+            result = await session.execute(query)
+            await session.commit()
+            return result.rowcount
 
+    @classmethod
+    async def add_to_blacklist(cls, token_hash: str, expires_at: datetime):
+        async with new_session() as session:
             blacklisted_token = BlacklistedTokenOrm(
-                token=token,
+                token_hash=token_hash,
                 expires_at=expires_at,
                 created_at=datetime.now(timezone.utc)
             )
             session.add(blacklisted_token)
-            await session.commit()
\ No newline at end of file
+            await session.commit()
+
+    @classmethod
+    async def get_blacklist(cls, created_after: datetime | None = None) -> list[tuple[str, datetime]]:
+        async with new_session() as session:
+            query = select(BlacklistedTokenOrm.token_hash, BlacklistedTokenOrm.expires_at).where(
+                BlacklistedTokenOrm.expires_at > datetime.now(timezone.utc)
+            )
+            if created_after is not None:
+                query = query.where(BlacklistedTokenOrm.created_at >= created_after)
+            result = await session.execute(query)
+            return result.all()
+
+    @classmethod
+    async def delete_expired_blacklist(cls) -> int:
+        async with new_session() as session:
+            query = delete(BlacklistedTokenOrm).where(BlacklistedTokenOrm.expires_at < datetime.now(timezone.utc))
+            result = await session.execute(query)
+            await session.commit()
+            return result.rowcount
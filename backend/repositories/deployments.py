@@ -0,0 +1,64 @@
+from database import new_session
+from models.funds import FundOrm
+from sqlalchemy import select, update, func
+from utils.response_cache import funds_cache
+
+
+
+
+class DeploymentRepository:
+    @classmethod
+    async def get_queue(cls, status: str, limit: int) -> list:
+        # Идет по частичному индексу ix_funds_deploy_queue
+        async with new_session() as session:
+            query = (
+                select(
+                    FundOrm.id,
+                    FundOrm.target,
+                    FundOrm.target_date,
+                    FundOrm.deploy_tx_hash,
+                    FundOrm.deploy_nonce,
+                    FundOrm.deploy_raw_tx,
+                )
+                .where(FundOrm.deploy_status == status)
+                .order_by(FundOrm.id)
+                .limit(limit)
+            )
+            result = await session.execute(query)
+            return result.all()
+
+    @classmethod
+    async def count(cls, status: str) -> int:
+        async with new_session() as session:
+            return await session.scalar(select(func.count()).where(FundOrm.deploy_status == status))
+
+    @classmethod
+    async def update_statuses(cls, rows: list[dict]):
+        """Обновляет фонды по id одним executemany; в каждом словаре id и новые значения."""
+        if not rows:
+            return
+        async with new_session() as session:
+            await session.execute(update(FundOrm), rows)
+            await session.commit()
+        # Статус виден в ответах /funds: закэшированный pending не должен пережить failed
+        if any('deploy_status' in row for row in rows):
+            await funds_cache.invalidate()
+
+    @classmethod
+    async def requeue(cls, fund_id: int) -> FundOrm:
+        # Повтор неудавшегося развертывания
+        async with new_session() as session:
+            fund = await session.get(FundOrm, fund_id)
+            if not fund:
+                raise ValueError(f'Фонд с id {fund_id} не найден')
+            if fund.deploy_status != 'failed':
+                raise ValueError('Повторить можно только неудавшееся развертывание')
+            fund.deploy_status = 'pending'
+            fund.deploy_tx_hash = None
+            fund.deploy_nonce = None
+            fund.deploy_raw_tx = None
+            fund.deploy_error = None
+            await session.commit()
+            await session.refresh(fund)
+        await funds_cache.invalidate()
+        return fund
@@ -0,0 +1,71 @@
+from database import read_session
+from models.donations import DonationOrm
+from models.funds import FundOrm
+from sqlalchemy import select, func, cast, BigInteger
+from utils.pagination import encode_cursor, decode_cursor
+
+
+
+
+class DonationRepository:
+    @classmethod
+    async def get_history_page(
+        cls,
+        limit: int,
+        cursor: str | None,
+        user_id: int | None = None,
+        fund_id: int | None = None,
+    ) -> tuple[list, str | None]:
+        # Новые сверху; keyset по id идет по ix_donations_user_id_id или
+        # ix_donations_fund_id_id, остальные колонки лежат в самом индексе
+        async with read_session() as session:
+            query = select(
+                DonationOrm.id,
+                DonationOrm.fund_id,
+                DonationOrm.user_id,
+                DonationOrm.amount,
+                DonationOrm.tx_hash,
+                DonationOrm.created_at,
+            )
+            if user_id is not None:
+                query = query.where(DonationOrm.user_id == user_id)
+            if fund_id is not None:
+                query = query.where(DonationOrm.fund_id == fund_id)
+            if cursor:
+                _, last_id = decode_cursor(cursor, 'id', 'desc')
+                query = query.where(DonationOrm.id < last_id)
+
+            # Одна лишняя строка показывает, есть ли следующая страница
+            query = query.order_by(DonationOrm.id.desc()).limit(limit + 1)
+            result = await session.execute(query)
+            donations = result.mappings().all()
+
+        next_cursor = None
+        if len(donations) > limit:
+            donations = donations[:limit]
+            next_cursor = encode_cursor('id', 'desc', None, donations[-1]['id'])
+        return donations, next_cursor
+
+    @classmethod
+    async def get_user_funds(cls, user_id: int, limit: int) -> list:
+        # Фонды, которым жертвовал пользователь, начиная с последнего пожертвования
+        async with read_session() as session:
+            totals = (
+                select(
+                    DonationOrm.fund_id,
+                    cast(func.sum(DonationOrm.amount), BigInteger).label('my_amount'),
+                    func.count().label('my_donations'),
+                    func.max(DonationOrm.id).label('last_id'),
+                )
+                .where(DonationOrm.user_id == user_id)
+                .group_by(DonationOrm.fund_id)
+                .subquery()
+            )
+            query = (
+                select(FundOrm, totals.c.my_amount, totals.c.my_donations)
+                .join(totals, totals.c.fund_id == FundOrm.id)
+                .order_by(totals.c.last_id.desc())
+                .limit(limit)
+            )
+            result = await session.execute(query)
+            return result.all()
@@ -0,0 +1,96 @@
+from database import new_session, dialect_insert
+from models.events import (
+    ChainDonationOrm, ChainRefundOrm, ChainSpendingRequestOrm, ChainRequestVoteOrm,
+    ChainRequestExecutionOrm, ChainCampaignOrm, IndexerCheckpointOrm,
+)
+from models.funds import FundOrm
+from sqlalchemy import select, delete, update, func
+
+
+
+
+EVENT_MODELS = [
+    ChainDonationOrm,
+    ChainRefundOrm,
+    ChainSpendingRequestOrm,
+    ChainRequestVoteOrm,
+    ChainRequestExecutionOrm,
+    ChainCampaignOrm,
+]
+
+# Строк в одном многострочном INSERT: держим число параметров ниже лимита asyncpg
+INSERT_CHUNK = 1000
+
+
+class ChainEventRepository:
+    @classmethod
+    async def get_tracked_contracts(cls) -> set[str]:
+        async with new_session() as session:
+            funds = await session.execute(
+                select(FundOrm.contract_address).where(FundOrm.contract_address.like('0x%')).distinct()
+            )
+            campaigns = await session.execute(select(ChainCampaignOrm.campaign_address).distinct())
+            return {address.lower() for address in [*funds.scalars(), *campaigns.scalars()]}
+
+    @classmethod
+    async def get_checkpoints(cls) -> dict[str, tuple[int, str]]:
+        async with new_session() as session:
+            result = await session.execute(select(IndexerCheckpointOrm))
+            return {cp.contract_address: (cp.block_number, cp.block_hash) for cp in result.scalars()}
+
+    @classmethod
+    async def save_batch(
+        cls,
+        events: dict[type, list[dict]],
+        checkpoints: dict[str, tuple[int, str]],
+        new_contracts: dict[str, int] | None = None,
+    ):
+        # События и чекпоинт пишутся в одной транзакции: после падения
+        # индексатор продолжит ровно с того места, которое уже сохранено
+        async with new_session() as session:
+            for model, rows in events.items():
+                for start in range(0, len(rows), INSERT_CHUNK):
+                    query = (
+                        dialect_insert(model)
+                        .values(rows[start:start + INSERT_CHUNK])
+                        .on_conflict_do_nothing(index_elements=['tx_hash', 'log_index'])
+                    )
+                    await session.execute(query)
+
+            if checkpoints:
+                query = dialect_insert(IndexerCheckpointOrm).values([
+                    {'contract_address': address, 'block_number': number, 'block_hash': block_hash}
+                    for address, (number, block_hash) in checkpoints.items()
+                ])
+                query = query.on_conflict_do_update(
+                    index_elements=['contract_address'],
+                    set_={
+                        'block_number': query.excluded.block_number,
+                        'block_hash': query.excluded.block_hash,
+                        'updated_at': func.now(),
+                    },
+                )
+                await session.execute(query)
+
+            # Новые кампании начинаем читать с блока их создания, а не с начала цепочки
+            if new_contracts:
+                query = dialect_insert(IndexerCheckpointOrm).values([
+                    {'contract_address': address, 'block_number': number, 'block_hash': ''}
+                    for address, number in new_contracts.items()
+                ]).on_conflict_do_nothing(index_elements=['contract_address'])
+                await session.execute(query)
+
+            await session.commit()
+
+    @classmethod
+    async def rollback(cls, to_block: int):
+        # Откат после реорганизации: все, что выше to_block, будет прочитано заново
+        async with new_session() as session:
+            for model in EVENT_MODELS:
+                await session.execute(delete(model).where(model.block_number > to_block))
+            await session.execute(
+                update(IndexerCheckpointOrm)
+                .where(IndexerCheckpointOrm.block_number > to_block)
+                .values(block_number=to_block, block_hash='')
+            )
+            await session.commit()
@@ -1,46 +1,216 @@
-from database import new_session
-from models.funds import FundOrm
+from collections import defaultdict
+import random
+from database import new_session, read_session, dialect_insert
+from models.funds import FundOrm, CategoryOrm, FundCounterOrm
+from models.donations import DonationOrm
+from datetime import datetime, timezone
 from schemas.funds import SFund, SFundUpdate
-from sqlalchemy import select
+from sqlalchemy import select, update, insert, delete, func, cast, tuple_, BigInteger
+from utils.pagination import encode_cursor, decode_cursor
+from repositories.stats import FundStatsRepository
+from utils.response_cache import funds_cache
+from utils.search import fund_search
+from utils.fund_events import fund_events
+from utils.metrics import DONATIONS, DONATION_AMOUNT, DONATION_WRITES
+from config import settings
 
 
 
 
+def pending_counters() -> tuple:
+    # Шарды счетчиков фонда, еще не перенесенные в funds. sum(bigint) в Postgres -
+    # numeric, приводим обратно, чтобы не получить Decimal
+    return (
+        select(cast(func.coalesce(func.sum(FundCounterOrm.collected), 0), BigInteger))
+        .where(FundCounterOrm.fund_id == FundOrm.id)
+        .scalar_subquery(),
+        select(cast(func.coalesce(func.sum(FundCounterOrm.donate_count), 0), BigInteger))
+        .where(FundCounterOrm.fund_id == FundOrm.id)
+        .scalar_subquery(),
+    )
+
+
+def merge_pending(session, fund: FundOrm, collected: int, donate_count: int) -> FundOrm:
+    if collected or donate_count:
+        # Отвязываем от сессии, чтобы сумма не ушла в базу при flush
+        session.expunge(fund)
+        fund.collected += collected
+        fund.donate_count += donate_count
+    return fund
+
+
 class FundRepository:
+    # Ключи сортировки листинга, под каждый есть индекс (ключ, id) в models/funds.py
+    ORDERINGS = {
+        'created_at': FundOrm.created_at,
+        'target_date': FundOrm.target_date,
+        'collected': FundOrm.collected,
+        'progress': FundOrm.progress,
+    }
+
     @classmethod
-    async def get_all_funds(cls, limit: int, offset: int) -> list:
-        async with new_session() as session:
-            query = select(FundOrm).limit(limit).offset(offset)
-            result = await session.execute(query)
+    async def get_funds_page(
+        cls,
+        limit: int,
+        cursor: str | None = None,
+        order_by: str = 'created_at',
+        order: str = 'desc',
+        category_id: int | None = None,
+        location: str | None = None,
+        status: str | None = None,
+    ) -> tuple[list, str | None]:
+        sort_key = cls.ORDERINGS[order_by]
+        query = select(FundOrm)
+
+        if category_id is not None:
+            query = query.where(FundOrm.category_id == category_id)
+        if location is not None:
+            query = query.where(FundOrm.location == location)
+        if status == 'active':
+            query = query.where(FundOrm.target_date >= datetime.now(timezone.utc))
+        elif status == 'expired':
+            query = query.where(FundOrm.target_date < datetime.now(timezone.utc))
+
+        # Keyset: продолжаем строго после последней строки прошлой страницы,
+        # поэтому глубокая страница стоит столько же, сколько первая
+        if cursor:
+            value, last_id = decode_cursor(cursor, order_by, order)
+            position = tuple_(sort_key, FundOrm.id)
+            if order == 'desc':
+                query = query.where(position < tuple_(value, last_id))
+            else:
+                query = query.where(position > tuple_(value, last_id))
+
+        if order == 'desc':
+            query = query.order_by(sort_key.desc(), FundOrm.id.desc())
+        else:
+            query = query.order_by(sort_key.asc(), FundOrm.id.asc())
+
+        async with read_session() as session:
+            result = await session.execute(query.limit(limit + 1))
             funds = result.scalars().all()
-            return funds
+
+        next_cursor = None
+        if len(funds) > limit:
+            funds = funds[:limit]
+            last = funds[-1]
+            next_cursor = encode_cursor(order_by, order, getattr(last, order_by), last.id)
+        return funds, next_cursor
     
     @classmethod
     async def get_funds_by_category_id(cls, categori_id: int) -> list:
-        async with new_session() as session:
+        async with read_session() as session:
             query = select(FundOrm).where(FundOrm.category_id == categori_id)
             result = await session.execute(query)
             funds = result.scalars().all()
             return funds
     
     @classmethod
-    async def get_fund_by_id(cls, fund_id: int) -> SFund:
-        async with new_session() as session:
-            query = select(FundOrm).where(FundOrm.id == fund_id)
+    async def stream_funds_by_category_id(cls, category_id: int, batch_size: int = 500):
+        async for fund in cls.stream_funds(category_id, batch_size):
+            yield fund
+    
+    @classmethod
+    async def stream_funds(cls, category_id: int | None = None, batch_size: int = 500):
+        # Серверный курсор: строки приходят пачками, весь список в памяти не держим
+        async with read_session() as session:
+            query = select(FundOrm).order_by(FundOrm.id).execution_options(yield_per=batch_size)
+            if category_id is not None:
+                query = query.where(FundOrm.category_id == category_id)
+            result = await session.stream_scalars(query)
+            async for fund in result:
+                yield fund
+    
+    @classmethod
+    async def get_category_ids(cls) -> set[int]:
+        async with read_session() as session:
+            result = await session.execute(select(CategoryOrm.id))
+            return set(result.scalars().all())
+
+    @classmethod
+    async def get_contract_addresses(cls, fund_ids: list[int]) -> dict[int, str]:
+        # Только адреса, без загрузки фондов целиком
+        async with read_session() as session:
+            query = select(FundOrm.id, FundOrm.contract_address).where(FundOrm.id.in_(fund_ids))
             result = await session.execute(query)
-            fund = result.scalars().first()
-            if not fund:
-                raise ValueError(f'Фонд с id {fund_id} не найден')
-            return fund
+            return {fund_id: address for fund_id, address in result.all() if address}
+
+    @classmethod
+    async def get_fund_by_id(cls, fund_id: int) -> SFund:
+        async with read_session() as session:
+            return await cls._get_fund(session, fund_id)
     
     @classmethod
-    async def create_fund(cls, fund_data) -> FundOrm:
+    async def _get_fund(cls, session, fund_id: int) -> FundOrm:
+        # Со включенными шардами collected и donate_count досчитываются по ним
+        query = select(FundOrm).where(FundOrm.id == fund_id)
+        if settings.donation_counter_shards:
+            query = query.add_columns(*pending_counters())
+        result = await session.execute(query)
+        row = result.first()
+        if not row:
+            raise ValueError(f'Фонд с id {fund_id} не найден')
+        if settings.donation_counter_shards:
+            return merge_pending(session, *row)
+        return row[0]
+    
+    @classmethod
+    async def create_fund(cls, fund_data, deploy: bool = False) -> FundOrm:
+        # deploy - контракт кампании развернет очередь utils/deployer.py
         async with new_session() as session:
             fund = FundOrm(**fund_data.model_dump())
+            if deploy:
+                fund.contract_address = ''
+                fund.deploy_status = 'pending'
             session.add(fund)
+            await session.flush()
+            await FundStatsRepository.apply_delta(
+                session, fund.category_id,
+                fund_count=1, collected=fund.collected, target=fund.target, donations=fund.donate_count,
+            )
             await session.commit()
             await session.refresh(fund)
-            return fund
+        fund_search.index_fund(fund)
+        await funds_cache.invalidate()
+        return fund
+    
+    @classmethod
+    async def create_funds(cls, rows: list[dict], deploy: bool = False) -> list[FundOrm]:
+        """Вставляет пачку фондов одним многострочным INSERT ... RETURNING.
+
+        deploy - как в create_fund: фонды без contract_address встают в очередь развертывания.
+        """
+        if deploy:
+            # Ключи у всех строк одинаковые: иначе INSERT разбился бы на несколько
+            rows = [
+                {
+                    **row,
+                    'contract_address': row.get('contract_address') or '',
+                    'deploy_status': None if row.get('contract_address') else 'pending',
+                }
+                for row in rows
+            ]
+        async with new_session() as session:
+            result = await session.execute(insert(FundOrm).returning(FundOrm), rows)
+            funds = result.scalars().all()
+            
+            # Статистику обновляем одной строкой на категорию, а не на фонд
+            deltas = defaultdict(lambda: [0, 0, 0, 0])
+            for fund in funds:
+                delta = deltas[fund.category_id]
+                delta[0] += 1
+                delta[1] += fund.collected
+                delta[2] += fund.target
+                delta[3] += fund.donate_count
+            for category_id, (count, collected, target, donations) in deltas.items():
+                await FundStatsRepository.apply_delta(
+                    session, category_id, fund_count=count, collected=collected, target=target, donations=donations,
+                )
+            await session.commit()
+        for fund in funds:
+            fund_search.index_fund(fund)
+        await funds_cache.invalidate()
+        return funds
     
     @classmethod
     async def update_fund(cls, fund_id: int, update_data: SFundUpdate):
@@ -51,26 +221,190 @@ class FundRepository:
             if not fund:
                 raise ValueError(f'Фонд с id {fund_id} не найден')
             
+            before = (fund.category_id, fund.collected, fund.target, fund.donate_count)
             update_values = update_data.model_dump(exclude_unset=True)
             for key, value in update_values.items():
                 setattr(fund, key, value)
+            # Правка может уменьшить donate_count, поэтому новое состояние для подписчиков
+            # отличается номером правки; берем его под блокировкой строки
+            fund.revision = FundOrm.revision + 1
+            await session.flush()
+            await session.refresh(fund, ['revision'])
+            after = (fund.category_id, fund.collected, fund.target, fund.donate_count)
+            
+            if after != before:
+                # Переносим фонд в статистике: вычитаем старые значения, добавляем новые
+                await FundStatsRepository.apply_delta(
+                    session, before[0], fund_count=-1, collected=-before[1], target=-before[2], donations=-before[3],
+                )
+                await FundStatsRepository.apply_delta(
+                    session, after[0], fund_count=1, collected=after[1], target=after[2], donations=after[3],
+                )
             
             await session.commit()
-            return fund
+        fund_search.index_fund(fund)
+        await funds_cache.invalidate()
+        await fund_events.publish(fund)
+        return fund
     
     @classmethod
-    async def add_donation(cls, fund_id: int, amount: int):
+    async def add_donation(cls, fund_id: int, amount: int, **donation) -> FundOrm:
+        fund, _ = await cls.add_donations(fund_id, [{'amount': amount, **donation}])
+        return fund
+    
+    @classmethod
+    async def add_donations(cls, fund_id: int, donations: list[dict]) -> tuple[FundOrm, list[str]]:
+        """Пишет пожертвования в журнал и прибавляет новые к счетчикам фонда.
+        
+        donations - словари amount и необязательных user_id, tx_hash, idempotency_key.
+        Статус каждого: created - записано сейчас, replayed - ключ уже был с тем же
+        фондом, суммой и донором и повтор ничего не меняет, conflict - ключ уже был
+        с другими. Без шардов счетчиков фонд отдается из UPDATE ... RETURNING той же
+        транзакции, что и запись в журнал.
+        """
+        statuses = ['created'] * len(donations)
+        rows = []
+        duplicates = []
+        first_by_key = {}
+        for i, donation in enumerate(donations):
+            row = {'fund_id': fund_id, 'user_id': None, 'tx_hash': None, 'idempotency_key': None, **donation}
+            key = row['idempotency_key']
+            if key is not None and key in first_by_key:
+                # Повтор в той же пачке: статус как у первого с этим ключом
+                duplicates.append((i, first_by_key[key]))
+                continue
+            if key is not None:
+                first_by_key[key] = i
+            rows.append((i, row))
+        
         async with new_session() as session:
-            query = select(FundOrm).where(FundOrm.id == fund_id)
-            result = await session.execute(query)
-            fund = result.scalars().first()
-            if not fund:
-                raise ValueError(f'Фонд с id {fund_id} не найден')
+            if settings.donation_counter_shards:
+                category_id = await session.scalar(select(FundOrm.category_id).where(FundOrm.id == fund_id))
+                if category_id is None:
+                    raise ValueError(f'Фонд с id {fund_id} не найден')
+            
+            # Ключ, который уже есть в журнале, упирается в уникальный индекс и пропускается.
+            # Строки для несуществующего фонда откатятся вместе с транзакцией ниже
+            query = (
+                dialect_insert(DonationOrm)
+                .values([row for _, row in rows])
+                .on_conflict_do_nothing(index_elements=['idempotency_key'])
+                .returning(DonationOrm.idempotency_key)
+            )
+            inserted = set((await session.execute(query)).scalars().all())
+            skipped = [row['idempotency_key'] for _, row in rows if row['idempotency_key'] not in inserted | {None}]
+            if skipped:
+                result = await session.execute(
+                    select(DonationOrm.idempotency_key, DonationOrm.fund_id, DonationOrm.amount, DonationOrm.user_id)
+                    .where(DonationOrm.idempotency_key.in_(skipped))
+                )
+                existing = {key: rest for key, *rest in result.all()}
+                for i, row in rows:
+                    if row['idempotency_key'] in existing:
+                        # Тот же ключ от другого донора - конфликт, а не повтор: иначе
+                        # пожертвование второго донора молча потерялось бы
+                        same = existing[row['idempotency_key']] == [fund_id, row['amount'], row['user_id']]
+                        statuses[i] = 'replayed' if same else 'conflict'
+            for i, first in duplicates:
+                same = all(
+                    donations[i].get(field) == donations[first].get(field) for field in ('amount', 'user_id')
+                )
+                statuses[i] = 'conflict' if statuses[first] == 'conflict' or not same else 'replayed'
             
-            fund.collected += amount
-            fund.donate_count += 1
+            created = [donations[i] for i, status in enumerate(statuses) if status == 'created']
+            amount = sum(donation['amount'] for donation in created)
+            count = len(created)
+            fund = None
+            if count and settings.donation_counter_shards:
+                # Шард выбирается случайно: параллельные доноры пишут в разные строки
+                upsert = dialect_insert(FundCounterOrm).values(
+                    fund_id=fund_id,
+                    shard=random.randrange(settings.donation_counter_shards),
+                    collected=amount,
+                    donate_count=count,
+                )
+                upsert = upsert.on_conflict_do_update(
+                    index_elements=['fund_id', 'shard'],
+                    set_={
+                        'collected': FundCounterOrm.collected + upsert.excluded.collected,
+                        'donate_count': FundCounterOrm.donate_count + upsert.excluded.donate_count,
+                    },
+                )
+                await session.execute(upsert)
+                await FundStatsRepository.apply_delta(session, category_id, collected=amount, donations=count)
+            elif count:
+                # Инкремент одним UPDATE ... RETURNING прямо в базе: параллельные
+                # пожертвования не затирают друг друга, а клиент получает итоги
+                # именно после своей записи
+                result = await session.execute(
+                    update(FundOrm)
+                    .where(FundOrm.id == fund_id)
+                    .values(
+                        collected=FundOrm.collected + amount,
+                        donate_count=FundOrm.donate_count + count,
+                    )
+                    .returning(FundOrm)
+                    .execution_options(synchronize_session=False)
+                )
+                fund = result.scalars().first()
+                if fund is None:
+                    raise ValueError(f'Фонд с id {fund_id} не найден')
+                await FundStatsRepository.apply_delta(session, fund.category_id, collected=amount, donations=count)
+            if fund is None:
+                # Шарды еще не перенесены в funds или ничего не записано: читаем с их суммой
+                fund = await cls._get_fund(session, fund_id)
+            await session.commit()
+        
+        if count:
+            DONATIONS.inc(amount=count)
+            DONATION_AMOUNT.inc(amount=amount)
+            DONATION_WRITES.inc()
+            await funds_cache.invalidate()
+            await fund_events.publish(fund)
+        return fund, statuses
+    
+    @classmethod
+    async def rollup_counters(cls) -> int:
+        """Переносит шарды счетчиков в funds одной транзакцией; возвращает число фондов."""
+        async with new_session() as session:
+            result = await session.execute(
+                delete(FundCounterOrm)
+                .returning(FundCounterOrm.fund_id, FundCounterOrm.collected, FundCounterOrm.donate_count)
+            )
+            totals = defaultdict(lambda: [0, 0])
+            for fund_id, collected, donate_count in result.all():
+                totals[fund_id][0] += collected
+                totals[fund_id][1] += donate_count
+            # По возрастанию id: воркеры блокируют строки фондов в одном порядке
+            for fund_id in sorted(totals):
+                collected, donate_count = totals[fund_id]
+                await session.execute(
+                    update(FundOrm)
+                    .where(FundOrm.id == fund_id)
+                    .values(
+                        collected=FundOrm.collected + collected,
+                        donate_count=FundOrm.donate_count + donate_count,
+                    )
+                    .execution_options(synchronize_session=False)
+                )
             await session.commit()
-            return fund
+        if totals:
+            # Листинг и сортировки читают funds напрямую
+            await funds_cache.invalidate()
+        return len(totals)
+    
+    @classmethod
+    async def set_photo_variants(cls, fund_id: int, photo_url: str, variants: dict[str, str]):
+        # Условие по photo_url: если фото успели заменить, варианты старого не пишем
+        async with new_session() as session:
+            query = (
+                update(FundOrm)
+                .where(FundOrm.id == fund_id, FundOrm.photo_url == photo_url)
+                .values(photo_variants=variants)
+            )
+            await session.execute(query)
+            await session.commit()
+        await funds_cache.invalidate()
     
     @classmethod
     async def delete_fund(cls, fund_id: int):
@@ -81,5 +415,23 @@ class FundRepository:
             if not fund:
                 raise ValueError(f'Фонд с id {fund_id} не найден')
             
+            # Шарды счетчиков уже учтены в fund_stats, но в funds еще не перенесены.
+            # Внешнего ключа у fund_counters нет: удаляем их сами, иначе rollup
+            # применил бы их к несуществующему фонду, а статистика так и осталась бы завышенной
+            result = await session.execute(
+                delete(FundCounterOrm)
+                .where(FundCounterOrm.fund_id == fund_id)
+                .returning(FundCounterOrm.collected, FundCounterOrm.donate_count)
+            )
+            pending = result.all()
+            collected = fund.collected + sum(row.collected for row in pending)
+            donate_count = fund.donate_count + sum(row.donate_count for row in pending)
+            
             await session.delete(fund)
-            await session.commit()
\ No newline at end of file
+            await FundStatsRepository.apply_delta(
+                session, fund.category_id,
+                fund_count=-1, collected=-collected, target=-fund.target, donations=-donate_count,
+            )
+            await session.commit()
+        fund_search.remove_fund(fund_id)
+        await funds_cache.invalidate()
\ No newline at end of file
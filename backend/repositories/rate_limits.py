@@ -0,0 +1,42 @@
+from database import engine, dialect_insert
+from models.rate_limits import RateLimitBucketOrm
+from sqlalchemy import select, delete, case, literal
+
+
+
+
+class RateLimitRepository:
+    @classmethod
+    async def take(cls, key: str, rate: float, burst: int, now: float) -> float:
+        """Берет токен из ведра key; 0 - разрешено, иначе через сколько секунд появится токен.
+
+        Пополнение и списание - один атомарный UPSERT: воркеры не гоняются
+        за одной строкой. Соединение берется на один запрос, мимо RequestScope.
+        """
+        bucket = RateLimitBucketOrm.__table__
+        refilled = bucket.c.tokens + (literal(now) - bucket.c.updated_at) * rate
+        available = case((refilled > burst, literal(float(burst))), else_=refilled)
+        query = dialect_insert(RateLimitBucketOrm).values(key=key, tokens=burst - 1, updated_at=now)
+        query = query.on_conflict_do_update(
+            index_elements=['key'],
+            set_={'tokens': available - 1, 'updated_at': now},
+            where=available >= 1,
+        ).returning(bucket.c.tokens)
+        async with engine.begin() as conn:
+            if (await conn.execute(query)).first() is not None:
+                return 0.0
+            tokens = (await conn.execute(select(available).where(bucket.c.key == key))).scalar()
+        return (1 - tokens) / rate
+
+    @classmethod
+    async def delete_idle(cls, idle_before: float, limit: int) -> int:
+        # Ведра, которые к этому моменту пополнились бы до полного
+        async with engine.begin() as conn:
+            idle = (
+                select(RateLimitBucketOrm.key)
+                .where(RateLimitBucketOrm.updated_at < idle_before)
+                .limit(limit)
+                .with_for_update(skip_locked=True)
+            )
+            result = await conn.execute(delete(RateLimitBucketOrm).where(RateLimitBucketOrm.key.in_(idle.scalar_subquery())))
+            return result.rowcount
@@ -0,0 +1,30 @@
+from datetime import datetime
+from database import new_session, dialect_insert, Replica
+from models.replication import ReplicaHeartbeatOrm
+from sqlalchemy import select, text
+
+
+
+
+HEARTBEAT_ID = 1
+
+
+class ReplicationRepository:
+    @classmethod
+    async def beat(cls, beat_at: datetime):
+        query = dialect_insert(ReplicaHeartbeatOrm).values(id=HEARTBEAT_ID, beat_at=beat_at)
+        query = query.on_conflict_do_update(index_elements=['id'], set_={'beat_at': query.excluded.beat_at})
+        async with new_session() as session:
+            await session.execute(query)
+            await session.commit()
+
+    @classmethod
+    async def get_replica_beat(cls, replica: Replica) -> datetime | None:
+        async with replica.session_factory() as session:
+            result = await session.execute(select(ReplicaHeartbeatOrm.beat_at).where(ReplicaHeartbeatOrm.id == HEARTBEAT_ID))
+            return result.scalar()
+
+    @classmethod
+    async def ping_replica(cls, replica: Replica):
+        async with replica.session_factory() as session:
+            await session.execute(text('SELECT 1'))
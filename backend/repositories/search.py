@@ -0,0 +1,90 @@
+from database import new_session, read_session
+from models.funds import FundOrm
+from sqlalchemy import select, func, literal, literal_column, text
+from config import settings
+
+
+
+
+SEARCH_CONFIG = 'russian'
+HEADLINE_TITLE = 'StartSel=<mark>, StopSel=</mark>, HighlightAll=true'
+HEADLINE_SNIPPET = 'StartSel=<mark>, StopSel=</mark>, MaxWords=30, MinWords=12, MaxFragments=2, FragmentDelimiter=" … "'
+
+
+def html_escaped(column):
+    # ts_headline не экранирует исходный текст, поэтому экранируем до него
+    return func.replace(func.replace(func.replace(column, '&', '&amp;'), '<', '&lt;'), '>', '&gt;')
+
+
+class SearchRepository:
+    @classmethod
+    async def has_trigram_index(cls) -> bool:
+        """Есть ли индекс для поиска с опечатками; создает его миграция, если pg_trgm доступен."""
+        async with read_session() as session:
+            return await session.scalar(text("SELECT to_regclass('ix_funds_title_trgm') IS NOT NULL"))
+
+    @classmethod
+    async def search_fulltext(cls, q: str, limit: int, offset: int) -> list[tuple]:
+        """Возвращает [(фонд, ранг, название с подсветкой, фрагмент описания)]."""
+        vector = literal_column('funds.search_vector')
+        ts_query = func.websearch_to_tsquery(SEARCH_CONFIG, q)
+
+        candidates = (
+            select(FundOrm.id, vector.label('search_vector'))
+            .where(vector.op('@@')(ts_query))
+            .limit(settings.search_rank_candidates)
+            .subquery()
+        )
+        rank = func.ts_rank_cd(candidates.c.search_vector, ts_query).label('rank')
+
+        # Сначала ранжируем кандидатов, ts_headline считаем только для страницы
+        ranked = (
+            select(candidates.c.id, rank)
+            .order_by(rank.desc(), candidates.c.id)
+            .limit(limit)
+            .offset(offset)
+            .subquery()
+        )
+        query = (
+            select(
+                FundOrm,
+                ranked.c.rank,
+                func.ts_headline(SEARCH_CONFIG, html_escaped(FundOrm.title), ts_query, HEADLINE_TITLE),
+                func.ts_headline(SEARCH_CONFIG, html_escaped(FundOrm.description), ts_query, HEADLINE_SNIPPET),
+            )
+            .join(ranked, ranked.c.id == FundOrm.id)
+            .order_by(ranked.c.rank.desc(), FundOrm.id)
+        )
+        async with read_session() as session:
+            result = await session.execute(query)
+            return [tuple(row) for row in result.all()]
+
+    @classmethod
+    async def search_fuzzy(cls, q: str, limit: int, exclude_ids: list[int]) -> list[tuple]:
+        """Похожие по триграммам названия: [(фонд, сходство)]."""
+        similarity = func.word_similarity(q, FundOrm.title).label('similarity')
+        query = (
+            select(FundOrm, similarity)
+            .where(literal(q).op('<%')(FundOrm.title))
+            .order_by(similarity.desc(), FundOrm.id)
+            .limit(limit)
+        )
+        if exclude_ids:
+            query = query.where(FundOrm.id.not_in(exclude_ids))
+        async with read_session() as session:
+            result = await session.execute(query)
+            return [tuple(row) for row in result.all()]
+
+    @classmethod
+    async def get_documents(cls) -> list[tuple]:
+        # Для индекса в памяти: только текстовые поля
+        async with new_session() as session:
+            query = select(FundOrm.id, FundOrm.title, FundOrm.description, FundOrm.location, FundOrm.team_info)
+            result = await session.execute(query)
+            return [tuple(row) for row in result.all()]
+
+    @classmethod
+    async def get_funds_by_ids(cls, fund_ids: list[int]) -> dict[int, FundOrm]:
+        async with read_session() as session:
+            result = await session.execute(select(FundOrm).where(FundOrm.id.in_(fund_ids)))
+            return {fund.id: fund for fund in result.scalars().all()}
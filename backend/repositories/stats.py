@@ -0,0 +1,97 @@
+import random
+from database import new_session, read_session, dialect_insert
+from models.funds import FundOrm, FundStatsOrm, CategoryOrm
+from sqlalchemy import select, delete, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from config import settings
+
+
+
+
+class FundStatsRepository:
+    @classmethod
+    async def apply_delta(
+        cls,
+        session: AsyncSession,
+        category_id: int,
+        fund_count: int = 0,
+        collected: int = 0,
+        target: int = 0,
+        donations: int = 0,
+    ):
+        # Вызывается внутри транзакции, изменившей фонд, и коммитится вместе с ней
+        query = dialect_insert(FundStatsOrm).values(
+            category_id=category_id,
+            shard=random.randrange(settings.fund_stats_shards),
+            fund_count=fund_count,
+            total_collected=collected,
+            total_target=target,
+            donation_count=donations,
+        )
+        query = query.on_conflict_do_update(
+            index_elements=['category_id', 'shard'],
+            set_={
+                'fund_count': FundStatsOrm.fund_count + query.excluded.fund_count,
+                'total_collected': FundStatsOrm.total_collected + query.excluded.total_collected,
+                'total_target': FundStatsOrm.total_target + query.excluded.total_target,
+                'donation_count': FundStatsOrm.donation_count + query.excluded.donation_count,
+            },
+        )
+        await session.execute(query)
+
+    @classmethod
+    async def get_category_stats(cls) -> list:
+        # Читаем не больше (категорий x шардов) строк, независимо от числа фондов
+        async with read_session() as session:
+            query = (
+                select(
+                    CategoryOrm.id,
+                    CategoryOrm.category,
+                    func.coalesce(func.sum(FundStatsOrm.fund_count), 0).label('fund_count'),
+                    func.coalesce(func.sum(FundStatsOrm.total_collected), 0).label('total_collected'),
+                    func.coalesce(func.sum(FundStatsOrm.total_target), 0).label('total_target'),
+                    func.coalesce(func.sum(FundStatsOrm.donation_count), 0).label('donation_count'),
+                )
+                .outerjoin(FundStatsOrm, FundStatsOrm.category_id == CategoryOrm.id)
+                .group_by(CategoryOrm.id, CategoryOrm.category)
+                .order_by(CategoryOrm.id)
+            )
+            result = await session.execute(query)
+            return result.mappings().all()
+
+    @classmethod
+    async def get_top_funds(cls, limit: int, category_id: int | None = None) -> list:
+        # Идет по индексу ix_funds_progress_id / ix_funds_category_progress_id
+        async with read_session() as session:
+            query = select(FundOrm).order_by(FundOrm.progress.desc(), FundOrm.id.desc()).limit(limit)
+            if category_id is not None:
+                query = query.where(FundOrm.category_id == category_id)
+            result = await session.execute(query)
+            return result.scalars().all()
+
+    @classmethod
+    async def rebuild(cls):
+        # Полный пересчет: после массовой загрузки данных мимо FundRepository
+        async with new_session() as session:
+            await session.execute(delete(FundStatsOrm))
+            query = select(
+                FundOrm.category_id,
+                func.count(),
+                func.coalesce(func.sum(FundOrm.collected), 0),
+                func.coalesce(func.sum(FundOrm.target), 0),
+                func.coalesce(func.sum(FundOrm.donate_count), 0),
+            ).group_by(FundOrm.category_id)
+            rows = (await session.execute(query)).all()
+            if rows:
+                await session.execute(dialect_insert(FundStatsOrm).values([
+                    {
+                        'category_id': category_id,
+                        'shard': 0,
+                        'fund_count': fund_count,
+                        'total_collected': collected,
+                        'total_target': target,
+                        'donation_count': donations,
+                    }
+                    for category_id, fund_count, collected, target, donations in rows
+                ]))
+            await session.commit()
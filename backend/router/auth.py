@@ -2,7 +2,9 @@ from fastapi import APIRouter, Depends, HTTPException
 from schemas.auth import SUserRegister, SUserLogin, SUser
 from repositories.auth import UserRepository
 from models.auth import UserOrm
-from utils.security import create_access_token, get_current_user, oauth2_scheme
+from utils.metrics import LOGINS
+from utils.passwords import PasswordHasherOverloaded
+from utils.security import create_access_token, get_current_user, oauth2_scheme, revoke_access_token
 
 
 
@@ -13,6 +15,10 @@ router = APIRouter(
 )
 
 
+def overloaded_exception(e: PasswordHasherOverloaded) -> HTTPException:
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+
+
 @router.post("/register")
 async def register_user(user_data: SUserRegister):
     try:
@@ -20,14 +26,22 @@ async def register_user(user_data: SUserRegister):
         return {"success": True, "user_id": user_id, "message": "Регистрация прошла успешно"}
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    except PasswordHasherOverloaded as e:
+        raise overloaded_exception(e)
 
 
 @router.post("/login")
 async def login_user(login_data: SUserLogin):
-    user = await UserRepository.authenticate_user(login_data.email, login_data.password)
+    try:
+        user = await UserRepository.authenticate_user(login_data.email, login_data.password)
+    except PasswordHasherOverloaded as e:
+        LOGINS.inc('overloaded')
+        raise overloaded_exception(e)
     if not user:
+        LOGINS.inc('failure')
         raise HTTPException(status_code=400, detail="Неверный email или пароль")
     
+    LOGINS.inc('success')
     access_token = create_access_token(data={"sub": user.email})
     refresh_token = await UserRepository.create_refresh_token(user.id)
     return {"success": True, "message": "Вы вошли в аккаунт", "access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
@@ -35,18 +49,25 @@ async def login_user(login_data: SUserLogin):
 
 @router.post("/refresh")
 async def refresh_token(refresh_token: str):
-    user = await UserRepository.get_user_by_refresh_token(refresh_token)
-    if not user:
+    # Старый refresh-токен после обмена недействителен, клиент сохраняет новый
+    rotated = await UserRepository.rotate_refresh_token(refresh_token)
+    if not rotated:
         raise HTTPException(status_code=400, detail="Неверный refresh токен")
+    user, new_refresh_token = rotated
     
     new_access_token = create_access_token(data={"sub": user.email})
-    return {"access_token": new_access_token, "token_type": "bearer"}
+    return {"access_token": new_access_token, "refresh_token": new_refresh_token, "token_type": "bearer"}
 
 
 @router.post("/logout")
-async def logout(token: str = Depends(oauth2_scheme), current_user: UserOrm = Depends(get_current_user)):
-    await UserRepository.add_to_blacklist(token)
-    await UserRepository.revoke_refresh_token(current_user.id)
+async def logout(
+    refresh_token: str | None = None,
+    token: str = Depends(oauth2_scheme),
+    current_user: UserOrm = Depends(get_current_user),
+):
+    # С refresh-токеном закрывается только эта сессия, без него - все устройства
+    await revoke_access_token(token)
+    await UserRepository.revoke_refresh_token(current_user.id, refresh_token)
     return {"success": True}
 
 
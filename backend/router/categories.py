@@ -0,0 +1,25 @@
+from fastapi import APIRouter, HTTPException
+from schemas.funds import SCategoryStats
+from repositories.stats import FundStatsRepository
+
+
+
+
+router = APIRouter(
+    prefix="/categories",
+    tags=['Категории']
+)
+
+
+@router.get("/", response_model=list[SCategoryStats])
+async def get_categories():
+    rows = await FundStatsRepository.get_category_stats()
+    return [SCategoryStats.model_validate(row) for row in rows]
+
+
+@router.get("/{category_id}", response_model=SCategoryStats)
+async def get_category(category_id: int):
+    for row in await FundStatsRepository.get_category_stats():
+        if row['id'] == category_id:
+            return SCategoryStats.model_validate(row)
+    raise HTTPException(status_code=404, detail=f'Категория с id {category_id} не найдена')
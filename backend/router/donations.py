@@ -0,0 +1,26 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from schemas.donations import SDonationPage
+from models.auth import UserOrm
+from repositories.donations import DonationRepository
+from utils.security import get_current_user
+
+
+
+
+router = APIRouter(
+    prefix="/donations",
+    tags=['Пожертвования']
+)
+
+
+@router.get("/my", response_model=SDonationPage)
+async def get_my_donations(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: str | None = Query(None, description="next_cursor с предыдущей страницы"),
+    current_user: UserOrm = Depends(get_current_user),
+):
+    try:
+        donations, next_cursor = await DonationRepository.get_history_page(limit, cursor, user_id=current_user.id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return SDonationPage(items=donations, next_cursor=next_cursor)
@@ -1,8 +1,29 @@
-import os
-from pathlib import Path
-from fastapi import APIRouter, HTTPException, status, UploadFile, File
-from schemas.funds import SFund, SFundUpdate, SFundDonate, SFundPhotoUpdate
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Header, Query, Request, Response, WebSocket
+from fastapi.responses import StreamingResponse
+from schemas.funds import (
+    SFund, SFundUpdate, SFundDonate, SFundPhotoUpdate, SFundPage,
+    FundOrderBy, FundOrder, FundStatus, SFundStats, SCategoryStats, SPlatformStats,
+    SFundSearchHit, SFundSearchResults, SFundImportReport, FundExportFormat, SFundOnchain,
+)
+from schemas.donations import SDonationPage, SDonatedFund
+from models.auth import UserOrm
 from repositories.funds import FundRepository
+from repositories.donations import DonationRepository
+from repositories.deployments import DeploymentRepository
+from repositories.stats import FundStatsRepository
+from utils.donations import donation_engine
+from utils.deployer import fund_deployer
+from utils.onchain import onchain_reader, is_address
+from utils.media import save_upload, media_worker, UploadTooLarge, UnsupportedImage
+from utils.response_cache import funds_cache, days_left_deadline
+from utils.serialization import dumps, dump_funds, dump_fund_page, fund_dicts, stream_ndjson, stream_csv
+from utils.bulk_import import import_funds, IMPORT_FORMATS
+from utils.fund_events import fund_events, EventStreamResponse
+from database import release_request_connection
+from utils.search import fund_search
+from utils.security import get_current_user, get_optional_user, require_admin
+from web3 import RpcError
+from config import settings
 
 
 
@@ -12,75 +33,332 @@ router = APIRouter(
     tags=['Фонды']
 )
 
-UPLOADS_DIR = "uploads"
-
 
+@router.get("/", response_model=SFundPage)
+async def get_all_funds(
+    request: Request,
+    limit: int = Query(10, ge=1, le=100),
+    cursor: str | None = Query(None, description="next_cursor с предыдущей страницы"),
+    order_by: FundOrderBy = "created_at",
+    order: FundOrder = "desc",
+    category_id: int | None = None,
+    location: str | None = None,
+    fund_status: FundStatus | None = Query(None, alias="status"),
+):
+    async def build():
+        funds, next_cursor = await FundRepository.get_funds_page(
+            limit, cursor, order_by, order, category_id, location, fund_status
+        )
+        return dump_fund_page(funds, next_cursor), days_left_deadline(fund.target_date for fund in funds)
 
-@router.get("/", response_model=list[SFund])
-async def get_all_funds(limit: int = 10, offset: int = 0):
     try:
-        funds = await FundRepository.get_all_funds(limit, offset)
-        return [SFund.model_validate(fund) for fund in funds]
+        return await funds_cache.respond(request, build)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@router.get("/search", response_model=SFundSearchResults)
+async def search_funds(
+    request: Request,
+    q: str = Query(min_length=1, max_length=200, description="Поисковый запрос, синтаксис как у websearch"),
+    limit: int = Query(10, ge=1, le=50),
+    offset: int = Query(0, ge=0, le=1000),
+):
+    async def build():
+        hits = await fund_search.search(q, limit, offset)
+        results = SFundSearchResults(items=[
+            SFundSearchHit(
+                fund=SFund.model_validate(fund), rank=rank, match=match, title_highlight=title, snippet=snippet,
+            )
+            for fund, rank, match, title, snippet in hits
+        ])
+        return results.model_dump_json().encode(), days_left_deadline(hit[0].target_date for hit in hits)
+
+    return await funds_cache.respond(request, build)
+
+
+@router.get("/stats", response_model=SPlatformStats)
+async def get_funds_stats(top: int = Query(5, ge=0, le=50), category_id: int | None = None):
+    categories = [SCategoryStats.model_validate(row) for row in await FundStatsRepository.get_category_stats()]
+    platform = SFundStats(
+        fund_count=sum(c.fund_count for c in categories),
+        total_collected=sum(c.total_collected for c in categories),
+        total_target=sum(c.total_target for c in categories),
+        donation_count=sum(c.donation_count for c in categories),
+    )
+    top_funds = await FundStatsRepository.get_top_funds(top, category_id) if top else []
+    return SPlatformStats(
+        platform=platform,
+        categories=categories,
+        top_funds=[SFund.model_validate(fund) for fund in top_funds],
+    )
+
+
+@router.get("/export", responses={200: {"content": {"application/x-ndjson": {}, "text/csv": {}}}})
+async def export_funds(
+    export_format: FundExportFormat = Query("ndjson", alias="format"),
+    category_id: int | None = None,
+):
+    # Читаем серверным курсором и отдаем пачками: память не зависит от числа фондов
+    funds = FundRepository.stream_funds(category_id)
+    if export_format == "csv":
+        return StreamingResponse(
+            stream_csv(funds),
+            media_type="text/csv; charset=utf-8",
+            headers={"Content-Disposition": 'attachment; filename="funds.csv"'},
+        )
+    return StreamingResponse(stream_ndjson(funds), media_type="application/x-ndjson")
+
+
+@router.get("/my", response_model=list[SDonatedFund])
+async def get_my_funds(
+    limit: int = Query(50, ge=1, le=200),
+    current_user: UserOrm = Depends(get_current_user),
+):
+    # Фонды, которым жертвовал пользователь, с его суммой и числом пожертвований
+    rows = await DonationRepository.get_user_funds(current_user.id, limit)
+    return [
+        SDonatedFund(**SFund.model_validate(fund).model_dump(), my_amount=my_amount, my_donations=my_donations)
+        for fund, my_amount, my_donations in rows
+    ]
+
+
+@router.get("/onchain", response_model=list[SFundOnchain])
+async def get_funds_onchain(ids: list[int] = Query(..., max_length=200, description="id фондов")):
+    # Состояние контрактов для карточек каталога: все фонды одним batch на одном блоке.
+    # Фонды без контракта или без кода контракта на блоке пропускаются
+    addresses = {
+        fund_id: address
+        for fund_id, address in (await FundRepository.get_contract_addresses(ids)).items()
+        if is_address(address)
+    }
+    if not addresses:
+        return []
+    try:
+        block, summaries = await onchain_reader.read_summaries(list(addresses.values()))
+    except RpcError as e:
+        raise HTTPException(status_code=502, detail=f"Узел блокчейна недоступен: {e}")
+    # Без контракта на блоке (ValueError) фонд пропускается, ошибка узла - это 502, а не пустой список
+    for summary in summaries.values():
+        if isinstance(summary, Exception) and not isinstance(summary, ValueError):
+            raise HTTPException(status_code=502, detail=f"Узел блокчейна недоступен: {summary}")
+    funds = []
+    for fund_id in ids:
+        summary = summaries.get(addresses.get(fund_id, '').lower())
+        if summary is None or isinstance(summary, ValueError):
+            continue
+        funds.append(SFundOnchain(fund_id=fund_id, block_number=block, **summary))
+    return funds
+
+
 @router.get("/{fund_id}", response_model=SFund)
-async def get_fund_by_id(fund_id: int):
+async def get_fund_by_id(fund_id: int, request: Request):
+    async def build():
+        fund = await FundRepository.get_fund_by_id(fund_id)
+        return dumps(fund_dicts([fund])[0]), days_left_deadline([fund.target_date])
+
+    try:
+        return await funds_cache.respond(request, build)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@router.get("/{fund_id}/donations", response_model=SDonationPage)
+async def get_fund_donations(
+    fund_id: int,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: str | None = Query(None, description="next_cursor с предыдущей страницы"),
+):
+    try:
+        donations, next_cursor = await DonationRepository.get_history_page(limit, cursor, fund_id=fund_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return SDonationPage(items=donations, next_cursor=next_cursor)
+
+
+@router.get("/{fund_id}/onchain", response_model=SFundOnchain)
+async def get_fund_onchain(fund_id: int):
+    addresses = await FundRepository.get_contract_addresses([fund_id])
+    if not is_address(addresses.get(fund_id)):
+        raise HTTPException(status_code=404, detail="У фонда нет контракта кампании")
+    try:
+        campaign = await onchain_reader.read_campaign(addresses[fund_id])
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except RpcError as e:
+        raise HTTPException(status_code=502, detail=f"Узел блокчейна недоступен: {e}")
+    return SFundOnchain(fund_id=fund_id, **campaign)
+
+
+@router.get("/{fund_id}/events", responses={200: {"content": {"text/event-stream": {}}}})
+async def get_fund_events(fund_id: int):
+    # SSE: сразу текущее состояние сбора, затем event: progress при каждом изменении
     try:
         fund = await FundRepository.get_fund_by_id(fund_id)
-        return SFund.model_validate(fund)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
+    if fund_events.full():
+        raise HTTPException(status_code=503, detail="Слишком много подписчиков, попробуйте позже")
+    # Соединение с базой подписке больше не нужно, не держим его до конца потока
+    await release_request_connection()
+    return EventStreamResponse(fund_events.sse(fund), fund_events)
 
 
-@router.get("/categories/{category_id}", response_model=list[SFund])
-async def get_funds_by_category_id(category_id: int):
+@router.websocket("/{fund_id}/ws")
+async def fund_events_websocket(websocket: WebSocket, fund_id: int):
+    # То же через WebSocket: JSON-сообщение с collected и donate_count на каждое изменение
+    # Закрытие до accept клиент видит как HTTP 403, поэтому сначала принимаем,
+    # чтобы он получил код: 4404 - фонда нет, 1013 - подписчиков слишком много
+    await websocket.accept()
     try:
+        fund = await FundRepository.get_fund_by_id(fund_id)
+    except ValueError as e:
+        await websocket.close(code=4404, reason=str(e))
+        return
+    if fund_events.full():
+        await websocket.close(code=1013, reason="Слишком много подписчиков")
+        return
+    await fund_events.serve_websocket(websocket, fund)
+
+
+@router.get(
+    "/categories/{category_id}",
+    response_model=list[SFund],
+    responses={200: {"content": {"application/x-ndjson": {}}}},
+)
+async def get_funds_by_category_id(category_id: int, request: Request):
+    # Большие категории можно забрать потоком NDJSON: Accept: application/x-ndjson
+    if "application/x-ndjson" in request.headers.get("accept", ""):
+        funds = FundRepository.stream_funds_by_category_id(category_id)
+        return StreamingResponse(stream_ndjson(funds), media_type="application/x-ndjson")
+    
+    async def build():
         funds = await FundRepository.get_funds_by_category_id(category_id)
-        return [SFund.model_validate(fund) for fund in funds]
+        return dump_funds(funds), days_left_deadline(fund.target_date for fund in funds)
+
+    try:
+        return await funds_cache.respond(request, build)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
-@router.post("/", response_model=SFund, status_code=status.HTTP_201_CREATED)
+@router.post(
+    "/",
+    response_model=SFund,
+    status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(get_current_user)],
+)
 async def create_fund(fund_data: SFundUpdate):
+    # Без contract_address фонд сразу возвращается с deploy_status pending,
+    # кампанию в PlatformRegistry развернет фоновая очередь. Газ платит ключ
+    # организации, поэтому только для вошедших и с лимитом класса deploy
+    deploy = fund_deployer.configured and not fund_data.contract_address
     try:
-        fund = await FundRepository.create_fund(fund_data)
-        return SFund.model_validate(fund)
+        fund = await FundRepository.create_fund(fund_data, deploy=deploy)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if deploy:
+        fund_deployer.wake()
+    return SFund.model_validate(fund)
+
+
+@router.post(
+    "/bulk",
+    response_model=SFundImportReport,
+    openapi_extra={"requestBody": {"required": True, "content": {"application/x-ndjson": {}, "text/csv": {}}}},
+    dependencies=[Depends(require_admin)],
+)
+async def import_funds_bulk(request: Request):
+    # Формат по Content-Type: NDJSON - объект SFundImport на строку, CSV - с заголовком из имен полей
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    import_format = IMPORT_FORMATS.get(content_type)
+    if import_format is None:
+        raise HTTPException(status_code=415, detail="Ожидается application/x-ndjson или text/csv")
+    # Фонды без contract_address развертываются так же, как в POST /funds/
+    deploy = fund_deployer.configured
+    try:
+        report = await import_funds(request.stream(), import_format, deploy=deploy)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    if deploy and report.inserted:
+        fund_deployer.wake()
+    return report
 
 
 @router.post("/{fund_id}/upload-photo")
 async def upload_fund_photo(
     fund_id: int,
+    request: Request,
     file: UploadFile = File(...)
 ):
-    # Создаем папку uploads если ее нет
-    Path(UPLOADS_DIR).mkdir(exist_ok=True)
+    # Заведомо большой запрос отсекаем по заголовку, не читая тело
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > settings.max_upload_bytes + 64 * 1024:
+        raise HTTPException(status_code=413, detail="Файл слишком большой")
     
-    filename = f"{fund_id}.jpg"
-    file_path = os.path.join(UPLOADS_DIR, filename)
+    try:
+        await FundRepository.get_fund_by_id(fund_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     
-    # Сохраняем файл
-    with open(file_path, "wb") as buffer:
-        buffer.write(await file.read())
+    try:
+        filename, _ = await save_upload(file)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UnsupportedImage as e:
+        raise HTTPException(status_code=415, detail=str(e))
     
-    # Обновляем путь к фото в БД
+    # Обновляем путь к фото в БД, уменьшенные копии сделает фоновый воркер
     photo_url = f"/uploads/{filename}"
-    await FundRepository.update_fund(fund_id, SFundPhotoUpdate(photo_url=photo_url))
+    await FundRepository.update_fund(fund_id, SFundPhotoUpdate(photo_url=photo_url, photo_variants=None))
+    media_worker.enqueue(fund_id, filename)
     
     return {"success": True, "photo_url": photo_url}
 
 
 @router.post("/{fund_id}/donate", response_model=SFund)
-async def donate_to_fund(fund_id: int, donation: SFundDonate):
+async def donate_to_fund(
+    fund_id: int,
+    donation: SFundDonate,
+    response: Response,
+    idempotency_key: str | None = Header(
+        None, min_length=1, max_length=64, description="Повтор с тем же ключом не учитывается второй раз"
+    ),
+    current_user: UserOrm | None = Depends(get_optional_user),
+):
     try:
-        fund = await FundRepository.add_donation(fund_id, donation.amount)
-        return SFund.model_validate(fund)
+        fund, donation_status = await donation_engine.donate(
+            fund_id,
+            donation.amount,
+            user_id=current_user.id if current_user else None,
+            tx_hash=donation.tx_hash,
+            idempotency_key=idempotency_key,
+        )
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    if donation_status == "conflict":
+        raise HTTPException(
+            status_code=422,
+            detail="Idempotency-Key уже использован для другого пожертвования",
+        )
+    if donation_status == "replayed":
+        response.headers["Idempotent-Replayed"] = "true"
+    return SFund.model_validate(fund)
+
+
+@router.post("/{fund_id}/deploy", response_model=SFund, dependencies=[Depends(require_admin)])
+async def retry_fund_deploy(fund_id: int):
+    # Повторная постановка в очередь после deploy_status failed, только для администратора
+    try:
+        await FundRepository.get_fund_by_id(fund_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    try:
+        fund = await DeploymentRepository.requeue(fund_id)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    fund_deployer.wake()
+    return SFund.model_validate(fund)
 
 
 @router.patch("/{fund_id}", response_model=SFund)
@@ -0,0 +1,100 @@
+from fastapi import APIRouter, Depends, HTTPException
+from database import pool_snapshot, replicas
+from utils.passwords import password_hasher
+from utils.uploads import uploads_index
+from utils.response_cache import funds_cache
+from utils.fund_events import fund_events
+from utils.deployer import fund_deployer
+from utils.onchain import onchain_reader
+from utils.revocation import refresh_token_sweeper
+from utils.admission import admission
+from utils.startup import startup_timer
+from utils.profiling import profiling
+from utils.security import require_admin
+
+
+
+
+router = APIRouter(
+    prefix="/system",
+    tags=['Система'],
+    dependencies=[Depends(require_admin)],
+)
+
+
+def require_profiling():
+    if not profiling.enabled:
+        raise HTTPException(status_code=404, detail="Профилирование выключено")
+
+
+@router.get("/password-hasher")
+async def get_password_hasher_stats():
+    return password_hasher.snapshot()
+
+
+@router.get("/uploads")
+async def get_uploads_stats():
+    return uploads_index.snapshot()
+
+
+@router.get("/response-cache")
+async def get_response_cache_stats():
+    return funds_cache.snapshot()
+
+
+@router.get("/fund-events")
+async def get_fund_events_stats():
+    return fund_events.snapshot()
+
+
+@router.get("/deployer")
+async def get_deployer_stats():
+    return fund_deployer.snapshot()
+
+
+@router.get("/onchain")
+async def get_onchain_stats():
+    return onchain_reader.snapshot()
+
+
+@router.get("/refresh-tokens")
+async def get_refresh_token_stats():
+    return refresh_token_sweeper.snapshot()
+
+
+@router.get("/admission")
+async def get_admission_stats():
+    return admission.snapshot()
+
+
+@router.get("/pool")
+async def get_pool_stats():
+    return pool_snapshot()
+
+
+@router.get("/replicas")
+async def get_replicas_stats():
+    return replicas.snapshot()
+
+
+@router.get("/startup")
+async def get_startup_stats():
+    return startup_timer.snapshot()
+
+
+@router.get("/profiles", dependencies=[Depends(require_profiling)])
+async def get_profiles():
+    return profiling.snapshot()
+
+
+@router.get("/profiles/{profile_id}", dependencies=[Depends(require_profiling)])
+async def get_profile(profile_id: int):
+    profile = profiling.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Профиль не найден или вытеснен из буфера")
+    return profile.snapshot()
+
+
+@router.get("/slow-queries", dependencies=[Depends(require_profiling)])
+async def get_slow_queries():
+    return list(reversed(profiling.slow_queries))
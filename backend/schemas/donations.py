@@ -0,0 +1,28 @@
+from pydantic import BaseModel, Field, ConfigDict
+from datetime import datetime
+from schemas.funds import SFund
+
+
+
+
+class SDonation(BaseModel):
+    """Запись журнала пожертвований"""
+    id: int
+    fund_id: int
+    user_id: int | None = None
+    amount: int
+    tx_hash: str | None = None
+    created_at: datetime
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class SDonationPage(BaseModel):
+    items: list[SDonation]
+    next_cursor: str | None = Field(None, description="Курсор следующей страницы, null - страниц больше нет")
+
+
+class SDonatedFund(SFund):
+    """Фонд, которому пользователь жертвовал"""
+    my_amount: int = Field(description="Сколько всего пожертвовал пользователь")
+    my_donations: int = Field(description="Число пожертвований пользователя")
@@ -1,11 +1,20 @@
 from pydantic import BaseModel, Field, ConfigDict, field_validator, computed_field
 from datetime import datetime, timezone
+from typing import Literal
 
 
 
 
+FundOrderBy = Literal['created_at', 'target_date', 'collected', 'progress']
+FundOrder = Literal['asc', 'desc']
+FundStatus = Literal['active', 'expired']
+FundExportFormat = Literal['ndjson', 'csv']
+DeployStatus = Literal['pending', 'submitted', 'deployed', 'failed']
+
+
 class SFundDonate(BaseModel):
     amount: int = Field(gt=0, description="Сумма пожертвования")
+    tx_hash: str | None = Field(None, max_length=66, description="Хэш транзакции, если пожертвование прошло в блокчейне")
 
 
 class SFundBase(BaseModel):
@@ -15,7 +24,7 @@ class SFundBase(BaseModel):
     target: int = Field(gt=0)
     collected: int = Field(default=0, ge=0)
     donate_count: int = Field(default=0, ge=0)
-    photo_url: str | None = Field(None, description="URL изображения формата /uploads/{fund_id}.jpg")
+    photo_url: str | None = Field(None, description="URL оригинала изображения формата /uploads/{sha256}.{ext}")
     target_date: datetime = Field(description="Дата окончания сбора в формате ISO 8601")
     location: str | None = Field(None, description="Географическая локация проекта")
     team_info: str | None = Field(None, description="Информация о команде")
@@ -24,14 +33,38 @@ class SFundBase(BaseModel):
     
     @field_validator('target_date')
     def validate_target_date(cls, v):
+        if v.tzinfo is None:
+            # Дата без часового пояса (например 2030-01-01 из CSV) считается в UTC
+            v = v.replace(tzinfo=timezone.utc)
         if v < datetime.now(timezone.utc):
             raise ValueError("Дата окончания не может быть в прошлом")
         return v
 
 
+class SFundImport(SFundBase):
+    """Строка массового импорта; NOT NULL поля модели по умолчанию пустые"""
+    location: str = ""
+    team_info: str = ""
+    link: str = ""
+    contract_address: str = ""
+
+
+class SFundImportError(BaseModel):
+    line: int = Field(description="Номер строки в теле запроса, для CSV считая заголовок")
+    errors: list[str]
+
+
+class SFundImportReport(BaseModel):
+    inserted: int
+    failed: int
+    errors: list[SFundImportError] = Field(description="Ошибки по строкам, не больше BULK_IMPORT_MAX_ERRORS")
+    errors_truncated: bool = False
+
+
 class SFundPhotoUpdate(BaseModel):
     """Схема только для обновления фото"""
-    photo_url: str | None = Field(None, description="URL изображения формата /uploads/{fund_id}.jpg")
+    photo_url: str | None = Field(None, description="URL оригинала изображения формата /uploads/{sha256}.{ext}")
+    photo_variants: dict[str, str] | None = None
 
 
 class SFundUpdate(SFundBase):
@@ -54,11 +87,27 @@ class SFund(SFundBase):
     """Схема для отображения фонда"""
     id: int
     created_at: datetime
+    photo_variants: dict[str, str] | None = Field(
+        None, description="Уменьшенные копии фото: thumb/card/full в webp и jpg, например card_webp"
+    )
+    deploy_status: DeployStatus | None = Field(
+        None, description="Развертывание контракта кампании; null - адрес задан вручную"
+    )
+    deploy_tx_hash: str | None = Field(None, description="Транзакция createCampaign")
+    deploy_error: str | None = Field(None, description="Почему развертывание не удалось или повторяется")
+    
+    @field_validator('target_date')
+    def validate_target_date(cls, v):
+        # При отдаче фонда дата в прошлом допустима: сбор просто завершен
+        return v
     
     @computed_field
     @property
     def days_left(self) -> int:
-        return (self.target_date - datetime.now(timezone.utc)).days
+        target_date = self.target_date
+        if target_date.tzinfo is None:
+            target_date = target_date.replace(tzinfo=timezone.utc)
+        return (target_date - datetime.now(timezone.utc)).days
 
     model_config = ConfigDict(
         from_attributes=True,
@@ -81,4 +130,74 @@ class SFund(SFundBase):
                 "contract_address": "0x71C7656EC7ab88b098defB751B7401B5f6d8976F"
             }
         }
-    )
\ No newline at end of file
+    )
+
+
+class SFundPage(BaseModel):
+    """Страница листинга фондов"""
+    items: list[SFund]
+    next_cursor: str | None = Field(None, description="Курсор следующей страницы, null - страниц больше нет")
+
+
+
+class SFundStats(BaseModel):
+    """Агрегаты по набору фондов"""
+    fund_count: int
+    total_collected: int
+    total_target: int
+    donation_count: int = Field(description="Число пожертвований (не уникальных жертвователей)")
+
+
+class SCategoryStats(SFundStats):
+    id: int
+    category: str
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class SPlatformStats(BaseModel):
+    platform: SFundStats
+    categories: list[SCategoryStats]
+    top_funds: list[SFund] = Field(description="Фонды с наибольшей долей собранного")
+
+
+class SFundSearchHit(BaseModel):
+    """Найденный фонд"""
+    fund: SFund
+    rank: float = Field(description="Релевантность, больше - выше в выдаче")
+    match: Literal['fulltext', 'fuzzy'] = Field(description="fuzzy - совпадение с опечаткой по триграммам")
+    title_highlight: str = Field(description="Название, найденные слова в <mark>, остальной текст HTML-экранирован")
+    snippet: str = Field(description="Фрагмент описания с подсветкой в том же формате")
+
+
+class SFundSearchResults(BaseModel):
+    items: list[SFundSearchHit]
+
+
+class SSpendingRequest(BaseModel):
+    """Запрос на расходование средств кампании"""
+    id: int
+    description_hash: str
+    amount: str = Field(description="Сумма в wei")
+    recipient: str
+    executed: bool
+    approval_votes: str = Field(description="Голоса за, в wei пожертвований")
+
+
+class SFundOnchain(BaseModel):
+    """Состояние контракта кампании на одном блоке; суммы в wei строками"""
+    fund_id: int
+    address: str
+    block_number: int
+    goal: str
+    deadline: int = Field(description="Unix-время окончания сбора")
+    total_donated: str
+    total_spent: str
+    available: str = Field(description="total_donated - total_spent")
+    balance: str
+    goal_reached: bool
+    status: str
+    next_request_id: int
+    spending_requests: list[SSpendingRequest] | None = Field(
+        None, description="Последние запросы на расходование, новые сверху; только для одного фонда"
+    )
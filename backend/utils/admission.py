@@ -0,0 +1,264 @@
+"""Допуск запросов к дорогим ручкам: частота по клиенту и параллельность по воркеру.
+
+Ручки разбиты на классы (ROUTE_CLASSES). Для каждого класса:
+
+- token bucket на клиента: пользователь из валидного access-токена, иначе IP.
+  Пустое ведро - сразу 429 с Retry-After до появления токена;
+- предел одновременно обрабатываемых запросов на воркер. Сверх него -
+  сразу 503 с Retry-After: запрос не встает в очередь и не занимает
+  соединение с базой, а остальные ручки воркера продолжают отвечать.
+
+Ведра хранятся как pubsub: local - в памяти процесса (один воркер,
+разработка), postgres - в таблице rate_limit_buckets, общей для всех
+воркеров. За прокси IP клиента берется из scope, поэтому uvicorn нужно
+запускать с --proxy-headers.
+"""
+import time
+import math
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import NamedTuple
+from starlette.responses import JSONResponse
+from starlette.routing import compile_path
+from repositories.rate_limits import RateLimitRepository
+from utils.metrics import ADMISSION_REJECTED
+from config import settings
+
+
+
+
+logger = logging.getLogger(__name__)
+
+# (метод, шаблон пути) -> класс ручек
+ROUTE_CLASSES = {
+    ('POST', '/auth/login'): 'auth',
+    ('POST', '/auth/register'): 'auth',
+    ('POST', '/funds/{fund_id}/upload-photo'): 'upload',
+    ('POST', '/funds/{fund_id}/donate'): 'donate',
+    ('POST', '/funds/'): 'deploy',
+    ('POST', '/funds/bulk'): 'deploy',
+    ('POST', '/funds/{fund_id}/deploy'): 'deploy',
+}
+
+
+class RouteLimit(NamedTuple):
+    rate: float  # токенов в секунду
+    burst: int
+    max_in_flight: int
+
+
+def limits_from_settings() -> dict[str, RouteLimit]:
+    return {
+        route_class: RouteLimit(
+            rate=getattr(settings, f'rate_limit_{route_class}_per_minute') / 60,
+            burst=getattr(settings, f'rate_limit_{route_class}_burst'),
+            max_in_flight=getattr(settings, f'max_in_flight_{route_class}'),
+        )
+        for route_class in set(ROUTE_CLASSES.values())
+    }
+
+
+class LocalRateLimiter:
+    """Ведра в памяти процесса, LRU на max_keys клиентов.
+
+    Вытесненное ведро при следующем запросе начинается полным, то есть
+    ошибка всегда в пользу клиента.
+    """
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        """0 - токен взят, иначе через сколько секунд он появится."""
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.get(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated_at) * rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return 0.0 if allowed else (1 - tokens) / rate
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    async def start(self, idle_after: float):
+        pass
+
+    async def stop(self):
+        pass
+
+
+class PostgresRateLimiter:
+    """Ведра в таблице rate_limit_buckets: один UPSERT на запрос к ограниченной ручке."""
+
+    def __init__(self, cleanup_interval: float = 60, cleanup_batch: int = 5000):
+        self.cleanup_interval = cleanup_interval
+        self.cleanup_batch = cleanup_batch
+        self._task: asyncio.Task | None = None
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        return await RateLimitRepository.take(key, rate, burst, time.time())
+
+    def __len__(self) -> int:
+        return 0
+
+    async def start(self, idle_after: float):
+        self._task = asyncio.create_task(self._cleanup_loop(idle_after))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _cleanup_loop(self, idle_after: float):
+        while True:
+            await asyncio.sleep(self.cleanup_interval)
+            try:
+                while await RateLimitRepository.delete_idle(time.time() - idle_after, self.cleanup_batch) == self.cleanup_batch:
+                    await asyncio.sleep(0)
+            except Exception:
+                logger.exception('Не удалось удалить неактивные ведра ограничения частоты')
+
+
+def create_rate_limiter():
+    database_url = settings.database_url or ''
+    backend = settings.rate_limit_backend or ('postgres' if database_url.startswith('postgresql') else 'local')
+    if backend == 'postgres':
+        return PostgresRateLimiter()
+    return LocalRateLimiter(settings.rate_limit_max_keys)
+
+
+def client_key(scope) -> str:
+    # Пользователь - только из токена с верной подписью: иначе поддельными
+    # токенами ведра можно было бы плодить без конца
+    for name, value in scope['headers']:
+        if name == b'authorization':
+            scheme, _, token = value.decode('latin-1').partition(' ')
+            if scheme.lower() == 'bearer' and token:
+                from jose import jwt, JWTError
+
+                try:
+                    payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
+                    if payload.get('sub'):
+                        return f"user:{payload['sub']}"
+                except JWTError:
+                    pass
+            break
+    client = scope.get('client')
+    return f'ip:{client[0] if client else "unknown"}'
+
+
+class AdmissionController:
+    def __init__(self, limiter, limits: dict[str, RouteLimit]):
+        self.limiter = limiter
+        self.limits = limits
+        self.in_flight = dict.fromkeys(limits, 0)
+        self.admitted = dict.fromkeys(limits, 0)
+        self.rejected = {route_class: {'rate': 0, 'in_flight': 0} for route_class in limits}
+        self.limiter_errors = 0
+        # Классифицируются только методы из таблицы, остальные запросы проходят без регулярок
+        self._routes: dict[str, list] = {}
+        for (method, path), route_class in ROUTE_CLASSES.items():
+            path_regex, _, _ = compile_path(path)
+            self._routes.setdefault(method, []).append((path_regex, route_class))
+
+    def classify(self, method: str, path: str) -> str | None:
+        for path_regex, route_class in self._routes.get(method, ()):
+            if path_regex.match(path):
+                return route_class
+        return None
+
+    async def admit(self, route_class: str, key: str) -> tuple[int, str, float] | None:
+        """Занимает место в классе; None - запрос допущен, иначе (статус, причина, Retry-After)."""
+        limit = self.limits[route_class]
+        if self.in_flight[route_class] >= limit.max_in_flight:
+            return self._reject(route_class, 'in_flight', 503, 'Сервер перегружен, повторите позже', 1)
+
+        # Место занимаем до похода за ведром, чтобы параллельные запросы не проскочили предел
+        self.in_flight[route_class] += 1
+        try:
+            retry_after = await self.limiter.take(f'{route_class}:{key}', limit.rate, limit.burst)
+        except Exception:
+            # Недоступное хранилище ведер не должно ронять сами ручки
+            self.limiter_errors += 1
+            logger.exception('Не удалось проверить ограничение частоты')
+            retry_after = 0.0
+        if retry_after > 0:
+            self.in_flight[route_class] -= 1
+            return self._reject(route_class, 'rate', 429, 'Слишком много запросов, повторите позже', retry_after)
+        self.admitted[route_class] += 1
+        return None
+
+    def release(self, route_class: str):
+        self.in_flight[route_class] -= 1
+
+    def _reject(self, route_class: str, reason: str, status: int, detail: str, retry_after: float):
+        self.rejected[route_class][reason] += 1
+        ADMISSION_REJECTED.inc(route_class, reason)
+        return status, detail, retry_after
+
+    async def start(self):
+        # Ведро без обращений дольше полного пополнения можно удалить
+        await self.limiter.start(max(limit.burst / limit.rate for limit in self.limits.values()))
+
+    async def stop(self):
+        await self.limiter.stop()
+
+    def snapshot(self) -> dict:
+        return {
+            'enabled': settings.rate_limit_enabled,
+            'backend': type(self.limiter).__name__,
+            'buckets': len(self.limiter),
+            'limiter_errors': self.limiter_errors,
+            'classes': {
+                route_class: {
+                    'per_minute': round(limit.rate * 60, 3),
+                    'burst': limit.burst,
+                    'max_in_flight': limit.max_in_flight,
+                    'in_flight': self.in_flight[route_class],
+                    'admitted': self.admitted[route_class],
+                    'rejected': self.rejected[route_class],
+                }
+                for route_class, limit in self.limits.items()
+            },
+        }
+
+
+class AdmissionMiddleware:
+    """ASGI-middleware перед ручками: отказ уходит до разбора тела и до базы."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not settings.rate_limit_enabled:
+            await self.app(scope, receive, send)
+            return
+        route_class = admission.classify(scope['method'], scope['path'])
+        if route_class is None:
+            await self.app(scope, receive, send)
+            return
+
+        rejection = await admission.admit(route_class, client_key(scope))
+        if rejection is not None:
+            status, detail, retry_after = rejection
+            response = JSONResponse(
+                {'detail': detail},
+                status_code=status,
+                headers={'Retry-After': str(max(1, math.ceil(retry_after)))},
+            )
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            admission.release(route_class)
+
+
+admission = AdmissionController(create_rate_limiter(), limits_from_settings())
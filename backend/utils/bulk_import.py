@@ -0,0 +1,205 @@
+"""Массовый импорт фондов из NDJSON или CSV.
+
+Тело запроса читается потоком: строки валидируются и вставляются пачками
+по BULK_IMPORT_CHUNK, так что в памяти не больше одной пачки при любом
+размере файла. Каждая пачка - своя транзакция с одним многострочным
+INSERT ... RETURNING. Ошибочные строки попадают в отчет с номером строки,
+остальные вставляются.
+"""
+import csv
+import logging
+from typing import AsyncIterable, AsyncIterator, Literal
+import orjson
+from pydantic import ValidationError
+from sqlalchemy.exc import DBAPIError
+from schemas.funds import SFundImport, SFundImportError, SFundImportReport
+from repositories.funds import FundRepository
+from config import settings
+
+
+
+
+logger = logging.getLogger(__name__)
+
+ImportFormat = Literal['ndjson', 'csv']
+
+IMPORT_FORMATS: dict[str, ImportFormat] = {
+    'application/x-ndjson': 'ndjson',
+    'application/jsonl': 'ndjson',
+    'text/csv': 'csv',
+}
+MAX_LINE_BYTES = 1024 * 1024
+REQUIRED_COLUMNS = {name for name, field in SFundImport.model_fields.items() if field.is_required()}
+
+# (номер строки, словарь полей или None, ошибка или None)
+Record = tuple[int, dict | None, str | None]
+
+
+async def read_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[tuple[int, bytes | None]]:
+    """Режет поток на строки; вместо слишком длинной строки отдает None."""
+    buffer = bytearray()
+    number = 0
+    oversized = False
+    async for chunk in chunks:
+        buffer += chunk
+        start = 0
+        while (end := buffer.find(b'\n', start)) != -1:
+            number += 1
+            yield number, None if oversized else bytes(buffer[start:end]).rstrip(b'\r')
+            oversized = False
+            start = end + 1
+        del buffer[:start]
+        if len(buffer) > MAX_LINE_BYTES:
+            # Остаток строки до перевода строки пропускаем, не накапливая
+            oversized = True
+            buffer.clear()
+    if buffer or oversized:
+        yield number + 1, None if oversized else bytes(buffer).rstrip(b'\r')
+
+
+async def ndjson_records(lines: AsyncIterator[tuple[int, bytes | None]]) -> AsyncIterator[Record]:
+    async for number, line in lines:
+        if line is None:
+            yield number, None, 'Строка длиннее 1 МБ'
+            continue
+        if not line.strip():
+            continue
+        try:
+            value = orjson.loads(line)
+        except orjson.JSONDecodeError as e:
+            yield number, None, f'Некорректный JSON: {e}'
+            continue
+        if not isinstance(value, dict):
+            yield number, None, 'Ожидается JSON-объект'
+            continue
+        yield number, value, None
+
+
+async def csv_records(lines: AsyncIterator[tuple[int, bytes | None]]) -> AsyncIterator[Record]:
+    """Строки CSV с заголовком; поле в кавычках может занимать несколько строк.
+
+    Пустое значение - поле не задано, для него берется значение по умолчанию.
+    Колонки, которых нет в схеме импорта (например id из экспорта), пропускаются.
+    """
+    header = None
+    pending: list[str] = []
+    quotes = 0
+    first = 0
+    async for number, line in lines:
+        if line is None:
+            yield number, None, 'Строка длиннее 1 МБ'
+            pending, quotes = [], 0
+            continue
+        try:
+            text = line.decode('utf-8-sig' if number == 1 else 'utf-8')
+        except UnicodeDecodeError:
+            yield number, None, 'Строка не в UTF-8'
+            continue
+
+        if not pending:
+            first = number
+        pending.append(text)
+        # Нечетное число кавычек - перевод строки внутри поля, запись продолжается
+        quotes += text.count('"')
+        if quotes % 2:
+            continue
+        record = '\n'.join(pending)
+        pending, quotes = [], 0
+        if not record.strip():
+            continue
+
+        values = next(csv.reader([record]))
+        if header is None:
+            header = values
+            missing = REQUIRED_COLUMNS - set(header)
+            if missing:
+                raise ValueError(f'В заголовке CSV нет колонок: {", ".join(sorted(missing))}')
+            continue
+        if len(values) != len(header):
+            yield first, None, f'Ожидалось {len(header)} колонок, получено {len(values)}'
+            continue
+        yield first, {name: value for name, value in zip(header, values) if value != ''}, None
+
+    if pending:
+        yield first, None, 'Незакрытая кавычка в конце файла'
+    if header is None:
+        raise ValueError('Пустой CSV: нет заголовка')
+
+
+def validation_messages(error: ValidationError) -> list[str]:
+    return [
+        f"{'.'.join(str(part) for part in item['loc'])}: {item['msg']}" if item['loc'] else item['msg']
+        for item in error.errors()
+    ]
+
+
+class FundImport:
+    """Один импорт: копит пачку валидных строк и отчет об ошибках."""
+
+    def __init__(self, category_ids: set[int], deploy: bool = False):
+        self.category_ids = category_ids
+        self.deploy = deploy
+        self.report = SFundImportReport(inserted=0, failed=0, errors=[])
+        self.rows: list[dict] = []
+        self.lines: list[int] = []
+
+    def fail(self, line: int, messages: list[str]):
+        self.report.failed += 1
+        if len(self.report.errors) < settings.bulk_import_max_errors:
+            self.report.errors.append(SFundImportError(line=line, errors=messages))
+        else:
+            self.report.errors_truncated = True
+
+    async def add(self, line: int, value: dict):
+        try:
+            fund = SFundImport.model_validate(value)
+        except ValidationError as e:
+            self.fail(line, validation_messages(e))
+            return
+        if fund.category_id not in self.category_ids:
+            self.fail(line, [f'category_id: категория {fund.category_id} не найдена'])
+            return
+        self.rows.append(fund.model_dump())
+        self.lines.append(line)
+        if len(self.rows) >= settings.bulk_import_chunk:
+            await self.flush()
+
+    async def flush(self):
+        rows, lines = self.rows, self.lines
+        self.rows, self.lines = [], []
+        await self.insert(rows, lines)
+
+    async def insert(self, rows: list[dict], lines: list[int]):
+        if not rows:
+            return
+        try:
+            funds = await FundRepository.create_funds(rows, deploy=self.deploy)
+        except DBAPIError as e:
+            # Пачка откатилась целиком, например из-за значения вне диапазона колонки.
+            # Делим пополам, пока не останутся только плохие строки
+            if len(rows) == 1:
+                logger.warning('Строка %s импорта не вставлена: %s', lines[0], e.orig)
+                self.fail(lines[0], [f'Ошибка базы данных: {e.orig}'])
+                return
+            middle = len(rows) // 2
+            await self.insert(rows[:middle], lines[:middle])
+            await self.insert(rows[middle:], lines[middle:])
+            return
+        self.report.inserted += len(funds)
+
+
+async def import_funds(chunks: AsyncIterable[bytes], import_format: ImportFormat, deploy: bool = False) -> SFundImportReport:
+    """Импортирует фонды из потока байтов. ValueError - если файл нельзя разобрать целиком.
+
+    deploy - фонды без contract_address встают в очередь развертывания кампаний.
+    """
+    lines = read_lines(chunks)
+    records = csv_records(lines) if import_format == 'csv' else ndjson_records(lines)
+    bulk = FundImport(await FundRepository.get_category_ids(), deploy)
+    async for line, value, error in records:
+        if error is not None:
+            bulk.fail(line, [error])
+        else:
+            await bulk.add(line, value)
+    await bulk.flush()
+    return bulk.report
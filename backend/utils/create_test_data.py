@@ -1,24 +1,26 @@
+import random
 from datetime import datetime, timedelta, timezone
 from database import new_session
+from sqlalchemy import select, insert, func
 from models.funds import FundOrm, CategoryOrm
+from repositories.stats import FundStatsRepository
+from utils.migrations import CATEGORIES
 
 
 
 
-async def create_test_data():
+async def create_test_data() -> bool:
+    """Добавляет тестовые фонды, если фондов в базе еще нет.
+
+    Повторный запуск ничего не меняет. Категории создает миграция.
+    """
     async with new_session() as session:
-        categories = [
-            CategoryOrm(category="Дети"),
-            CategoryOrm(category="Здоровье"),
-            CategoryOrm(category="Животные"),
-            CategoryOrm(category="Образование"),
-            CategoryOrm(category="Экология"),
-            CategoryOrm(category="Социальная помощь"),
-            CategoryOrm(category="Другое")
-        ]
-        
-        session.add_all(categories)
-        await session.flush()
+        if await session.scalar(select(FundOrm.id).limit(1)) is not None:
+            return False
+
+        result = await session.execute(select(CategoryOrm).order_by(CategoryOrm.id))
+        by_name = {category.category: category for category in result.scalars()}
+        categories = [by_name[name] for name in CATEGORIES]
         
         now = datetime.now(timezone.utc)
         
@@ -110,4 +112,62 @@ async def create_test_data():
         ]
         
         session.add_all(funds)
-        await session.commit()
\ No newline at end of file
+        await session.commit()
+    
+    # Фонды добавлены мимо FundRepository, поэтому статистику считаем целиком
+    await FundStatsRepository.rebuild()
+    return True
+
+
+WORDS = (
+    'помощь дети сироты больница лечение животные приют корм школа образование книги экология лес река '
+    'парк уборка пожилые люди продукты лекарства волонтеры реабилитация операция инвалиды коляска спорт '
+    'площадка музыка театр библиотека компьютеры ремонт крыша храм памятник собаки кошки лошади птицы'
+).split()
+CITIES = ['Москва', 'Санкт-Петербург', 'Казань', 'Новосибирск', 'Екатеринбург', 'Самара', 'Пермь', 'Томск']
+
+
+async def create_bulk_test_data(count: int, batch: int = 5000, seed: int = 0) -> int:
+    """Догружает сгенерированные фонды, пока их в базе не станет count.
+
+    С одним seed данные одинаковые от запуска к запуску, поэтому на них
+    можно сравнивать замеры. Возвращает число добавленных фондов.
+    """
+    async with new_session() as session:
+        existing = await session.scalar(select(func.count()).select_from(FundOrm))
+        category_ids = list((await session.execute(select(CategoryOrm.id).order_by(CategoryOrm.id))).scalars())
+    if existing >= count:
+        return 0
+
+    rng = random.Random()
+    now = datetime.now(timezone.utc)
+
+    def words(number: int) -> str:
+        return ' '.join(rng.choice(WORDS) for _ in range(number))
+
+    for start in range(existing, count, batch):
+        rows = []
+        for number in range(start, min(start + batch, count)):
+            # Свой seed у каждого фонда: догрузка дает те же фонды, что и загрузка с нуля
+            rng.seed(seed * 10_000_019 + number)
+            target = rng.randrange(50_000, 2_000_000, 1000)
+            rows.append({
+                'category_id': category_ids[number % len(category_ids)],
+                'title': words(3).capitalize(),
+                'description': words(25).capitalize(),
+                'target': target,
+                'collected': rng.randrange(0, target),
+                'donate_count': rng.randrange(0, 500),
+                'target_date': now + timedelta(days=rng.randrange(1, 365)),
+                'location': f'{rng.choice(CITIES)}, Россия',
+                'team_info': words(4),
+                'link': 'https://example.com',
+                'contract_address': f'0x{number:040x}',
+                'created_at': now - timedelta(minutes=number),
+            })
+        async with new_session() as session:
+            await session.execute(insert(FundOrm), rows)
+            await session.commit()
+
+    await FundStatsRepository.rebuild()
+    return count - existing
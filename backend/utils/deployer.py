@@ -0,0 +1,454 @@
+"""Очередь развертывания кампаний фондов через PlatformRegistry.createCampaign.
+
+POST /funds/ без contract_address ставит фонд в очередь (deploy_status
+pending) и сразу отвечает. Воркер подписывает createCampaign ключом
+ORGANIZATION_PRIVATE_KEY и отправляет пачку транзакций одним JSON-RPC
+batch, не дожидаясь подтверждения предыдущих: nonce выдает локальный
+NonceManager. Квитанции всех отправленных транзакций тоже запрашиваются
+одним batch; адрес кампании из события CampaignCreated записывается
+в contract_address. Транзакцию, потерянную узлом, отправляют заново ее же,
+с тем же nonce: второй кампании у фонда не появится.
+
+Подписывает один процесс на все воркеры (pg_advisory_lock), иначе
+они выдавали бы одинаковые nonce. Организация должна быть верифицирована
+в реестре (verifyOrganization). Проверка на локальном узле:
+
+    npx hardhat node   # или anvil
+    npx hardhat run scripts/deploy.js --network localhost
+    RPC_URL=http://127.0.0.1:8545 PLATFORM_REGISTRY_ADDRESS=0x... ORGANIZATION_PRIVATE_KEY=0x... \\
+        python -m utils.deployer
+"""
+import time
+import asyncio
+import logging
+from datetime import datetime, timezone
+from sqlalchemy import select, func, text
+from sqlalchemy.ext.asyncio import AsyncConnection
+from database import engine
+from repositories.deployments import DeploymentRepository
+from utils.metrics import DEPLOYMENTS
+from web3 import RpcClient, RpcError, SELECTOR_CREATE_CAMPAIGN, TOPIC_CAMPAIGN_CREATED, encode_call, decode_address
+from config import settings
+
+
+
+
+logger = logging.getLogger(__name__)
+
+# Ключ pg_advisory_lock процесса, который подписывает транзакции
+DEPLOYER_LOCK_ID = 582_002
+# target фонда хранится в ETH, цель кампании - в wei
+WEI_PER_ETH = 10 ** 18
+# Ответы узлов на повторную отправку уже принятой транзакции
+ALREADY_KNOWN = ('already known', 'known transaction', 'already imported')
+
+
+class NonceManager:
+    """Следующий nonce аккаунта без запроса к узлу на каждую транзакцию.
+
+    Синхронизируется с eth_getTransactionCount(pending) при старте и после
+    любой ошибки отправки: пропущенный nonce займет следующая транзакция.
+    """
+
+    def __init__(self):
+        self.next_nonce: int | None = None
+
+    @property
+    def synced(self) -> bool:
+        return self.next_nonce is not None
+
+    async def sync(self, rpc, address: str):
+        self.next_nonce = int(await rpc.call('eth_getTransactionCount', [address, 'pending']), 16)
+
+    def take(self) -> int:
+        nonce = self.next_nonce
+        self.next_nonce += 1
+        return nonce
+
+    def reset(self):
+        self.next_nonce = None
+
+
+class GasOracle:
+    """Цена газа и оценка газа с кэшем: на пачку транзакций - ноль или один запрос."""
+
+    def __init__(self, rpc, price_ttl: float, estimate_ttl: float, multiplier: float):
+        self.rpc = rpc
+        self.price_ttl = price_ttl
+        self.estimate_ttl = estimate_ttl
+        self.multiplier = multiplier
+        self._fees: tuple[float, dict] | None = None
+        self._estimates: dict[str, tuple[float, int]] = {}
+
+    async def fees(self) -> dict:
+        now = time.monotonic()
+        if self._fees is not None and now - self._fees[0] < self.price_ttl:
+            return self._fees[1]
+        block, priority = await self.rpc.batch([
+            ('eth_getBlockByNumber', ['latest', False]),
+            ('eth_maxPriorityFeePerGas', []),
+        ])
+        if isinstance(block, RpcError):
+            raise block
+        base_fee = block.get('baseFeePerGas')
+        if base_fee is None or isinstance(priority, RpcError):
+            # Узел без EIP-1559
+            fees = {'gasPrice': int(await self.rpc.call('eth_gasPrice'), 16)}
+        else:
+            # Запас на рост base fee в следующих блоках, пока пачка ждет включения
+            priority = int(priority, 16)
+            fees = {'maxFeePerGas': 2 * int(base_fee, 16) + priority, 'maxPriorityFeePerGas': priority}
+        self._fees = (now, fees)
+        return fees
+
+    async def estimate(self, call: dict) -> int:
+        # Кэш по функции, а не по аргументам: газ createCampaign от цели и срока не зависит
+        key = f"{call['to']}:{call['data'][:10]}"
+        now = time.monotonic()
+        cached = self._estimates.get(key)
+        if cached is not None and now - cached[0] < self.estimate_ttl:
+            return cached[1]
+        gas = int(int(await self.rpc.call('eth_estimateGas', [call]), 16) * self.multiplier)
+        self._estimates[key] = (now, gas)
+        return gas
+
+
+class FundDeployer:
+    def __init__(
+        self,
+        rpc,
+        registry_address: str = settings.platform_registry_address,
+        private_key: str | None = settings.organization_private_key,
+        poll_interval: float = settings.deployer_poll_interval,
+        batch_size: int = settings.deployer_batch_size,
+        max_in_flight: int = settings.deployer_max_in_flight,
+        resubmit_after: float = settings.deployer_resubmit_after,
+    ):
+        self.rpc = rpc
+        self.registry_address = registry_address.lower()
+        self.private_key = private_key
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self.resubmit_after = resubmit_after
+        self.nonces = NonceManager()
+        self.gas = GasOracle(
+            rpc,
+            price_ttl=settings.deployer_gas_price_ttl,
+            estimate_ttl=settings.deployer_gas_estimate_ttl,
+            multiplier=settings.deployer_gas_multiplier,
+        )
+        self.chain_id: int | None = None
+        self.leader = False
+        self.submitted = 0
+        self.deployed = 0
+        self.failed = 0
+        self.resubmitted = 0
+        self.last_error: str | None = None
+        self._account = None
+        self._wake = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._lock_connection: AsyncConnection | None = None
+        # Когда узел впервые не нашел отправленную транзакцию, по id фонда
+        self._unknown_since: dict[int, float] = {}
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.registry_address and self.private_key)
+
+    @property
+    def account(self):
+        if self._account is None:
+            from eth_account import Account
+
+            self._account = Account.from_key(self.private_key)
+        return self._account
+
+    def wake(self):
+        # Новый фонд в очереди: не ждать конца poll_interval
+        self._wake.set()
+
+    async def start(self):
+        self._task = asyncio.create_task(self.run_forever())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._lock_connection is not None:
+            await self._lock_connection.close()
+            self._lock_connection = None
+        self.leader = False
+        await self.rpc.close()
+
+    async def run_forever(self):
+        while True:
+            try:
+                await self._check_leadership()
+                if await self._acquire_leadership():
+                    await self.step()
+            except Exception as e:
+                self.last_error = str(e)
+                # Состояние узла неизвестно: nonce заново с узла
+                self.nonces.reset()
+                logger.exception('Ошибка развертывания кампаний, повтор через %s с', self.poll_interval)
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+            except TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def _acquire_leadership(self) -> bool:
+        # Блокировка сессионная и живет, пока открыто соединение: одно соединение
+        # пула занято на все время работы. На SQLite один процесс, блокировка не нужна
+        if self.leader:
+            return True
+        if engine.dialect.name != 'postgresql':
+            self.leader = True
+            return True
+        connection = await engine.connect()
+        acquired = (await connection.execute(select(func.pg_try_advisory_lock(DEPLOYER_LOCK_ID)))).scalar()
+        await connection.commit()
+        if not acquired:
+            await connection.close()
+            return False
+        self._lock_connection = connection
+        self.leader = True
+        self.nonces.reset()
+        return True
+
+    async def _check_leadership(self):
+        # Если соединение с блокировкой оборвалось, Postgres уже снял ее, и очередь
+        # может взять другой воркер: без живого соединения этот воркер не лидер
+        if self._lock_connection is None:
+            return
+        try:
+            await self._lock_connection.execute(text('SELECT 1'))
+            await self._lock_connection.commit()
+            return
+        except Exception as e:
+            self.last_error = str(e)
+            logger.warning('Соединение с блокировкой развертывания потеряно, лидерство снято: %s', e)
+        try:
+            await self._lock_connection.close()
+        except Exception:
+            pass
+        self._lock_connection = None
+        self.leader = False
+        self.nonces.reset()
+
+    async def step(self):
+        if self.chain_id is None:
+            self.chain_id = int(await self.rpc.call('eth_chainId'), 16)
+        await self.poll_receipts()
+        await self.submit_pending()
+
+    async def submit_pending(self) -> int:
+        limit = min(self.batch_size, self.max_in_flight - await DeploymentRepository.count('submitted'))
+        if limit <= 0:
+            return 0
+        funds = await DeploymentRepository.get_queue('pending', limit)
+        if not funds:
+            return 0
+        if not self.nonces.synced:
+            await self.nonces.sync(self.rpc, self.account.address)
+
+        now = datetime.now(timezone.utc)
+        fees = await self.gas.fees()
+        signed, updates = [], []
+        for fund in funds:
+            target_date = fund.target_date
+            if target_date.tzinfo is None:
+                target_date = target_date.replace(tzinfo=timezone.utc)
+            duration = int((target_date - now).total_seconds())
+            if duration <= 0:
+                updates.append(self._failed(fund.id, 'Дата окончания сбора уже прошла'))
+                continue
+            nonce = self.nonces.take()
+            tx_hash, raw = await self._sign(fund, duration, nonce, fees)
+            signed.append((fund.id, tx_hash, nonce, raw))
+
+        # Транзакция пишется до отправки: после падения процесса ее найдут по хэшу
+        # и при необходимости отправят заново ее же
+        await DeploymentRepository.update_statuses(updates + [
+            {
+                'id': fund_id,
+                'deploy_status': 'submitted',
+                'deploy_tx_hash': tx_hash,
+                'deploy_nonce': nonce,
+                'deploy_raw_tx': raw,
+                'deploy_error': None,
+            }
+            for fund_id, tx_hash, nonce, raw in signed
+        ])
+        if not signed:
+            return 0
+
+        results = await self.rpc.batch([('eth_sendRawTransaction', [raw]) for *_, raw in signed])
+        rejected = []
+        for (fund_id, *_), result in zip(signed, results):
+            if isinstance(result, RpcError) and not any(marker in result.message.lower() for marker in ALREADY_KNOWN):
+                logger.warning('Транзакция развертывания фонда %s отклонена: %s', fund_id, result)
+                rejected.append(self._pending(fund_id, str(result)))
+        if rejected:
+            # В nonce образовалась дыра: следующая пачка займет ее после синхронизации
+            self.nonces.reset()
+            await DeploymentRepository.update_statuses(rejected)
+        self.submitted += len(signed) - len(rejected)
+        DEPLOYMENTS.inc('submitted', amount=len(signed) - len(rejected))
+        return len(signed) - len(rejected)
+
+    async def poll_receipts(self) -> int:
+        funds = await DeploymentRepository.get_queue('submitted', self.max_in_flight)
+        if not funds:
+            return 0
+        receipts = await self.rpc.batch([('eth_getTransactionReceipt', [fund.deploy_tx_hash]) for fund in funds])
+        updates, missing = [], []
+        for fund, receipt in zip(funds, receipts):
+            if isinstance(receipt, RpcError):
+                logger.warning('Квитанция развертывания фонда %s: %s', fund.id, receipt)
+                continue
+            if receipt is None:
+                missing.append(fund)
+                continue
+            self._unknown_since.pop(fund.id, None)
+            address = self._campaign_address(receipt)
+            if int(receipt['status'], 16) != 1:
+                updates.append(self._failed(fund.id, 'Транзакция отменена (revert)'))
+            elif address is None:
+                updates.append(self._failed(fund.id, 'В квитанции нет события CampaignCreated'))
+            else:
+                self.deployed += 1
+                DEPLOYMENTS.inc('deployed')
+                updates.append({'id': fund.id, 'deploy_status': 'deployed', 'contract_address': address, 'deploy_error': None})
+
+        if missing:
+            # Нет квитанции: либо транзакция ждет блока, либо узел ее потерял
+            transactions = await self.rpc.batch([('eth_getTransactionByHash', [fund.deploy_tx_hash]) for fund in missing])
+            now = time.monotonic()
+            lost = []
+            for fund, transaction in zip(missing, transactions):
+                if transaction is not None:
+                    self._unknown_since.pop(fund.id, None)
+                    continue
+                if now - self._unknown_since.setdefault(fund.id, now) >= self.resubmit_after:
+                    self._unknown_since.pop(fund.id)
+                    lost.append(fund)
+            if lost:
+                updates += await self._resubmit(lost)
+
+        await DeploymentRepository.update_statuses(updates)
+        return len(updates)
+
+    async def _resubmit(self, funds: list) -> list[dict]:
+        """Отправляет потерянные узлом транзакции заново с тем же nonce.
+
+        Новый nonce дал бы вторую транзакцию createCampaign: если первая все же
+        попадет в блок, у фонда окажется две кампании. С тем же nonce в цепочку
+        попадет только одна из них. Если nonce уже занят, а квитанции нашей
+        транзакции нет, повторять нечего: фонд уходит в failed до ручной проверки.
+        """
+        mined = int(await self.rpc.call('eth_getTransactionCount', [self.account.address, 'latest']), 16)
+        updates, resend = [], []
+        for fund in funds:
+            if mined > fund.deploy_nonce:
+                updates.append(self._failed(
+                    fund.id, f'Nonce {fund.deploy_nonce} занят другой транзакцией, проверьте развертывание вручную'
+                ))
+            elif fund.deploy_raw_tx:
+                resend.append((fund.id, fund.deploy_tx_hash, fund.deploy_nonce, fund.deploy_raw_tx))
+            else:
+                # Отправлена до того, как подписанную транзакцию стали хранить: подписываем заново с тем же nonce
+                target_date = fund.target_date
+                if target_date.tzinfo is None:
+                    target_date = target_date.replace(tzinfo=timezone.utc)
+                duration = int((target_date - datetime.now(timezone.utc)).total_seconds())
+                if duration <= 0:
+                    updates.append(self._failed(fund.id, 'Дата окончания сбора уже прошла'))
+                    continue
+                tx_hash, raw = await self._sign(fund, duration, fund.deploy_nonce, await self.gas.fees())
+                resend.append((fund.id, tx_hash, fund.deploy_nonce, raw))
+                updates.append({'id': fund.id, 'deploy_tx_hash': tx_hash, 'deploy_raw_tx': raw})
+        if not resend:
+            return updates
+
+        results = await self.rpc.batch([('eth_sendRawTransaction', [raw]) for *_, raw in resend])
+        for (fund_id, *_), result in zip(resend, results):
+            if isinstance(result, RpcError) and not any(marker in result.message.lower() for marker in ALREADY_KNOWN):
+                # Остается submitted: через resubmit_after попробуем еще раз
+                logger.warning('Повторная отправка развертывания фонда %s отклонена: %s', fund_id, result)
+                updates.append({'id': fund_id, 'deploy_error': f'Повторная отправка отклонена: {result}'})
+                continue
+            self.resubmitted += 1
+            DEPLOYMENTS.inc('resubmitted')
+        return updates
+
+    async def _sign(self, fund, duration: int, nonce: int, fees: dict) -> tuple[str, str]:
+        from eth_utils import to_checksum_address
+
+        registry = to_checksum_address(self.registry_address)
+        data = encode_call(SELECTOR_CREATE_CAMPAIGN, fund.target * WEI_PER_ETH, duration)
+        gas = await self.gas.estimate({'from': self.account.address, 'to': registry, 'data': data})
+        transaction = self.account.sign_transaction({
+            'to': registry,
+            'data': data,
+            'value': 0,
+            'gas': gas,
+            'nonce': nonce,
+            'chainId': self.chain_id,
+            **fees,
+        })
+        return '0x' + transaction.hash.hex(), '0x' + transaction.raw_transaction.hex()
+
+    def _campaign_address(self, receipt: dict) -> str | None:
+        for log in receipt.get('logs', []):
+            topics = log['topics']
+            if log['address'].lower() == self.registry_address and topics and topics[0] == TOPIC_CAMPAIGN_CREATED:
+                return decode_address(topics[2])
+        return None
+
+    def _failed(self, fund_id: int, error: str) -> dict:
+        self.failed += 1
+        DEPLOYMENTS.inc('failed')
+        return {'id': fund_id, 'deploy_status': 'failed', 'deploy_error': error}
+
+    def _pending(self, fund_id: int, error: str) -> dict:
+        return {
+            'id': fund_id,
+            'deploy_status': 'pending',
+            'deploy_tx_hash': None,
+            'deploy_nonce': None,
+            'deploy_raw_tx': None,
+            'deploy_error': error,
+        }
+
+    def snapshot(self) -> dict:
+        return {
+            'configured': self.configured,
+            'running': self._task is not None,
+            'leader': self.leader,
+            'address': self.account.address if self.configured else None,
+            'chain_id': self.chain_id,
+            'next_nonce': self.nonces.next_nonce,
+            'submitted': self.submitted,
+            'deployed': self.deployed,
+            'failed': self.failed,
+            'resubmitted': self.resubmitted,
+            'last_error': self.last_error,
+        }
+
+
+fund_deployer = FundDeployer(RpcClient())
+
+
+async def main():
+    logging.basicConfig(level=logging.INFO)
+    try:
+        await fund_deployer.run_forever()
+    finally:
+        await fund_deployer.stop()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
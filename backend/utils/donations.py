@@ -0,0 +1,109 @@
+import asyncio
+import logging
+from models.funds import FundOrm
+from repositories.funds import FundRepository
+from config import settings
+
+
+
+
+logger = logging.getLogger(__name__)
+
+
+class DonationEngine:
+    """Применяет пожертвования к фондам.
+
+    Каждое пожертвование - строка журнала donations. Без батчинга оно
+    пишется сразу, с батчингом все пожертвования в один фонд, пришедшие
+    за окно `batch_window` секунд, пишутся одной транзакцией.
+
+    С `counter_shards` счетчики фонда растут в одной из шард-строк
+    fund_counters, а в funds их раз в `rollup_interval` переносит фоновая задача.
+    """
+
+    def __init__(self, batch_window: float = 0, counter_shards: int = 0, rollup_interval: float = 1):
+        self.batch_window = batch_window
+        self.counter_shards = counter_shards
+        self.rollup_interval = rollup_interval
+        self._pending: dict[int, list[tuple[dict, asyncio.Future]]] = {}
+        self._flushes: set[asyncio.Task] = set()
+        self._rollup: asyncio.Task | None = None
+
+    async def start(self):
+        if self.counter_shards > 0:
+            self._rollup = asyncio.create_task(self._rollup_loop())
+
+    async def _rollup_loop(self):
+        while True:
+            await asyncio.sleep(self.rollup_interval)
+            try:
+                await FundRepository.rollup_counters()
+            except Exception:
+                logger.exception('Не удалось перенести шарды счетчиков в фонды')
+
+    async def donate(
+        self,
+        fund_id: int,
+        amount: int,
+        user_id: int | None = None,
+        tx_hash: str | None = None,
+        idempotency_key: str | None = None,
+    ) -> tuple[FundOrm, str]:
+        """Фонд после пожертвования и статус: created, replayed или conflict."""
+        donation = {'amount': amount, 'user_id': user_id, 'tx_hash': tx_hash, 'idempotency_key': idempotency_key}
+        if self.batch_window <= 0:
+            fund, statuses = await FundRepository.add_donations(fund_id, [donation])
+            return fund, statuses[0]
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        batch = self._pending.get(fund_id)
+        if batch is None:
+            batch = self._pending[fund_id] = []
+            loop.call_later(self.batch_window, self._schedule_flush, fund_id)
+        batch.append((donation, future))
+        # shield: отмена запроса клиентом не должна отменять запись всей пачки
+        return await asyncio.shield(future)
+
+    def _schedule_flush(self, fund_id: int):
+        task = asyncio.create_task(self._flush(fund_id))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _flush(self, fund_id: int):
+        batch = self._pending.pop(fund_id, [])
+        if not batch:
+            return
+
+        try:
+            fund, statuses = await FundRepository.add_donations(fund_id, [donation for donation, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), status in zip(batch, statuses):
+            if not future.done():
+                future.set_result((fund, status))
+
+    async def drain(self):
+        # Дописываем накопленные пачки, например при выключении приложения
+        for fund_id in list(self._pending):
+            await self._flush(fund_id)
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+        if self._rollup is not None:
+            self._rollup.cancel()
+            self._rollup = None
+            try:
+                await FundRepository.rollup_counters()
+            except Exception:
+                logger.exception('Не удалось перенести шарды счетчиков в фонды')
+
+
+donation_engine = DonationEngine(
+    batch_window=settings.donation_batch_window_ms / 1000,
+    counter_shards=settings.donation_counter_shards,
+    rollup_interval=settings.donation_rollup_interval,
+)
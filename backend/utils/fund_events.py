@@ -0,0 +1,300 @@
+"""Рассылка изменений сборов фондов подписчикам: SSE и WebSocket.
+
+add_donations и update_fund после коммита отдают новое состояние фонда
+в хаб. Хаб копит последнее состояние каждого фонда и раз в
+FUND_EVENTS_INTERVAL отправляет накопленное одним сообщением pubsub,
+которое доходит до всех воркеров: всплеск пожертвований - одно сообщение.
+
+У подписчика одна ячейка с последним состоянием. Если клиент не успел
+забрать событие, новое заменяет старое, поэтому память на медленного
+клиента не растет. Клиент, который не принимает данные дольше
+FUND_EVENTS_SEND_TIMEOUT, отключается.
+"""
+import asyncio
+import logging
+from collections import defaultdict
+from contextlib import aclosing
+from typing import AsyncIterator
+import orjson
+from starlette.responses import StreamingResponse
+from starlette.websockets import WebSocket
+from utils.pubsub import pubsub
+from utils.metrics import FUND_EVENTS, FUND_EVENT_SUBSCRIBERS
+from config import settings
+
+
+
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'fund_events'
+# NOTIFY ограничен 8000 байт, состояние фонда - около сотни
+STATES_PER_MESSAGE = 50
+# Через сколько браузер переподключает оборванный EventSource
+SSE_RETRY_MS = 3000
+
+
+def fund_state(fund) -> dict:
+    return {
+        'id': fund.id,
+        'collected': fund.collected,
+        'donate_count': fund.donate_count,
+        'target': fund.target,
+        'revision': fund.revision,
+    }
+
+
+def state_order(state: dict) -> tuple[int, int]:
+    # Порядок задают сами данные, а не часы воркеров: donate_count растет с каждым
+    # пожертвованием, revision - с каждой правкой фонда, которая может его уменьшить
+    return state['revision'], state['donate_count']
+
+
+class FundSubscriber:
+    """Ячейка с последним состоянием фонда и ожидающая ее корутина.
+
+    Без wait_for и отдельного таймера на каждого: пинги раз в heartbeat
+    рассылает хаб одной задачей, иначе на 10 тысяч подписчиков уходит
+    заметная часть цикла событий.
+    """
+
+    __slots__ = ('fund_id', 'state', 'pending', 'ping', 'closed', '_waiter')
+
+    def __init__(self, fund_id: int, state: dict):
+        self.fund_id = fund_id
+        self.state = state
+        self.pending = True
+        self.ping = False
+        self.closed = False
+        self._waiter: asyncio.Future | None = None
+
+    def _wake(self):
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    def push(self, state: dict) -> bool:
+        """Кладет состояние в ячейку; True - предыдущее так и не было отправлено."""
+        coalesced = self.pending
+        self.state = state
+        self.pending = True
+        self._wake()
+        return coalesced
+
+    def heartbeat(self):
+        self.ping = True
+        self._wake()
+
+    def close(self):
+        self.closed = True
+        self._wake()
+
+    async def next(self) -> dict | None:
+        """Следующее состояние или None, если пора отправить пинг."""
+        if not (self.pending or self.ping or self.closed):
+            self._waiter = asyncio.get_running_loop().create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+        self.ping = False
+        if self.pending:
+            self.pending = False
+            return self.state
+        return None
+
+
+class FundEventHub:
+    def __init__(self, interval: float, heartbeat: float, send_timeout: float, max_subscribers: int):
+        self.interval = interval
+        self.heartbeat = heartbeat
+        self.send_timeout = send_timeout
+        self.max_subscribers = max_subscribers
+        self.subscribers: dict[int, set[FundSubscriber]] = defaultdict(set)
+        self.count = 0
+        # Порядок последнего примененного состояния по фондам с подписчиками
+        self.latest: dict[int, tuple[int, int]] = {}
+        self.published = 0
+        self.delivered = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self._pending: dict[int, dict] = {}
+        self._flusher: asyncio.Task | None = None
+        self._heartbeat: asyncio.Task | None = None
+        pubsub.subscribe(CHANNEL, self._on_message)
+
+    async def start(self):
+        self._heartbeat = asyncio.create_task(self._heartbeat_loop())
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(self.heartbeat)
+            for subscribers in self.subscribers.values():
+                for subscriber in subscribers:
+                    subscriber.heartbeat()
+
+    def full(self) -> bool:
+        return self.count >= self.max_subscribers
+
+    async def publish(self, fund):
+        self._pending[fund.id] = fund_state(fund)
+        self.published += 1
+        FUND_EVENTS.inc('published')
+        if self.interval <= 0:
+            await self.flush()
+        elif self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.interval)
+        self._flusher = None
+        await self.flush()
+
+    async def flush(self):
+        pending, self._pending = list(self._pending.values()), {}
+        for i in range(0, len(pending), STATES_PER_MESSAGE):
+            try:
+                await pubsub.publish(CHANNEL, orjson.dumps(pending[i:i + STATES_PER_MESSAGE]).decode())
+            except Exception:
+                logger.exception('Не удалось разослать события фондов')
+
+    def _on_message(self, message: str):
+        for state in orjson.loads(message):
+            fund_id = state['id']
+            subscribers = self.subscribers.get(fund_id)
+            # Сообщение приходит локально и повторно через NOTIFY, из других
+            # воркеров - в любом порядке; применяем только более новое
+            if not subscribers or state_order(state) <= self.latest[fund_id]:
+                continue
+            self.latest[fund_id] = state_order(state)
+            for subscriber in subscribers:
+                if subscriber.push(state):
+                    self.coalesced += 1
+                    FUND_EVENTS.inc('coalesced')
+
+    async def listen(self, fund) -> AsyncIterator[dict | None]:
+        """Текущее состояние фонда, затем его изменения; None - пора слать пинг.
+
+        Изменения, которые уже есть в прочитанном fund, повторно не приходят.
+        """
+        state = fund_state(fund)
+        subscriber = FundSubscriber(fund.id, state)
+        self.subscribers[fund.id].add(subscriber)
+        self.latest[fund.id] = max(self.latest.get(fund.id, state_order(state)), state_order(state))
+        self.count += 1
+        FUND_EVENT_SUBSCRIBERS.inc()
+        try:
+            while not subscriber.closed:
+                state = await subscriber.next()
+                if subscriber.closed:
+                    break
+                yield state
+                if state is not None:
+                    self.delivered += 1
+                    FUND_EVENTS.inc('delivered')
+        finally:
+            self.count -= 1
+            FUND_EVENT_SUBSCRIBERS.dec()
+            subscribers = self.subscribers[fund.id]
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self.subscribers[fund.id]
+                self.latest.pop(fund.id, None)
+
+    def drop(self):
+        self.dropped += 1
+        FUND_EVENTS.inc('dropped')
+
+    async def sse(self, fund) -> AsyncIterator[bytes]:
+        yield f'retry: {SSE_RETRY_MS}\n\n'.encode()
+        async with aclosing(self.listen(fund)) as states:
+            async for state in states:
+                if state is None:
+                    yield b': ping\n\n'
+                else:
+                    yield b'event: progress\ndata: ' + orjson.dumps(state) + b'\n\n'
+
+    async def serve_websocket(self, websocket: WebSocket, fund):
+        async def send_states() -> int:
+            async with aclosing(self.listen(fund)) as states:
+                async for state in states:
+                    if state is None:
+                        # Пинги WebSocket шлет сам сервер
+                        continue
+                    try:
+                        await asyncio.wait_for(websocket.send_text(orjson.dumps(state).decode()), self.send_timeout)
+                    except TimeoutError:
+                        self.drop()
+                        return 1013
+            # Хаб остановлен: воркер выключается
+            return 1001
+
+        async def wait_disconnect():
+            while (await websocket.receive())['type'] != 'websocket.disconnect':
+                pass
+
+        sender = asyncio.create_task(send_states())
+        receiver = asyncio.create_task(wait_disconnect())
+        try:
+            await asyncio.wait([sender, receiver], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            receiver.cancel()
+            if not sender.done():
+                sender.cancel()
+            await asyncio.gather(sender, receiver, return_exceptions=True)
+        if not sender.cancelled() and sender.exception() is None:
+            await websocket.close(code=sender.result())
+
+    def snapshot(self) -> dict:
+        return {
+            'subscribers': self.count,
+            'funds': len(self.subscribers),
+            'max_subscribers': self.max_subscribers,
+            'published': self.published,
+            'delivered': self.delivered,
+            'coalesced': self.coalesced,
+            'dropped': self.dropped,
+        }
+
+    async def stop(self):
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            self._heartbeat = None
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        await self.flush()
+        for subscribers in self.subscribers.values():
+            for subscriber in subscribers:
+                subscriber.close()
+
+
+class EventStreamResponse(StreamingResponse):
+    """text/event-stream; клиент, не принявший событие за send_timeout, отключается."""
+
+    media_type = 'text/event-stream'
+
+    def __init__(self, content: AsyncIterator[bytes], hub: FundEventHub):
+        super().__init__(content, headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+        self.hub = hub
+
+    async def stream_response(self, send):
+        await send({'type': 'http.response.start', 'status': self.status_code, 'headers': self.raw_headers})
+        try:
+            async for chunk in self.body_iterator:
+                message = {'type': 'http.response.body', 'body': chunk, 'more_body': True}
+                try:
+                    await asyncio.wait_for(send(message), self.hub.send_timeout)
+                except TimeoutError:
+                    self.hub.drop()
+                    return
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        finally:
+            await self.body_iterator.aclose()
+
+
+fund_events = FundEventHub(
+    interval=settings.fund_events_interval,
+    heartbeat=settings.fund_events_heartbeat,
+    send_timeout=settings.fund_events_send_timeout,
+    max_subscribers=settings.fund_events_max_subscribers,
+)
@@ -0,0 +1,249 @@
+"""Индексатор событий CharityCampaign и PlatformRegistry.
+
+Читает логи через eth_getLogs диапазонами блоков, по несколько диапазонов
+в одном JSON-RPC batch, и складывает события в таблицы chain_*.
+
+Запуск отдельным воркером:
+
+    python -m utils.indexer
+"""
+import asyncio
+import logging
+from collections import defaultdict
+from models.events import (
+    ChainDonationOrm, ChainRefundOrm, ChainSpendingRequestOrm, ChainRequestVoteOrm,
+    ChainRequestExecutionOrm, ChainCampaignOrm,
+)
+from repositories.events import ChainEventRepository
+from web3 import (
+    RpcClient, RpcError, CAMPAIGN_TOPICS,
+    TOPIC_DONATED, TOPIC_REQUEST_CREATED, TOPIC_REQUEST_VOTED, TOPIC_REQUEST_EXECUTED,
+    TOPIC_REFUNDED, TOPIC_CAMPAIGN_CREATED,
+    words, decode_uint, decode_address, decode_string,
+)
+from config import settings
+
+
+
+
+logger = logging.getLogger(__name__)
+
+
+ALL_TOPICS = [*CAMPAIGN_TOPICS, TOPIC_CAMPAIGN_CREATED]
+
+
+def decode_log(log: dict) -> tuple[type, dict] | None:
+    topics = log['topics']
+    if not topics:
+        return None
+    data = words(log['data'])
+    row = {
+        'contract_address': log['address'].lower(),
+        'block_number': int(log['blockNumber'], 16),
+        'block_hash': log['blockHash'],
+        'tx_hash': log['transactionHash'],
+        'log_index': int(log['logIndex'], 16),
+    }
+
+    topic = topics[0]
+    if topic == TOPIC_DONATED:
+        return ChainDonationOrm, {
+            **row, 'donor': decode_address(topics[1]), 'amount': decode_uint(data[0]), 'fee': decode_uint(data[1]),
+        }
+    if topic == TOPIC_REQUEST_CREATED:
+        return ChainSpendingRequestOrm, {
+            **row,
+            'request_id': decode_uint(topics[1]),
+            'recipient': decode_address(topics[2]),
+            'description': decode_string(log['data'], data[0]),
+            'amount': decode_uint(data[1]),
+        }
+    if topic == TOPIC_REQUEST_VOTED:
+        return ChainRequestVoteOrm, {
+            **row,
+            'request_id': decode_uint(topics[1]),
+            'voter': decode_address(topics[2]),
+            'vote_weight': decode_uint(data[0]),
+        }
+    if topic == TOPIC_REQUEST_EXECUTED:
+        return ChainRequestExecutionOrm, {**row, 'request_id': decode_uint(topics[1]), 'amount': decode_uint(data[0])}
+    if topic == TOPIC_REFUNDED:
+        return ChainRefundOrm, {**row, 'donor': decode_address(topics[1]), 'amount': decode_uint(data[0])}
+    if topic == TOPIC_CAMPAIGN_CREATED:
+        return ChainCampaignOrm, {
+            **row,
+            'campaign_id': decode_uint(topics[1]),
+            'campaign_address': decode_address(topics[2]),
+            'creator': decode_address(topics[3]),
+        }
+    return None
+
+
+class ChainIndexer:
+    def __init__(
+        self,
+        rpc,
+        registry_address: str = settings.platform_registry_address,
+        start_block: int = settings.indexer_start_block,
+        batch_blocks: int = settings.indexer_batch_blocks,
+        max_batch_blocks: int = settings.indexer_max_batch_blocks,
+        ranges_per_request: int = settings.indexer_ranges_per_request,
+        addresses_per_filter: int = settings.indexer_addresses_per_filter,
+        reorg_depth: int = settings.indexer_reorg_depth,
+        poll_interval: float = settings.indexer_poll_interval,
+    ):
+        self.rpc = rpc
+        self.registry_address = registry_address.lower()
+        self.start_block = start_block
+        self.batch_blocks = batch_blocks
+        self.max_batch_blocks = max_batch_blocks
+        self.ranges_per_request = ranges_per_request
+        self.addresses_per_filter = addresses_per_filter
+        self.reorg_depth = reorg_depth
+        self.poll_interval = poll_interval
+        self._task: asyncio.Task | None = None
+
+    async def run_forever(self):
+        while True:
+            try:
+                await self.sync_once()
+            except Exception:
+                logger.exception('Ошибка индексатора, повтор через %s с', self.poll_interval)
+            await asyncio.sleep(self.poll_interval)
+
+    async def start(self):
+        self._task = asyncio.create_task(self.run_forever())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.rpc.close()
+
+    async def sync_once(self) -> int:
+        """Догоняет цепочку до текущей головы, возвращает число обработанных блоков."""
+        head = int(await self.rpc.call('eth_blockNumber'), 16)
+        checkpoints = await ChainEventRepository.get_checkpoints()
+        if await self._rollback_reorg(checkpoints):
+            checkpoints = await ChainEventRepository.get_checkpoints()
+
+        contracts = await ChainEventRepository.get_tracked_contracts()
+        if self.registry_address:
+            contracts.add(self.registry_address)
+
+        groups: dict[int, list[str]] = defaultdict(list)
+        for address in contracts:
+            number, _ = checkpoints.get(address, (self.start_block - 1, ''))
+            groups[number].append(address)
+
+        # Самая отстающая группа догоняет следующую по чекпоинту и дальше
+        # идет вместе с ней, так что каждый блок читается одним фильтром
+        processed = 0
+        addresses: list[str] = []
+        ordered = sorted(groups.items())
+        for i, (checkpoint, group) in enumerate(ordered):
+            addresses.extend(group)
+            until = ordered[i + 1][0] if i + 1 < len(ordered) else head
+            until = min(until, head)
+            if checkpoint < until:
+                processed += await self._catch_up(sorted(addresses), checkpoint + 1, until)
+        return processed
+
+    async def _rollback_reorg(self, checkpoints: dict[str, tuple[int, str]]) -> bool:
+        known = sorted({(number, block_hash) for number, block_hash in checkpoints.values() if block_hash})
+        if not known:
+            return False
+        blocks = await self.rpc.batch([('eth_getBlockByNumber', [hex(number), False]) for number, _ in known])
+        for (number, block_hash), block in zip(known, blocks):
+            if isinstance(block, RpcError):
+                raise block
+            if block is None or block['hash'] != block_hash:
+                to_block = max(self.start_block - 1, number - self.reorg_depth)
+                logger.warning('Реорганизация на блоке %s, откат до %s', number, to_block)
+                await ChainEventRepository.rollback(to_block)
+                return True
+        return False
+
+    async def _catch_up(self, addresses: list[str], from_block: int, to_block: int) -> int:
+        chunks = [
+            addresses[i:i + self.addresses_per_filter]
+            for i in range(0, len(addresses), self.addresses_per_filter)
+        ]
+        span = self.batch_blocks
+        block = from_block
+        while block <= to_block:
+            ranges = []
+            start = block
+            while start <= to_block and len(ranges) < self.ranges_per_request:
+                end = min(start + span - 1, to_block)
+                ranges.append((start, end))
+                start = end + 1
+
+            calls = [
+                ('eth_getLogs', [{'fromBlock': hex(a), 'toBlock': hex(b), 'address': chunk, 'topics': [ALL_TOPICS]}])
+                for a, b in ranges
+                for chunk in chunks
+            ]
+            calls.append(('eth_getBlockByNumber', [hex(ranges[-1][1]), False]))
+            results = await self.rpc.batch(calls)
+
+            # Принимаем только непрерывный префикс успешных диапазонов; на ошибке
+            # "слишком много логов" уменьшаем шаг, на полном успехе увеличиваем
+            logs, last_ok = [], None
+            for i, (_, end) in enumerate(ranges):
+                replies = results[i * len(chunks):(i + 1) * len(chunks)]
+                error = next((reply for reply in replies if isinstance(reply, RpcError)), None)
+                if error is not None:
+                    if not error.too_many_results or span == 1:
+                        raise error
+                    span = max(1, span // 2)
+                    break
+                for reply in replies:
+                    logs.extend(reply)
+                last_ok = end
+            else:
+                span = min(span * 2, self.max_batch_blocks)
+
+            if last_ok is None:
+                continue
+
+            block_info = results[-1]
+            if last_ok != ranges[-1][1] or isinstance(block_info, RpcError) or block_info is None:
+                block_info = await self.rpc.call('eth_getBlockByNumber', [hex(last_ok), False])
+            await self._store(logs, addresses, last_ok, block_info['hash'])
+            block = last_ok + 1
+
+        return to_block - from_block + 1
+
+    async def _store(self, logs: list[dict], addresses: list[str], last_block: int, block_hash: str):
+        events: dict[type, list[dict]] = defaultdict(list)
+        new_contracts = {}
+        for log in logs:
+            if log.get('removed'):
+                continue
+            decoded = decode_log(log)
+            if decoded is None:
+                continue
+            model, row = decoded
+            events[model].append(row)
+            if model is ChainCampaignOrm:
+                new_contracts[row['campaign_address']] = row['block_number'] - 1
+
+        checkpoints = {address: (last_block, block_hash) for address in addresses}
+        await ChainEventRepository.save_batch(events, checkpoints, new_contracts)
+        logger.info('Проиндексировано до блока %s: %s событий', last_block, sum(map(len, events.values())))
+
+
+chain_indexer = ChainIndexer(RpcClient())
+
+
+async def main():
+    logging.basicConfig(level=logging.INFO)
+    try:
+        await chain_indexer.run_forever()
+    finally:
+        await chain_indexer.stop()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
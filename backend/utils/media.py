@@ -0,0 +1,150 @@
+import os
+import uuid
+import asyncio
+import hashlib
+import logging
+from pathlib import Path
+from fastapi import UploadFile
+from config import settings
+
+
+
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+# Варианты для фронтенда: имя -> максимальная сторона в пикселях
+PHOTO_VARIANTS = {
+    'thumb': 320,
+    'card': 800,
+    'full': 1600,
+}
+
+# Папка создается один раз при импорте, а не на каждый запрос
+Path(settings.uploads_dir).mkdir(parents=True, exist_ok=True)
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class UnsupportedImage(Exception):
+    pass
+
+
+def detect_extension(head: bytes) -> str:
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'jpg'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'gif'
+    raise UnsupportedImage('Поддерживаются только JPEG, PNG, WebP и GIF')
+
+
+async def save_upload(file: UploadFile, max_bytes: int = settings.max_upload_bytes) -> tuple[str, str]:
+    """Потоково пишет загрузку на диск, возвращает (имя файла, sha256).
+
+    Файл пишется во временный файл кусками в пуле потоков, затем атомарно
+    переименовывается в имя по хэшу содержимого: одинаковые фото
+    занимают один файл, а частично записанный файл никогда не виден.
+    """
+    digest = hashlib.sha256()
+    tmp_path = Path(settings.uploads_dir) / f'.upload-{uuid.uuid4().hex}'
+    size = 0
+    extension = None
+
+    buffer = await asyncio.to_thread(open, tmp_path, 'wb')
+    try:
+        while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+            if extension is None:
+                extension = detect_extension(chunk[:16])
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadTooLarge(f'Файл больше {max_bytes // (1024 * 1024)} МБ')
+            digest.update(chunk)
+            await asyncio.to_thread(buffer.write, chunk)
+        await asyncio.to_thread(buffer.close)
+        if extension is None:
+            raise UnsupportedImage('Пустой файл')
+
+        content_hash = digest.hexdigest()
+        filename = f'{content_hash[:32]}.{extension}'
+        await asyncio.to_thread(os.replace, tmp_path, Path(settings.uploads_dir) / filename)
+        return filename, content_hash
+    except BaseException:
+        buffer.close()
+        await asyncio.to_thread(tmp_path.unlink, True)
+        raise
+
+
+def build_variants(filename: str) -> dict[str, str]:
+    """Создает уменьшенные WebP и JPEG копии; выполняется в пуле потоков."""
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        logger.warning('Pillow не установлен, варианты фото не создаются')
+        return {}
+
+    stem = filename.rsplit('.', 1)[0]
+    variants = {}
+    with Image.open(Path(settings.uploads_dir) / filename) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+
+        for name, max_side in PHOTO_VARIANTS.items():
+            resized = image.copy()
+            resized.thumbnail((max_side, max_side))
+            for extension, options in (('webp', {'quality': 80, 'method': 4}), ('jpg', {'quality': 82, 'optimize': True, 'progressive': True})):
+                variant = f'{stem}-{name}.{extension}'
+                target = Path(settings.uploads_dir) / variant
+                if not target.exists():
+                    tmp_path = target.with_name(f'.{variant}.tmp')
+                    frame = resized.convert('RGB') if extension == 'jpg' else resized
+                    frame.save(tmp_path, format='WEBP' if extension == 'webp' else 'JPEG', **options)
+                    os.replace(tmp_path, target)
+                variants[f'{name}_{extension}'] = f'/uploads/{variant}'
+    return variants
+
+
+class MediaWorker:
+    """Фоновая очередь обработки фото, чтобы не держать HTTP-запрос."""
+
+    def __init__(self):
+        self._queue: asyncio.Queue[tuple[int, str]] = asyncio.Queue()
+        self._task: asyncio.Task | None = None
+
+    def enqueue(self, fund_id: int, filename: str):
+        self._queue.put_nowait((fund_id, filename))
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        from repositories.funds import FundRepository
+
+        while True:
+            fund_id, filename = await self._queue.get()
+            try:
+                variants = await asyncio.to_thread(build_variants, filename)
+                if variants:
+                    await FundRepository.set_photo_variants(fund_id, f'/uploads/{filename}', variants)
+            except Exception:
+                logger.exception('Не удалось обработать фото %s фонда %s', filename, fund_id)
+            finally:
+                self._queue.task_done()
+
+    async def join(self):
+        await self._queue.join()
+
+
+media_worker = MediaWorker()
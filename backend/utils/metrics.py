@@ -0,0 +1,374 @@
+"""Метрики в текстовом формате Prometheus для /metrics.
+
+Счетчики - обычные словари в памяти процесса, без блокировок: все
+обновления идут из event loop, а SQL-события - из того же потока.
+
+С несколькими воркерами uvicorn каждый воркер раз в metrics_flush_interval
+пишет свои значения в metrics_dir/<pid>.json, а /metrics складывает файлы
+всех воркеров. Счетчики и гистограммы умерших воркеров остаются в сумме,
+их gauge - нет. Папку нужно очищать при перезапуске всего приложения.
+"""
+import os
+import json
+import time
+import asyncio
+import logging
+from bisect import bisect_left
+from contextvars import ContextVar
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from database import pool_snapshot
+from config import settings
+
+
+
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+Labels = tuple[str, ...]
+
+
+def escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names: tuple[str, ...], values: Labels, extra: str = '') -> str:
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.values: dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def dump(self) -> list:
+        return [[list(labels), value] for labels, value in self.values.items()]
+
+    @staticmethod
+    def merge(total: dict[Labels, float], dumped: list):
+        for labels, value in dumped:
+            key = tuple(labels)
+            total[key] = total.get(key, 0) + value
+
+    def render(self, values: dict[Labels, float]) -> list[str]:
+        return [f'{self.name}{format_labels(self.labels, labels)} {value}' for labels, value in values.items()]
+
+
+class Gauge(Counter):
+    """Текущее значение; с несколькими воркерами складываются только живые."""
+
+    kind = 'gauge'
+
+    def dec(self, *labels: str, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) - amount
+
+    def set(self, value: float, *labels: str):
+        self.values[labels] = value
+
+
+class Histogram:
+    """Гистограмма с фиксированными границами.
+
+    На серию хранится список: число наблюдений в каждой корзине без
+    накопления (последняя - +Inf) и сумма наблюдений в конце.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        self.values: dict[Labels, list[float]] = {}
+
+    def observe(self, value: float, *labels: str):
+        series = self.values.get(labels)
+        if series is None:
+            series = self.values[labels] = [0] * (len(self.buckets) + 2)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def dump(self) -> list:
+        return [[list(labels), series] for labels, series in self.values.items()]
+
+    @staticmethod
+    def merge(total: dict[Labels, list[float]], dumped: list):
+        for labels, series in dumped:
+            key = tuple(labels)
+            current = total.get(key)
+            if current is None:
+                total[key] = list(series)
+            else:
+                for i, value in enumerate(series):
+                    current[i] += value
+
+    def render(self, values: dict[Labels, list[float]]) -> list[str]:
+        lines = []
+        for labels, series in values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), series):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f'{self.name}_bucket{format_labels(self.labels, labels, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{format_labels(self.labels, labels)} {series[-1]}')
+            lines.append(f'{self.name}_count{format_labels(self.labels, labels)} {cumulative}')
+        return lines
+
+
+class MetricsRegistry:
+    """Все метрики процесса и их сборка со всех воркеров."""
+
+    def __init__(self, directory: str | None, flush_interval: float):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.metrics: dict[str, Counter | Gauge | Histogram] = {}
+        self._collectors = []
+        self._task: asyncio.Task | None = None
+
+    def counter(self, name: str, documentation: str, labels: tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels: tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def _register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f'Метрика {metric.name} уже есть')
+        self.metrics[metric.name] = metric
+        return metric
+
+    def on_collect(self, collector):
+        # Вызывается перед выгрузкой, например чтобы выставить gauge из снимка пула
+        self._collectors.append(collector)
+        return collector
+
+    def dump(self) -> dict:
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception:
+                logger.exception('Не удалось собрать метрики')
+        return {name: metric.dump() for name, metric in self.metrics.items()}
+
+    def _path(self, pid: int) -> str:
+        return os.path.join(self.directory, f'{pid}.json')
+
+    def flush(self):
+        path = self._path(os.getpid())
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump(self.dump(), file)
+        # Замена атомарна: /metrics в другом воркере не увидит файл наполовину
+        os.replace(tmp_path, path)
+
+    def _other_workers(self) -> list[tuple[dict, bool]]:
+        # [(выгрузка воркера, жив ли он)]
+        workers = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            pid = int(name.removesuffix('.json'))
+            if pid == os.getpid():
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as file:
+                    dumped = json.load(file)
+            except (OSError, ValueError):
+                continue
+            workers.append((dumped, pid_alive(pid)))
+        return workers
+
+    def render(self) -> str:
+        workers = [(self.dump(), True)]
+        if self.directory:
+            workers += self._other_workers()
+
+        lines = []
+        for name, metric in self.metrics.items():
+            total = {}
+            for dumped, alive in workers:
+                if name in dumped and (alive or metric.kind != 'gauge'):
+                    metric.merge(total, dumped[name])
+            lines.append(f'# HELP {name} {metric.documentation}')
+            lines.append(f'# TYPE {name} {metric.kind}')
+            lines.extend(metric.render(total))
+        return '\n'.join(lines) + '\n'
+
+    async def start(self):
+        if not self.directory:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self.flush()
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+            self.flush()
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except OSError:
+                logger.exception('Не удалось записать метрики в %s', self.directory)
+
+
+def pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Процесс есть, но принадлежит другому пользователю
+        pass
+    return True
+
+
+registry = MetricsRegistry(settings.metrics_dir, settings.metrics_flush_interval)
+
+HTTP_REQUESTS = registry.counter('http_requests_total', 'HTTP-запросы по ручкам и статусам', ('method', 'route', 'status'))
+HTTP_LATENCY = registry.histogram('http_request_duration_seconds', 'Время ответа по ручкам', ('method', 'route'))
+HTTP_IN_FLIGHT = registry.gauge('http_requests_in_flight', 'Запросы в обработке')
+ADMISSION_REJECTED = registry.counter('http_admission_rejected_total', 'Запросы, отклоненные до обработки: rate - 429, in_flight - 503', ('route_class', 'reason'))
+HTTP_DB_QUERIES = registry.histogram('http_request_db_queries', 'SQL-запросов на HTTP-запрос', ('route',), COUNT_BUCKETS)
+HTTP_DB_TIME = registry.histogram('http_request_db_seconds', 'Время в базе на HTTP-запрос', ('route',))
+
+DB_QUERIES = registry.counter('db_queries_total', 'SQL-запросы по типу', ('operation',))
+DB_QUERY_TIME = registry.histogram('db_query_duration_seconds', 'Время SQL-запроса', ('operation',))
+DB_ERRORS = registry.counter('db_errors_total', 'SQL-запросы, завершившиеся ошибкой')
+
+DONATIONS = registry.counter('donations_total', 'Пожертвования, записанные в базу')
+DONATION_AMOUNT = registry.counter('donations_amount_total', 'Сумма пожертвований')
+DONATION_WRITES = registry.counter('donation_writes_total', 'Записи пожертвований в базу, пачка - одна запись')
+
+LOGINS = registry.counter('auth_logins_total', 'Попытки входа', ('result',))
+REFRESH_TOKENS = registry.counter('auth_refresh_tokens_total', 'Refresh-токены: issued, rotated, reused, invalid, expired', ('result',))
+PASSWORD_HASH_TIME = registry.histogram('password_hash_duration_seconds', 'Время bcrypt без очереди', ('operation',))
+PASSWORD_HASH_WAIT = registry.histogram('password_hash_queue_seconds', 'Ожидание свободного воркера bcrypt')
+PASSWORD_HASH_REJECTED = registry.counter('password_hash_rejected_total', 'Отказы bcrypt из-за переполненной очереди')
+
+FUND_EVENTS = registry.counter('fund_events_total', 'События фондов: published, delivered, coalesced, dropped', ('result',))
+FUND_EVENT_SUBSCRIBERS = registry.gauge('fund_event_subscribers', 'Открытые подписки SSE и WebSocket на фонды')
+
+DEPLOYMENTS = registry.counter('fund_deployments_total', 'Развертывания кампаний: submitted, deployed, failed, resubmitted', ('result',))
+ONCHAIN_READS = registry.counter('onchain_reads_total', 'Чтения состояния контрактов: hit, miss, shared', ('result',))
+
+DB_POOL_CHECKED_OUT = registry.gauge('db_pool_checked_out', 'Соединения основной базы, выданные из пула')
+DB_POOL_WAITING = registry.gauge('db_pool_waiting', 'Корутины, ждущие соединение основной базы')
+DB_POOL_WAIT_TIME = registry.gauge('db_pool_wait_seconds_total', 'Суммарное ожидание соединения основной базы')
+
+
+@registry.on_collect
+def collect_pool():
+    snapshot = pool_snapshot()
+    DB_POOL_CHECKED_OUT.set(snapshot.get('checked_out', 0))
+    DB_POOL_WAITING.set(snapshot.get('waiting', 0))
+    DB_POOL_WAIT_TIME.set(snapshot.get('wait_total_ms', 0) / 1000)
+
+
+class RequestMetrics:
+    """SQL-запросы одного HTTP-запроса."""
+
+    __slots__ = ('queries', 'db_time')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+
+
+_request_metrics: ContextVar[RequestMetrics | None] = ContextVar('request_metrics', default=None)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_started = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._metrics_started
+    operation = statement[:16].split(None, 1)[0].upper()
+    DB_QUERIES.inc(operation)
+    DB_QUERY_TIME.observe(elapsed, operation)
+    request = _request_metrics.get()
+    if request is not None:
+        request.queries += 1
+        request.db_time += elapsed
+
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(context):
+    DB_ERRORS.inc()
+
+
+class MetricsMiddleware:
+    """ASGI-middleware: время, статус и SQL-запросы каждого HTTP-запроса.
+
+    Ручка берется из шаблона пути (/funds/{fund_id}), а не из самого пути,
+    чтобы число серий не росло с числом фондов. Запросы мимо всех ручек
+    попадают в route="<unmatched>".
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not settings.metrics_enabled:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        root_path = scope.get('root_path', '')
+        request = RequestMetrics()
+        token = _request_metrics.set(request)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_metrics.reset(token)
+            HTTP_IN_FLIGHT.dec()
+            route = route_name(scope, root_path)
+            method = scope['method']
+            HTTP_REQUESTS.inc(method, route, str(status))
+            HTTP_LATENCY.observe(time.perf_counter() - started, method, route)
+            HTTP_DB_QUERIES.observe(request.queries, route)
+            HTTP_DB_TIME.observe(request.db_time, route)
+
+
+def route_name(scope, root_path: str) -> str:
+    # FastAPI кладет найденную ручку в scope['route'], Mount дописывает свой путь в root_path
+    route = scope.get('route')
+    if route is not None:
+        return route.path
+    mounted = scope.get('root_path', '')
+    if mounted != root_path:
+        return mounted[len(root_path):]
+    return '<unmatched>'
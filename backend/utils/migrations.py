@@ -0,0 +1,275 @@
+import time
+import logging
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import Awaitable, Callable
+from sqlalchemy import DateTime, select, insert, delete, func, inspect, literal, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncConnection
+from sqlalchemy.schema import CreateIndex
+from database import engine, Model
+from models.funds import FundOrm, CategoryOrm, FundCounterOrm, FundStatsOrm, SEARCH_VECTOR_SQL
+from models.donations import DonationOrm
+from models.migrations import SchemaVersionOrm
+from models.auth import RefreshTokenOrm, BlacklistedTokenOrm
+from models.rate_limits import RateLimitBucketOrm
+from repositories.auth import refresh_token_key
+from utils.revocation import token_hash
+# Модели импортируются, чтобы их таблицы попали в Model.metadata для create_all
+import models.auth
+import models.events
+import models.replication
+
+
+
+
+logger = logging.getLogger(__name__)
+
+# Ключ pg_advisory_lock, под которым один воркер применяет миграции
+MIGRATIONS_LOCK_ID = 582_001
+
+CATEGORIES = ["Дети", "Здоровье", "Животные", "Образование", "Экология", "Социальная помощь", "Другое"]
+
+
+async def get_columns(conn: AsyncConnection, table: str) -> set[str]:
+    return await conn.run_sync(lambda sync_conn: {c['name'] for c in inspect(sync_conn).get_columns(table)})
+
+
+async def create_missing_tables(conn: AsyncConnection):
+    # create_all создает только отсутствующие таблицы: на базе, созданной
+    # до появления миграций, новые колонки и индексы старых таблиц
+    # добавляют миграции 7 и 8
+    await conn.run_sync(Model.metadata.create_all)
+
+
+async def insert_categories(conn: AsyncConnection):
+    # Справочник категорий нужен и без тестовых данных: фонды ссылаются на него
+    existing = set((await conn.execute(select(CategoryOrm.category))).scalars())
+    missing = [{'category': name} for name in CATEGORIES if name not in existing]
+    if missing:
+        await conn.execute(insert(CategoryOrm), missing)
+
+
+async def create_donation_ledger(conn: AsyncConnection):
+    tables = [DonationOrm.__table__, FundCounterOrm.__table__]
+    await conn.run_sync(lambda sync_conn: Model.metadata.create_all(sync_conn, tables=tables))
+
+
+async def add_fund_columns(conn: AsyncConnection, columns: list[str]):
+    # На базе, созданной миграцией 1 по новым моделям, колонки уже есть
+    existing = await get_columns(conn, 'funds')
+    for name in columns:
+        if name not in existing:
+            column_type = FundOrm.__table__.c[name].type.compile(dialect=conn.dialect)
+            await conn.execute(text(f'ALTER TABLE funds ADD COLUMN {name} {column_type}'))
+
+
+async def add_deploy_columns(conn: AsyncConnection):
+    await add_fund_columns(conn, ['deploy_status', 'deploy_tx_hash', 'deploy_nonce', 'deploy_error'])
+    index = next(index for index in FundOrm.__table__.indexes if index.name == 'ix_funds_deploy_queue')
+    await conn.execute(CreateIndex(index, if_not_exists=True))
+
+
+async def hash_refresh_tokens(conn: AsyncConnection):
+    # Старая таблица хранила сам JWT в уникальной текстовой колонке token.
+    # Переносим строки с хэшем вместо токена: выданные токены продолжают работать
+    if 'token_hash' in await get_columns(conn, 'refresh_tokens'):
+        return
+    query = text('SELECT user_id, token, expires_at, created_at FROM refresh_tokens').columns(
+        expires_at=DateTime(timezone=True), created_at=DateTime(timezone=True)
+    )
+    rows = (await conn.execute(query)).all()
+    await conn.execute(text('DROP TABLE refresh_tokens'))
+    await conn.run_sync(lambda sync_conn: RefreshTokenOrm.__table__.create(sync_conn))
+    if rows:
+        await conn.execute(insert(RefreshTokenOrm), [
+            {
+                'user_id': user_id,
+                'token_hash': refresh_token_key(token),
+                # Старая схема держала один токен на пользователя, это и есть его сессия
+                'family_id': f'{user_id:016x}',
+                'expires_at': expires_at,
+                'created_at': created_at,
+            }
+            for user_id, token, expires_at, created_at in rows
+        ])
+
+
+async def create_rate_limit_buckets(conn: AsyncConnection):
+    await conn.run_sync(lambda sync_conn: RateLimitBucketOrm.__table__.create(sync_conn, checkfirst=True))
+
+
+async def upgrade_funds_table(conn: AsyncConnection):
+    # Таблица funds из базы до миграций: create_all ее пропустил, и новых
+    # колонок и индексов на ней нет
+    await add_fund_columns(conn, ['photo_variants'])
+    if conn.dialect.name == 'postgresql':
+        if 'search_vector' not in await get_columns(conn, 'funds'):
+            await conn.execute(text(
+                f'ALTER TABLE funds ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ({SEARCH_VECTOR_SQL}) STORED'
+            ))
+        await conn.execute(text('CREATE INDEX IF NOT EXISTS ix_funds_search_vector ON funds USING gin (search_vector)'))
+    for index in FundOrm.__table__.indexes:
+        await conn.execute(CreateIndex(index, if_not_exists=True))
+
+
+async def hash_blacklisted_tokens(conn: AsyncConnection):
+    # Как и refresh_tokens: старая таблица хранила сам access-токен. Истекшие
+    # записи уже ничего не запрещают, переносим только действующие
+    if 'token_hash' in await get_columns(conn, 'blacklisted_tokens'):
+        return
+    query = text('SELECT token, expires_at, created_at FROM blacklisted_tokens').columns(
+        expires_at=DateTime(timezone=True), created_at=DateTime(timezone=True)
+    )
+    rows = (await conn.execute(query)).all()
+    await conn.execute(text('DROP TABLE blacklisted_tokens'))
+    await conn.run_sync(lambda sync_conn: BlacklistedTokenOrm.__table__.create(sync_conn))
+    now = datetime.now(timezone.utc)
+    rows = [
+        {'token_hash': token_hash(token), 'expires_at': expires_at, 'created_at': created_at}
+        for token, expires_at, created_at in rows
+        # SQLite возвращает время без зоны
+        if (expires_at if expires_at.tzinfo else expires_at.replace(tzinfo=timezone.utc)) > now
+    ]
+    if rows:
+        await conn.execute(insert(BlacklistedTokenOrm), rows)
+
+
+async def rename_donor_count(conn: AsyncConnection):
+    # Колонка считает пожертвования, а не уникальных жертвователей
+    if 'donor_count' in await get_columns(conn, 'fund_stats'):
+        await conn.execute(text('ALTER TABLE fund_stats RENAME COLUMN donor_count TO donation_count'))
+
+
+async def backfill_fund_stats(conn: AsyncConnection):
+    # fund_stats ведется приращениями с момента появления, а фонды, созданные
+    # раньше, в нем не учтены. Пересчитываем целиком: фонды плюс еще не
+    # перенесенные шарды fund_counters, которые приращения тоже уже учли
+    pending = (
+        select(
+            FundCounterOrm.fund_id,
+            func.sum(FundCounterOrm.collected).label('collected'),
+            func.sum(FundCounterOrm.donate_count).label('donate_count'),
+        )
+        .group_by(FundCounterOrm.fund_id)
+        .subquery()
+    )
+    totals = (
+        select(
+            FundOrm.category_id,
+            literal(0),
+            func.count(),
+            func.sum(FundOrm.collected + func.coalesce(pending.c.collected, 0)),
+            func.sum(FundOrm.target),
+            func.sum(FundOrm.donate_count + func.coalesce(pending.c.donate_count, 0)),
+        )
+        .outerjoin(pending, pending.c.fund_id == FundOrm.id)
+        .group_by(FundOrm.category_id)
+    )
+    # На базе после миграции 3 колонка еще называется по-старому
+    await rename_donor_count(conn)
+    stats = FundStatsOrm.__table__.c
+    await conn.execute(delete(FundStatsOrm))
+    await conn.execute(insert(FundStatsOrm).from_select(
+        [stats.category_id, stats.shard, stats.fund_count, stats.total_collected, stats.total_target, stats.donation_count],
+        totals,
+    ))
+
+
+async def add_deploy_raw_tx(conn: AsyncConnection):
+    await add_fund_columns(conn, ['deploy_raw_tx'])
+
+
+async def create_trigram_index(conn: AsyncConnection):
+    # Поиск с опечатками по названию (utils/search.py). Расширения может не быть
+    # в сборке Postgres или не хватать прав: тогда поиск работает без опечаток,
+    # а индекс после установки pg_trgm создается вручную тем же SQL
+    if conn.dialect.name != 'postgresql':
+        return
+    try:
+        async with conn.begin_nested():
+            await conn.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+            await conn.execute(text(
+                'CREATE INDEX IF NOT EXISTS ix_funds_title_trgm ON funds USING gin (title gin_trgm_ops)'
+            ))
+    except DBAPIError as e:
+        logger.warning('pg_trgm недоступен, индекс для поиска с опечатками не создан: %s', e.orig)
+
+
+async def add_fund_revision(conn: AsyncConnection):
+    if 'revision' not in await get_columns(conn, 'funds'):
+        await conn.execute(text('ALTER TABLE funds ADD COLUMN revision BIGINT NOT NULL DEFAULT 0'))
+
+
+# (версия, описание, функция). Только дописывать в конец. Миграция 1 создает
+# таблицы по текущим моделям, поэтому следующие миграции схемы должны
+# проверять, нет ли уже того, что они добавляют
+MIGRATIONS: list[tuple[int, str, Callable[[AsyncConnection], Awaitable[None]]]] = [
+    (1, 'Таблицы по моделям', create_missing_tables),
+    (2, 'Справочник категорий', insert_categories),
+    (3, 'Журнал пожертвований и шарды счетчиков фондов', create_donation_ledger),
+    (4, 'Статус развертывания контракта фонда', add_deploy_columns),
+    (5, 'Хэши refresh-токенов, сессии и ротация', hash_refresh_tokens),
+    (6, 'Ведра ограничения частоты запросов', create_rate_limit_buckets),
+    (7, 'Колонки и индексы funds для базы, созданной до миграций', upgrade_funds_table),
+    (8, 'Хэши в черном списке access-токенов', hash_blacklisted_tokens),
+    (9, 'Пересчет fund_stats по существующим фондам', backfill_fund_stats),
+    (10, 'Подписанная транзакция развертывания для повторной отправки', add_deploy_raw_tx),
+    (11, 'pg_trgm и индекс для поиска с опечатками', create_trigram_index),
+    (12, 'Номер правки фонда для порядка событий', add_fund_revision),
+    (13, 'fund_stats.donor_count -> donation_count', rename_donor_count),
+]
+
+
+@asynccontextmanager
+async def leader_lock():
+    """Пускает внутрь по одному процессу (pg_advisory_lock).
+
+    Первый воркер применяет миграции, остальные ждут и находят их уже
+    примененными. Отдает время ожидания в секундах. На SQLite блокировки
+    нет: там один процесс.
+    """
+    if engine.dialect.name != 'postgresql':
+        yield 0.0
+        return
+
+    started = time.perf_counter()
+    async with engine.connect() as conn:
+        acquired = (await conn.execute(select(func.pg_try_advisory_lock(MIGRATIONS_LOCK_ID)))).scalar()
+        if not acquired:
+            logger.info('Миграции применяет другой процесс, ждем')
+            await conn.execute(select(func.pg_advisory_lock(MIGRATIONS_LOCK_ID)))
+        # Блокировка сессионная, транзакцию держать открытой не нужно
+        await conn.commit()
+        try:
+            yield time.perf_counter() - started
+        finally:
+            await conn.execute(select(func.pg_advisory_unlock(MIGRATIONS_LOCK_ID)))
+            await conn.commit()
+
+
+async def get_schema_version() -> int:
+    async with engine.begin() as conn:
+        await conn.run_sync(SchemaVersionOrm.__table__.create, checkfirst=True)
+        result = await conn.execute(select(func.max(SchemaVersionOrm.version)))
+        return result.scalar() or 0
+
+
+async def migrate() -> list[int]:
+    """Применяет недостающие миграции по порядку, каждую в своей транзакции."""
+    current = await get_schema_version()
+    applied = []
+    for version, description, apply in MIGRATIONS:
+        if version <= current:
+            continue
+        started = time.perf_counter()
+        async with engine.begin() as conn:
+            await apply(conn)
+            await conn.execute(insert(SchemaVersionOrm).values(
+                version=version,
+                description=description,
+                duration_ms=(time.perf_counter() - started) * 1000,
+            ))
+        logger.info('Миграция %s применена: %s', version, description)
+        applied.append(version)
+    return applied
@@ -0,0 +1,259 @@
+"""Чтение состояния контрактов CharityCampaign для /funds/{id}/onchain.
+
+Все eth_call одного ответа уходят одним JSON-RPC batch (крупный - несколькими
+параллельно, по ONCHAIN_BATCH_CALLS) и читаются на одном блоке, так что
+состояние согласовано. Номер головы цепочки переиспользуется
+ONCHAIN_BLOCK_TTL секунд, а результаты кэшируются по адресу и блоку: все
+посетители в пределах блока получают одно чтение. Одинаковые чтения,
+начатые одновременно, ждут один запрос к узлу (single-flight).
+"""
+import re
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Awaitable, Callable
+from utils.metrics import ONCHAIN_READS
+from web3 import (
+    RpcClient, RpcError,
+    SELECTOR_GOAL, SELECTOR_DEADLINE, SELECTOR_TOTAL_DONATED, SELECTOR_TOTAL_SPENT, SELECTOR_GOAL_REACHED,
+    SELECTOR_NEXT_REQUEST_ID, SELECTOR_GET_STATUS, SELECTOR_GET_CONTRACT_BALANCE, SELECTOR_SPENDING_REQUESTS,
+    words, encode_call, decode_uint, decode_bool, decode_address, decode_string,
+)
+from config import settings
+
+
+
+
+ADDRESS_RE = re.compile(r'^0x[0-9a-fA-F]{40}$')
+
+SUMMARY_SELECTORS = [
+    SELECTOR_GOAL,
+    SELECTOR_DEADLINE,
+    SELECTOR_TOTAL_DONATED,
+    SELECTOR_TOTAL_SPENT,
+    SELECTOR_GOAL_REACHED,
+    SELECTOR_NEXT_REQUEST_ID,
+    SELECTOR_GET_STATUS,
+    SELECTOR_GET_CONTRACT_BALANCE,
+]
+
+
+def is_address(value: str | None) -> bool:
+    return bool(value) and ADDRESS_RE.match(value) is not None
+
+
+def eth_call(address: str, data: str, block: int) -> tuple[str, list]:
+    return 'eth_call', [{'to': address, 'data': data}, hex(block)]
+
+
+def check_results(address: str, results: list):
+    for result in results:
+        if isinstance(result, RpcError):
+            raise result
+        if not result or result == '0x':
+            # eth_call к адресу без кода возвращает пустые данные
+            raise ValueError(f'По адресу {address} нет контракта кампании')
+
+
+def decode_summary(address: str, results: list) -> dict:
+    check_results(address, results)
+    goal, deadline, donated, spent, reached, next_request_id, status, balance = results
+    # Суммы в wei больше 2^53, в JSON отдаются строками
+    return {
+        'address': address,
+        'goal': str(decode_uint(goal)),
+        'deadline': decode_uint(deadline),
+        'total_donated': str(decode_uint(donated)),
+        'total_spent': str(decode_uint(spent)),
+        'available': str(decode_uint(donated) - decode_uint(spent)),
+        'balance': str(decode_uint(balance)),
+        'goal_reached': decode_bool(reached),
+        'status': decode_string(status, words(status)[0]),
+        'next_request_id': decode_uint(next_request_id),
+    }
+
+
+def decode_request(request_id: int, result: str) -> dict:
+    description_hash, amount, recipient, executed, votes = words(result)[:5]
+    return {
+        'id': request_id,
+        'description_hash': '0x' + description_hash,
+        'amount': str(decode_uint(amount)),
+        'recipient': decode_address(recipient),
+        'executed': decode_bool(executed),
+        'approval_votes': str(decode_uint(votes)),
+    }
+
+
+class OnchainReader:
+    def __init__(self, rpc, block_ttl: float, cache_size: int, batch_calls: int, max_requests: int):
+        self.rpc = rpc
+        self.block_ttl = block_ttl
+        self.cache_size = cache_size
+        self.batch_calls = batch_calls
+        self.max_requests = max_requests
+        self._head: tuple[float, int] | None = None
+        self._head_flight: asyncio.Task | None = None
+        # (вид, адрес) -> (блок, значение); значение годно, только пока блок - текущая голова
+        self._cache: OrderedDict[tuple[str, str], tuple[int, dict | list]] = OrderedDict()
+        self._flights: dict[tuple[str, str, int], asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+        self.round_trips = 0
+
+    async def head(self) -> int:
+        now = time.monotonic()
+        if self._head is not None and now - self._head[0] < self.block_ttl:
+            return self._head[1]
+        if self._head_flight is None:
+            self._head_flight = asyncio.create_task(self._fetch_head())
+        # shield: отмена одного запроса не отменяет чтение для остальных
+        return await asyncio.shield(self._head_flight)
+
+    async def _fetch_head(self) -> int:
+        try:
+            self.round_trips += 1
+            block = int(await self.rpc.call('eth_blockNumber'), 16)
+            self._head = (time.monotonic(), block)
+            return block
+        finally:
+            self._head_flight = None
+
+    async def _batch(self, calls: list[tuple[str, list]]) -> list:
+        chunks = [calls[i:i + self.batch_calls] for i in range(0, len(calls), self.batch_calls)]
+        self.round_trips += len(chunks)
+        results = await asyncio.gather(*(self.rpc.batch(chunk) for chunk in chunks))
+        return [result for chunk in results for result in chunk]
+
+    async def _read(
+        self,
+        kind: str,
+        keys: list[str],
+        block: int,
+        fetch: Callable[[list[str], int], Awaitable[dict]],
+    ) -> dict:
+        """Значения по ключам на блоке: из кэша, из уже идущего чтения или новым чтением.
+
+        Вместо значения может быть исключение: ошибка одного контракта не роняет остальные.
+        """
+        results, waiting, missing = {}, {}, []
+        for key in keys:
+            cached = self._cache.get((kind, key))
+            if cached is not None and cached[0] == block:
+                self._cache.move_to_end((kind, key))
+                results[key] = cached[1]
+                self.hits += 1
+                ONCHAIN_READS.inc('hit')
+            elif (kind, key, block) in self._flights:
+                waiting[key] = self._flights[(kind, key, block)]
+                self.shared += 1
+                ONCHAIN_READS.inc('shared')
+            else:
+                missing.append(key)
+                self.misses += 1
+                ONCHAIN_READS.inc('miss')
+
+        if missing:
+            loop = asyncio.get_running_loop()
+            futures = {key: loop.create_future() for key in missing}
+            for key, future in futures.items():
+                self._flights[(kind, key, block)] = future
+            try:
+                try:
+                    fetched = await fetch(missing, block)
+                except Exception as e:
+                    fetched = {key: e for key in missing}
+                for key, future in futures.items():
+                    value = fetched[key]
+                    results[key] = value
+                    future.set_result(value)
+                    # Отсутствие контракта на блоке - такое же состояние, как и значения;
+                    # ошибки узла не кэшируются
+                    if not isinstance(value, Exception) or isinstance(value, ValueError):
+                        self._store((kind, key), block, value)
+            finally:
+                for key, future in futures.items():
+                    self._flights.pop((kind, key, block), None)
+                    if not future.done():
+                        # Запрос отменили посреди чтения: ждущие не должны висеть
+                        future.set_result(RuntimeError('Чтение контракта прервано'))
+
+        for key, future in waiting.items():
+            results[key] = await asyncio.shield(future)
+        return results
+
+    def _store(self, key: tuple[str, str], block: int, value):
+        self._cache[key] = (block, value)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def _fetch_summaries(self, addresses: list[str], block: int) -> dict:
+        calls = [eth_call(address, selector, block) for address in addresses for selector in SUMMARY_SELECTORS]
+        results = await self._batch(calls)
+        size = len(SUMMARY_SELECTORS)
+        summaries = {}
+        for i, address in enumerate(addresses):
+            try:
+                summaries[address] = decode_summary(address, results[i * size:(i + 1) * size])
+            except (RpcError, ValueError, IndexError) as e:
+                summaries[address] = e
+        return summaries
+
+    async def read_summaries(self, addresses: list[str]) -> tuple[int, dict]:
+        """Блок и состояние каждого контракта (или исключение) на этом блоке."""
+        block = await self.head()
+        addresses = list(dict.fromkeys(address.lower() for address in addresses))
+        return block, await self._read('summary', addresses, block, self._fetch_summaries)
+
+    async def read_campaign(self, address: str) -> dict:
+        """Состояние одного контракта с последними max_requests запросами на расходование."""
+        block, summaries = await self.read_summaries([address])
+        summary = summaries[address.lower()]
+        if isinstance(summary, Exception):
+            raise summary
+        count = summary['next_request_id']
+
+        async def fetch_requests(keys: list[str], block: int) -> dict:
+            # На одном блоке nextRequestId один и тот же, поэтому ключ - только адрес
+            request_ids = list(range(count - 1, max(-1, count - 1 - self.max_requests), -1))
+            results = await self._batch([
+                eth_call(keys[0], encode_call(SELECTOR_SPENDING_REQUESTS, request_id), block)
+                for request_id in request_ids
+            ])
+            try:
+                check_results(keys[0], results)
+                return {keys[0]: [decode_request(request_id, result) for request_id, result in zip(request_ids, results)]}
+            except (RpcError, ValueError) as e:
+                return {keys[0]: e}
+
+        requests = []
+        if count:
+            requests = (await self._read('requests', [summary['address']], block, fetch_requests))[summary['address']]
+            if isinstance(requests, Exception):
+                raise requests
+        return {**summary, 'block_number': block, 'spending_requests': requests}
+
+    def snapshot(self) -> dict:
+        return {
+            'head': self._head[1] if self._head else None,
+            'cached': len(self._cache),
+            'in_flight': len(self._flights),
+            'hits': self.hits,
+            'misses': self.misses,
+            'shared': self.shared,
+            'round_trips': self.round_trips,
+        }
+
+    async def stop(self):
+        await self.rpc.close()
+
+
+onchain_reader = OnchainReader(
+    RpcClient(),
+    block_ttl=settings.onchain_block_ttl,
+    cache_size=settings.onchain_cache_size,
+    batch_calls=settings.onchain_batch_calls,
+    max_requests=settings.onchain_max_requests,
+)
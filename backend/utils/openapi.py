@@ -0,0 +1,86 @@
+"""Схема OpenAPI: строится при первом запросе /docs или /openapi.json.
+
+Схему можно собрать заранее, при сборке образа, и отдавать готовой:
+
+    python -m utils.openapi openapi.json
+    OPENAPI_SCHEMA_FILE=openapi.json uvicorn main:app
+"""
+import sys
+import json
+from fastapi import FastAPI
+from config import settings
+
+
+
+
+# Ручки, которым в Swagger нужна кнопка авторизации
+SECURED_PATHS = {
+    #Авторизация
+    "/auth/me": {"method": "get", "security": [{"Bearer": []}]},
+    "/auth/logout": {"method": "post", "security": [{"Bearer": []}]},
+    #Пожертвования пользователя
+    "/funds/my": {"method": "get", "security": [{"Bearer": []}]},
+    "/donations/my": {"method": "get", "security": [{"Bearer": []}]},
+    #Создание фондов: развертывание кампании подписывает ключ организации
+    "/funds/": {"method": "post", "security": [{"Bearer": []}]},
+    "/funds/bulk": {"method": "post", "security": [{"AdminToken": []}]},
+    "/funds/{fund_id}/deploy": {"method": "post", "security": [{"AdminToken": []}]},
+}
+
+
+def build_openapi(app: FastAPI) -> dict:
+    from fastapi.openapi.utils import get_openapi
+
+    openapi_schema = get_openapi(
+        title="CharityChain",
+        version="beta",
+        description="Документация к API CharityChain",
+        routes=app.routes,
+    )
+    openapi_schema["components"]["securitySchemes"] = {
+        "Bearer": {
+            "type": "http",
+            "scheme": "bearer",
+            "bearerFormat": "JWT"
+        },
+        "AdminToken": {
+            "type": "apiKey",
+            "in": "header",
+            "name": "X-Admin-Token"
+        }
+    }
+
+    for path, config in SECURED_PATHS.items():
+        if path in openapi_schema["paths"]:
+            openapi_schema["paths"][path][config["method"]]["security"] = config["security"]
+    #Служебные ручки
+    for path, operations in openapi_schema["paths"].items():
+        if path.startswith("/system/"):
+            for operation in operations.values():
+                operation["security"] = [{"AdminToken": []}]
+    return openapi_schema
+
+
+def install_openapi(app: FastAPI):
+    def openapi():
+        if app.openapi_schema:
+            return app.openapi_schema
+        if settings.openapi_schema_file:
+            with open(settings.openapi_schema_file, encoding='utf-8') as file:
+                app.openapi_schema = json.load(file)
+        else:
+            app.openapi_schema = build_openapi(app)
+        return app.openapi_schema
+
+    app.openapi = openapi
+
+
+if __name__ == '__main__':
+    from main import app
+
+    schema = json.dumps(build_openapi(app), ensure_ascii=False, indent=2)
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], 'w', encoding='utf-8') as file:
+            file.write(schema)
+    else:
+        print(schema)
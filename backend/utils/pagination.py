@@ -0,0 +1,51 @@
+import json
+import math
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from datetime import datetime
+
+
+
+
+def encode_cursor(order_by: str, order: str, value, last_id: int) -> str:
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([order_by, order, value, last_id], separators=(',', ':'))
+    return urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str, order_by: str, order: str) -> tuple:
+    # Курсор непрозрачен для клиента, но привязан к сортировке,
+    # с которой был выдан: смена сортировки требует новой первой страницы
+    try:
+        raw = urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        cursor_order_by, cursor_order, value, last_id = json.loads(raw)
+    except (BinasciiError, ValueError, TypeError):
+        raise ValueError('Некорректный курсор')
+
+    if (cursor_order_by, cursor_order) != (order_by, order):
+        raise ValueError('Курсор выдан для другой сортировки')
+    # Значения из курсора уходят в WHERE как параметры: значение не того типа
+    # должно быть 400, а не ошибкой базы. bool в JSON - тоже int, отсекаем его явно
+    if not _is_number(last_id, int):
+        raise ValueError('Некорректный курсор')
+    if order_by in ('created_at', 'target_date'):
+        try:
+            value = datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            raise ValueError('Некорректный курсор')
+    elif order_by == 'collected' and not _is_number(value, int):
+        raise ValueError('Некорректный курсор')
+    elif order_by == 'progress' and not _is_number(value, (int, float)):
+        raise ValueError('Некорректный курсор')
+    return value, last_id
+
+
+def _is_number(value, types) -> bool:
+    # Границы - BIGINT: больше asyncpg не передаст, а NaN и бесконечность в JSON тоже допустимы
+    return (
+        isinstance(value, types)
+        and not isinstance(value, bool)
+        and math.isfinite(value)
+        and -2**63 <= value < 2**63
+    )
@@ -0,0 +1,141 @@
+import os
+import time
+import asyncio
+from functools import cache
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from utils.metrics import PASSWORD_HASH_TIME, PASSWORD_HASH_WAIT, PASSWORD_HASH_REJECTED
+from config import settings
+
+
+
+
+@cache
+def pwd_context():
+    # passlib и bcrypt импортируются при первом хэшировании, а не при старте;
+    # в пуле процессов контекст создается в каждом процессе свой
+    from passlib.context import CryptContext
+
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+# Функции уровня модуля, чтобы их можно было отправить в пул процессов
+def _hash(password: str) -> tuple[str, float]:
+    started = time.perf_counter()
+    hashed = pwd_context().hash(password)
+    return hashed, time.perf_counter() - started
+
+
+def _verify_and_update(password: str, hashed: str) -> tuple[tuple[bool, str | None], float]:
+    started = time.perf_counter()
+    result = pwd_context().verify_and_update(password, hashed)
+    return result, time.perf_counter() - started
+
+
+def _warm() -> int:
+    pwd_context()
+    return os.getpid()
+
+
+class PasswordHasherOverloaded(Exception):
+    pass
+
+
+class HasherMetrics:
+    def __init__(self):
+        self.calls = 0
+        self.rejected = 0
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+        self.hash_time_total = 0.0
+        self.hash_time_max = 0.0
+
+    def observe(self, queue_wait: float, hash_time: float):
+        self.calls += 1
+        self.queue_wait_total += queue_wait
+        self.queue_wait_max = max(self.queue_wait_max, queue_wait)
+        self.hash_time_total += hash_time
+        self.hash_time_max = max(self.hash_time_max, hash_time)
+
+
+class PasswordHasher:
+    """bcrypt в отдельном пуле, чтобы не блокировать event loop.
+
+    Очередь ограничена: если ожидающих задач больше `max_queue`, запрос
+    сразу отклоняется с PasswordHasherOverloaded (в роутере это 503),
+    а не копится, пока клиенты не отвалятся по таймауту.
+    """
+
+    def __init__(self, pool: str, workers: int, max_queue: int):
+        self.pool = pool
+        self.workers = workers
+        self.max_queue = max_queue
+        self.metrics = HasherMetrics()
+        self._pending = 0
+        self._executor: Executor | None = None
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            if self.pool == 'process':
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='bcrypt')
+        return self._executor
+
+    async def hash(self, password: str) -> str:
+        return await self._run('hash', _hash, password)
+
+    async def verify_and_update(self, password: str, hashed: str) -> tuple[bool, str | None]:
+        # Второй элемент - новый хэш, если схема или параметры старого устарели
+        return await self._run('verify', _verify_and_update, password, hashed)
+
+    async def _run(self, operation: str, fn, *args):
+        if self._pending >= self.workers + self.max_queue:
+            self.metrics.rejected += 1
+            PASSWORD_HASH_REJECTED.inc()
+            raise PasswordHasherOverloaded('Сервер перегружен, попробуйте позже')
+
+        self._pending += 1
+        submitted = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            result, hash_time = await loop.run_in_executor(self.executor, fn, *args)
+        finally:
+            self._pending -= 1
+        queue_wait = time.perf_counter() - submitted - hash_time
+        self.metrics.observe(queue_wait, hash_time)
+        PASSWORD_HASH_WAIT.observe(queue_wait)
+        PASSWORD_HASH_TIME.observe(hash_time, operation)
+        return result
+
+    async def warm_up(self):
+        # Поднимаем все воркеры пула и импортируем passlib заранее: процесс стартует сотни миллисекунд
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self.executor, _warm) for _ in range(self.workers)))
+
+    def snapshot(self) -> dict:
+        metrics = self.metrics
+        return {
+            "pool": self.pool,
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "in_flight": self._pending,
+            "calls": metrics.calls,
+            "rejected": metrics.rejected,
+            "queue_wait_avg_ms": metrics.queue_wait_total / metrics.calls * 1000 if metrics.calls else 0.0,
+            "queue_wait_max_ms": metrics.queue_wait_max * 1000,
+            "hash_time_avg_ms": metrics.hash_time_total / metrics.calls * 1000 if metrics.calls else 0.0,
+            "hash_time_max_ms": metrics.hash_time_max * 1000,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher(
+    pool=settings.password_hash_pool,
+    workers=settings.password_hash_workers,
+    max_queue=settings.password_hash_max_queue,
+)
@@ -0,0 +1,299 @@
+"""Профилирование запросов и журнал медленных SQL.
+
+Включается PROFILING_ENABLED=1. Тогда у каждого запроса записываются
+все SQL-выражения со временем и числом строк, а запросы дольше
+PROFILING_SLOW_REQUEST_MS попадают в кольцевой буфер /system/profiles.
+Стек профилируется только у части запросов: по заголовку
+X-Profile: <PROFILING_TOKEN> или с вероятностью PROFILING_SAMPLE_RATE.
+Профилировщик - pyinstrument, если установлен, иначе cProfile.
+
+Журнал медленных SQL (SLOW_QUERY_MS) работает независимо от профилирования.
+Когда все выключено, обработчики событий SQLAlchemy не регистрируются,
+а middleware сразу передает запрос дальше.
+"""
+import io
+import time
+import random
+import itertools
+import logging
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from config import settings
+
+
+
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = b'x-profile'
+STATEMENT_MAX_LENGTH = 2000
+
+
+class QueryRecord:
+    __slots__ = ('statement', 'duration', 'rows', 'session')
+
+    def __init__(self, statement: str, duration: float, rows: int, session: int):
+        self.statement = statement
+        self.duration = duration
+        self.rows = rows
+        self.session = session
+
+    def snapshot(self) -> dict:
+        return {
+            'statement': self.statement[:STATEMENT_MAX_LENGTH],
+            'duration_ms': round(self.duration * 1000, 3),
+            'rows': self.rows,
+            'session': self.session,
+        }
+
+
+class RequestProfile:
+    """SQL-выражения и профиль стека одного запроса."""
+
+    def __init__(self, method: str, path: str, reason: str | None):
+        self.id: int | None = None
+        self.method = method
+        self.path = path
+        self.route: str | None = None
+        self.status = 500
+        # header или sample - запрошен профиль стека
+        self.reason = reason
+        self.started_at = datetime.now(timezone.utc)
+        self.duration = 0.0
+        self.queries: list[QueryRecord] = []
+        # id соединения -> номер сессии, которая на нем сейчас работает
+        self.connections: dict[int, int] = {}
+        self.sessions = 0
+        self.profile: str | None = None
+
+    def repeated_queries(self) -> list[dict]:
+        """N+1: одно и то же выражение, выполненное много раз за запрос."""
+        groups: dict[str, list[QueryRecord]] = {}
+        for query in self.queries:
+            groups.setdefault(query.statement, []).append(query)
+        return [
+            {
+                'statement': statement[:STATEMENT_MAX_LENGTH],
+                'count': len(queries),
+                'sessions': len({query.session for query in queries}),
+                'total_ms': round(sum(query.duration for query in queries) * 1000, 3),
+            }
+            for statement, queries in groups.items()
+            if len(queries) >= settings.profiling_n_plus_one
+        ]
+
+    def summary(self) -> dict:
+        return {
+            'id': self.id,
+            'method': self.method,
+            'path': self.path,
+            'route': self.route,
+            'status': self.status,
+            'reason': self.reason,
+            'started_at': self.started_at.isoformat(),
+            'duration_ms': round(self.duration * 1000, 3),
+            'queries': len(self.queries),
+            'sessions': self.sessions,
+            'db_ms': round(sum(query.duration for query in self.queries) * 1000, 3),
+            'n_plus_one': len(self.repeated_queries()),
+        }
+
+    def snapshot(self) -> dict:
+        return {
+            **self.summary(),
+            'n_plus_one': self.repeated_queries(),
+            'sql': [query.snapshot() for query in self.queries],
+            'profile': self.profile,
+        }
+
+
+class StackProfiler:
+    """pyinstrument с учетом async-контекста или cProfile, если его нет.
+
+    cProfile видит все корутины потока, поэтому в его профиль попадают
+    и параллельные запросы.
+    """
+
+    def __init__(self):
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            import cProfile
+
+            self._profiler = cProfile.Profile()
+            self._pyinstrument = False
+        else:
+            self._profiler = Profiler(async_mode='enabled', interval=settings.profiling_interval)
+            self._pyinstrument = True
+
+    def start(self):
+        if self._pyinstrument:
+            self._profiler.start()
+        else:
+            self._profiler.enable()
+
+    def stop(self) -> str:
+        if self._pyinstrument:
+            self._profiler.stop()
+            return self._profiler.output_text(unicode=True, color=False, show_all=False)
+
+        import pstats
+
+        self._profiler.disable()
+        output = io.StringIO()
+        pstats.Stats(self._profiler, stream=output).sort_stats('cumulative').print_stats(40)
+        return output.getvalue()
+
+
+class Profiling:
+    """Кольцевые буферы медленных запросов и медленных SQL."""
+
+    def __init__(self, enabled: bool, sample_rate: float, token: str | None, slow_request_ms: float, slow_query_ms: float, size: int):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.token = token.encode() if token else None
+        self.slow_request = slow_request_ms / 1000
+        self.slow_query = slow_query_ms / 1000
+        self.requests: deque[RequestProfile] = deque(maxlen=size)
+        self.slow_queries: deque[dict] = deque(maxlen=size)
+        self._ids = itertools.count(1)
+        # Стек профилируется у одного запроса за раз
+        self._busy = False
+
+    def requested(self, scope) -> str | None:
+        if self.token is not None:
+            for key, value in scope['headers']:
+                if key == PROFILE_HEADER:
+                    return 'header' if value == self.token else None
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return 'sample'
+        return None
+
+    def stack_profiler(self) -> StackProfiler | None:
+        if self._busy:
+            return None
+        self._busy = True
+        profiler = StackProfiler()
+        profiler.start()
+        return profiler
+
+    def stop_stack_profiler(self, profiler: StackProfiler) -> str | None:
+        try:
+            return profiler.stop()
+        except Exception:
+            logger.exception('Не удалось снять профиль запроса')
+            return None
+        finally:
+            self._busy = False
+
+    def keep(self, profile: RequestProfile):
+        profile.id = next(self._ids)
+        self.requests.append(profile)
+
+    def get(self, profile_id: int) -> RequestProfile | None:
+        return next((profile for profile in self.requests if profile.id == profile_id), None)
+
+    def record_query(self, connection, statement: str, duration: float, rows: int):
+        profile = _request_profile.get()
+        if profile is not None:
+            session = profile.connections.get(id(connection), 0)
+            profile.queries.append(QueryRecord(statement, duration, rows, session))
+        if self.slow_query and duration >= self.slow_query:
+            self.slow_queries.append({
+                'at': datetime.now(timezone.utc).isoformat(),
+                'path': profile.path if profile is not None else None,
+                'statement': statement[:STATEMENT_MAX_LENGTH],
+                'duration_ms': round(duration * 1000, 3),
+                'rows': rows,
+            })
+            logger.warning('Медленный SQL %.1f мс: %s', duration * 1000, ' '.join(statement[:200].split()))
+
+    def snapshot(self) -> dict:
+        return {
+            'enabled': self.enabled,
+            'sample_rate': self.sample_rate,
+            'slow_request_ms': self.slow_request * 1000,
+            'slow_query_ms': self.slow_query * 1000,
+            'requests': [profile.summary() for profile in reversed(self.requests)],
+        }
+
+
+profiling = Profiling(
+    enabled=settings.profiling_enabled,
+    sample_rate=settings.profiling_sample_rate,
+    token=settings.profiling_token,
+    slow_request_ms=settings.profiling_slow_request_ms,
+    slow_query_ms=settings.slow_query_ms,
+    size=settings.profiling_buffer_size,
+)
+
+_request_profile: ContextVar[RequestProfile | None] = ContextVar('request_profile', default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._profiling_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - context._profiling_started
+    profiling.record_query(conn, statement, duration, cursor.rowcount)
+
+
+def _after_begin(session, transaction, connection):
+    # Каждая new_session() начинает свою транзакцию: так видно, из скольких
+    # сессий пришли одинаковые запросы
+    profile = _request_profile.get()
+    if profile is not None:
+        profile.sessions += 1
+        profile.connections[id(connection)] = profile.sessions
+
+
+if profiling.enabled or profiling.slow_query:
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+if profiling.enabled:
+    event.listen(Session, 'after_begin', _after_begin)
+
+
+class ProfilingMiddleware:
+    """ASGI-middleware: SQL запроса, профиль стека по запросу и отбор медленных."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not profiling.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        reason = profiling.requested(scope)
+        profile = RequestProfile(scope['method'], scope['path'], reason)
+        token = _request_profile.set(profile)
+        stack = profiling.stack_profiler() if reason is not None else None
+        if reason == 'header':
+            # Номер профиля известен заранее, чтобы вернуть его в заголовке
+            profiling.keep(profile)
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                profile.status = message['status']
+                if profile.id is not None:
+                    message['headers'] = [*message.get('headers', []), (b'x-profile-id', str(profile.id).encode())]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profile.duration = time.perf_counter() - started
+            _request_profile.reset(token)
+            if stack is not None:
+                profile.profile = profiling.stop_stack_profiler(stack)
+            route = scope.get('route')
+            profile.route = route.path if route is not None else None
+            if profile.id is None and (reason is not None or profile.duration >= profiling.slow_request):
+                profiling.keep(profile)
@@ -0,0 +1,175 @@
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Callable
+from config import settings
+
+
+
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[str], None]
+
+
+class LocalPubSub:
+    """Канал сообщений внутри одного процесса.
+
+    Стенд-ин для разработки и тестов, а также для запуска с одним воркером.
+    """
+
+    def __init__(self):
+        self._handlers: dict[str, list[Handler]] = defaultdict(list)
+
+    def subscribe(self, channel: str, handler: Handler):
+        self._handlers[channel].append(handler)
+
+    async def publish(self, channel: str, message: str):
+        self._dispatch(channel, message)
+        await self.notify(channel, message)
+
+    async def notify(self, channel: str, message: str):
+        """Отправляет сообщение только остальным процессам, без локальных обработчиков."""
+        pass
+
+    def _dispatch(self, channel: str, message: str):
+        for handler in self._handlers.get(channel, ()):
+            try:
+                handler(message)
+            except Exception:
+                logger.exception('Ошибка обработчика канала %s', channel)
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+
+class PostgresPubSub(LocalPubSub):
+    """Канал между воркерами через Postgres LISTEN/NOTIFY.
+
+    Держит одно выделенное соединение asyncpg на процесс. Сообщение
+    применяется локально сразу и еще раз приходит через NOTIFY,
+    поэтому обработчики должны быть идемпотентными.
+
+    Оборванное соединение (перезапуск базы, сеть) переподключается
+    с растущей паузой, и LISTEN заново выполняется для всех каналов.
+    Сообщения за время обрыва теряются: подписчики догоняют сами
+    (кэш ответов - по ttl, отозванные токены - периодической сверкой с базой).
+    """
+
+    def __init__(self, dsn: str, ping_interval: float = 15, max_reconnect_delay: float = 30):
+        super().__init__()
+        self.dsn = dsn
+        self.ping_interval = ping_interval
+        self.max_reconnect_delay = max_reconnect_delay
+        self.reconnects = 0
+        self._conn = None
+        self._lock = asyncio.Lock()
+        self._lost = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    async def start(self):
+        await self._connect()
+        self._task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+
+    async def _connect(self):
+        import asyncpg
+
+        conn = await asyncpg.connect(self.dsn)
+        conn.add_termination_listener(self._on_terminate)
+        async with self._lock:
+            # Между присваиванием и списком каналов нет await: канал, подписанный
+            # позже, сам встанет в очередь на _listen
+            self._conn = conn
+            for channel in list(self._handlers):
+                await conn.add_listener(channel, self._on_notify)
+
+    def _on_terminate(self, connection):
+        if connection is self._conn:
+            self._lost.set()
+
+    async def _watch(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._lost.wait(), self.ping_interval)
+            except TimeoutError:
+                # Обрыв без закрытия сокета сам не обнаружится, поэтому пинг
+                try:
+                    async with self._lock:
+                        await asyncio.wait_for(self._conn.execute('SELECT 1'), self.ping_interval)
+                    continue
+                except Exception as e:
+                    logger.warning('Соединение pubsub не отвечает: %r', e)
+            self._lost.clear()
+            await self._reconnect()
+
+    async def _reconnect(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            conn.terminate()
+        delay = 0.1
+        while True:
+            try:
+                await self._connect()
+            except Exception as e:
+                logger.warning('Не удалось переподключить pubsub, повтор через %.1f с: %r', delay, e)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_reconnect_delay)
+                continue
+            self.reconnects += 1
+            logger.info('Соединение pubsub восстановлено, каналов: %s', len(self._handlers))
+            return
+
+    def subscribe(self, channel: str, handler: Handler):
+        is_new = channel not in self._handlers
+        super().subscribe(channel, handler)
+        if is_new and self._conn is not None:
+            asyncio.ensure_future(self._listen(channel))
+
+    async def _listen(self, channel: str):
+        async with self._lock:
+            # Во время переподключения канал подпишет _connect
+            if self._conn is None:
+                return
+            try:
+                await self._conn.add_listener(channel, self._on_notify)
+            except Exception as e:
+                # Соединение оборвалось: после переподключения LISTEN выполнится для всех каналов
+                logger.warning('Не удалось подписаться на канал %s: %r', channel, e)
+                self._lost.set()
+
+    async def notify(self, channel: str, message: str):
+        if self._conn is None:
+            if self._task is not None:
+                raise ConnectionError('Соединение pubsub переподключается')
+            return
+        async with self._lock:
+            await self._conn.execute('SELECT pg_notify($1, $2)', channel, message)
+
+    def _on_notify(self, connection, pid, channel, payload):
+        self._dispatch(channel, payload)
+
+
+def create_pubsub() -> LocalPubSub:
+    database_url = settings.database_url or ''
+    backend = settings.pubsub_backend or ('postgres' if database_url.startswith('postgresql') else 'local')
+    if backend == 'postgres':
+        from sqlalchemy.engine import make_url
+
+        dsn = make_url(database_url).set(drivername='postgresql').render_as_string(hide_password=False)
+        return PostgresPubSub(dsn, settings.pubsub_ping_interval, settings.pubsub_max_reconnect_delay)
+    return LocalPubSub()
+
+
+pubsub = create_pubsub()
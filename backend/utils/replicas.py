@@ -0,0 +1,79 @@
+import asyncio
+import logging
+from datetime import datetime, timezone
+from database import replicas, ReplicaSet
+from repositories.replication import ReplicationRepository
+from config import settings
+
+
+
+
+logger = logging.getLogger(__name__)
+
+
+class ReplicaMonitor:
+    """Следит за отставанием реплик.
+
+    Раз в interval секунд пишет отметку времени в основную базу и читает
+    ее с каждой реплики. Реплики проверяются до записи новой отметки,
+    поэтому у успевающей реплики отставание 0, а не interval.
+    При DB_REPLICA_MAX_LAG=0 отметка не пишется, проверяется только
+    доступность реплик (например, две независимые базы для разработки).
+    """
+
+    def __init__(self, replica_set: ReplicaSet, interval: float):
+        self.replicas = replica_set
+        self.interval = interval
+        # Зависшая реплика не должна останавливать проверку остальных
+        self.timeout = max(interval, 1.0)
+        self._last_beat: datetime | None = None
+        self._task: asyncio.Task | None = None
+
+    async def check(self):
+        for replica in self.replicas.replicas:
+            try:
+                if self.replicas.max_lag <= 0:
+                    await asyncio.wait_for(ReplicationRepository.ping_replica(replica), self.timeout)
+                    replica.lag = None
+                else:
+                    beat_at = await asyncio.wait_for(ReplicationRepository.get_replica_beat(replica), self.timeout)
+                    if beat_at is None or self._last_beat is None:
+                        replica.lag = None
+                    else:
+                        replica.lag = max((self._last_beat - beat_at).total_seconds(), 0.0)
+                if replica.error is not None:
+                    logger.info('Реплика %s снова доступна', replica.name)
+                replica.error = None
+            except Exception as e:
+                if replica.error is None:
+                    logger.warning('Реплика %s недоступна: %s', replica.name, e)
+                replica.error = str(e) or type(e).__name__
+
+        if self.replicas.max_lag > 0:
+            self._last_beat = datetime.now(timezone.utc)
+            await ReplicationRepository.beat(self._last_beat)
+
+    async def start(self):
+        if not self.replicas:
+            return
+        # Первая отметка, затем проверка: до нее реплики в ротацию не попадают
+        await self.check()
+        await self.check()
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.replicas.dispose()
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.check()
+            except Exception:
+                logger.exception('Не удалось проверить реплики')
+
+
+replica_monitor = ReplicaMonitor(replicas, settings.db_replica_check_interval)
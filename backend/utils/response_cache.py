@@ -0,0 +1,152 @@
+import time
+import math
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import Awaitable, Callable, Iterable
+from fastapi import Request, Response
+from database import replicas
+from utils.pubsub import pubsub
+from config import settings
+
+
+
+
+logger = logging.getLogger(__name__)
+
+FUNDS_CHANNEL = 'funds_cache'
+
+# Сборщик ответа: JSON и момент, до которого он гарантированно актуален (или None)
+Builder = Callable[[], Awaitable[tuple[bytes, float | None]]]
+
+
+def days_left_deadline(target_dates: Iterable[datetime], now: float | None = None) -> float | None:
+    """Ближайший момент, когда у одного из фондов изменится days_left.
+
+    days_left = (target_date - now).days уменьшается не в полночь, а каждый
+    раз, когда now проходит время суток target_date.
+    """
+    now = time.time() if now is None else now
+    deadline = None
+    for target_date in target_dates:
+        target = target_date.timestamp()
+        days = math.floor((target - now) / 86400)
+        changes_at = target - days * 86400
+        if deadline is None or changes_at < deadline:
+            deadline = changes_at
+    return deadline
+
+
+class CachedResponse:
+    __slots__ = ('body', 'etag', 'version', 'expires_at')
+
+    def __init__(self, body: bytes, version: int, expires_at: float):
+        self.body = body
+        self.etag = f'W/"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+        self.version = version
+        self.expires_at = expires_at
+
+
+class ResponseCache:
+    """Кэш готовых JSON-ответов по пути и query-параметрам.
+
+    Записи привязаны к номеру версии: любая запись в фонды увеличивает
+    версию (во всех воркерах через pubsub), и старые ответы перестают
+    отдаваться. Кроме того, запись живет не дольше ttl и не дольше
+    ближайшей смены days_left у фондов в ответе. Размер ограничен LRU.
+
+    settle - сколько секунд после сброса ответы не кладутся в кэш:
+    чтения идут с реплик, которые могут еще не видеть последнюю запись.
+    """
+
+    def __init__(self, channel: str, maxsize: int, ttl: float, settle: float = 0):
+        self.channel = channel
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.settle = settle
+        self.version = 0
+        self.invalidated_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.publish_errors = 0
+        self._entries: OrderedDict[str, CachedResponse] = OrderedDict()
+        self._notify_pending = False
+        self._notifier: asyncio.Task | None = None
+        pubsub.subscribe(channel, self._on_invalidate)
+
+    def _on_invalidate(self, message: str):
+        self.version += 1
+        self.invalidated_at = time.monotonic()
+        self._entries.clear()
+
+    async def invalidate(self):
+        # Свой кэш сбрасывается сразу, остальным воркерам сообщение уходит
+        # фоновой задачей: запись уже закоммичена, и ни ошибка, ни ожидание
+        # pubsub не должны доставаться запросу. Сбросы во время отправки
+        # сливаются в одно следующее сообщение
+        self._on_invalidate('bump')
+        self._notify_pending = True
+        if self._notifier is None:
+            self._notifier = asyncio.create_task(self._notify())
+
+    async def _notify(self):
+        try:
+            while self._notify_pending:
+                self._notify_pending = False
+                try:
+                    await pubsub.notify(self.channel, 'bump')
+                except Exception:
+                    # Остальные воркеры догонят по ttl
+                    self.publish_errors += 1
+                    logger.exception('Не удалось разослать сброс кэша %s', self.channel)
+        finally:
+            self._notifier = None
+
+    async def respond(self, request: Request, build: Builder) -> Response:
+        key = request.url.path + '?' + '&'.join(f'{k}={v}' for k, v in sorted(request.query_params.multi_items()))
+        now = time.time()
+
+        entry = self._entries.get(key)
+        if entry is not None and entry.version == self.version and entry.expires_at > now:
+            self._entries.move_to_end(key)
+            self.hits += 1
+        else:
+            self.misses += 1
+            # Версию запоминаем до запроса в базу: если за это время была запись,
+            # ответ вернем клиенту, но в кэш не положим
+            version = self.version
+            body, deadline = await build()
+            expires_at = now + self.ttl if deadline is None else min(now + self.ttl, deadline)
+            entry = CachedResponse(body, version, expires_at)
+            settled = time.monotonic() - self.invalidated_at >= self.settle
+            if version == self.version and self.ttl > 0 and settled:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+
+        headers = {'ETag': entry.etag, 'Cache-Control': 'no-cache'}
+        if_none_match = request.headers.get('if-none-match')
+        # Сравнение слабое: клиент может прислать тег с W/ или без
+        if if_none_match and entry.etag[2:] in {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}:
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        return Response(content=entry.body, media_type='application/json', headers=headers)
+
+    def snapshot(self) -> dict:
+        return {
+            "version": self.version,
+            "entries": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+            "publish_errors": self.publish_errors,
+        }
+
+
+funds_cache = ResponseCache(FUNDS_CHANNEL, settings.response_cache_size, settings.response_cache_ttl, settle=replicas.max_lag if replicas else 0)
@@ -0,0 +1,224 @@
+import time
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from datetime import datetime, timezone, timedelta
+from models.auth import UserOrm
+from repositories.auth import UserRepository
+from utils.pubsub import pubsub
+from utils.metrics import REFRESH_TOKENS
+from config import settings
+
+
+
+
+logger = logging.getLogger(__name__)
+
+
+REVOKED_CHANNEL = 'revoked_tokens'
+USER_CHANNEL = 'user_invalidation'
+
+
+def token_hash(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class RevokedTokens:
+    """Отозванные токены в памяти: хэш токена -> момент истечения.
+
+    Access-токены живут минуты, поэтому множество остается небольшим
+    и точным, фильтр Блума здесь не нужен.
+    """
+
+    def __init__(self):
+        self._expires: dict[str, float] = {}
+
+    def add(self, key: str, expires_at: float):
+        self._expires[key] = expires_at
+
+    def __contains__(self, key: str) -> bool:
+        expires_at = self._expires.get(key)
+        return expires_at is not None and expires_at > time.time()
+
+    def __len__(self) -> int:
+        return len(self._expires)
+
+    def prune(self):
+        now = time.time()
+        self._expires = {key: exp for key, exp in self._expires.items() if exp > now}
+
+
+class UserCache:
+    """LRU-кэш пользователей по email с ограничением по времени жизни записи."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._items: OrderedDict[str, tuple[float, UserOrm]] = OrderedDict()
+
+    def get(self, email: str) -> UserOrm | None:
+        item = self._items.get(email)
+        if item is None:
+            return None
+        stored_at, user = item
+        if time.monotonic() - stored_at > self.ttl:
+            del self._items[email]
+            return None
+        self._items.move_to_end(email)
+        return user
+
+    def put(self, email: str, user: UserOrm):
+        self._items[email] = (time.monotonic(), user)
+        self._items.move_to_end(email)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def invalidate(self, email: str):
+        self._items.pop(email, None)
+
+    def prune(self):
+        now = time.monotonic()
+        for email in [e for e, (stored_at, _) in self._items.items() if now - stored_at > self.ttl]:
+            del self._items[email]
+
+
+class TokenRevocation:
+    """Проверка отзыва токенов и загрузка пользователя без похода в базу.
+
+    Черный список загружается при старте и дальше поддерживается в памяти.
+    Изменения между воркерами расходятся через pubsub, а фоновая задача
+    чистит истекшие записи и подтягивает из базы то, что могло потеряться.
+    """
+
+    def __init__(self, cleanup_interval: float, user_cache: UserCache):
+        self.cleanup_interval = cleanup_interval
+        self.revoked = RevokedTokens()
+        self.users = user_cache
+        self._synced_at: datetime | None = None
+        self._task: asyncio.Task | None = None
+        pubsub.subscribe(REVOKED_CHANNEL, self._on_revoked)
+        pubsub.subscribe(USER_CHANNEL, self.users.invalidate)
+
+    def is_revoked(self, token: str) -> bool:
+        return token_hash(token) in self.revoked
+
+    async def revoke(self, token: str, expires_at: datetime):
+        key = token_hash(token)
+        await UserRepository.add_to_blacklist(key, expires_at)
+        await pubsub.publish(REVOKED_CHANNEL, f'{key}:{expires_at.timestamp()}')
+
+    async def invalidate_user(self, email: str):
+        # Запись пользователя уже закоммичена: без pubsub остальные воркеры догонят по ttl кэша
+        try:
+            await pubsub.publish(USER_CHANNEL, email)
+        except Exception:
+            logger.exception('Не удалось разослать сброс кэша пользователя')
+
+    async def get_user(self, email: str) -> UserOrm | None:
+        user = self.users.get(email)
+        if user is None:
+            user = await UserRepository.get_user_by_email(email)
+            if user is not None:
+                self.users.put(email, user)
+        return user
+
+    def _on_revoked(self, message: str):
+        key, expires_at = message.split(':')
+        self.revoked.add(key, float(expires_at))
+
+    async def sync(self):
+        # Запас по времени покрывает записи, закоммиченные чуть позже своего created_at
+        since = self._synced_at - timedelta(seconds=self.cleanup_interval) if self._synced_at else None
+        self._synced_at = datetime.now(timezone.utc)
+        for key, expires_at in await UserRepository.get_blacklist(since):
+            self.revoked.add(key, expires_at.timestamp())
+
+    async def start(self):
+        await self.sync()
+        self._task = asyncio.create_task(self._cleanup_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _cleanup_loop(self):
+        while True:
+            await asyncio.sleep(self.cleanup_interval)
+            try:
+                await UserRepository.delete_expired_blacklist()
+                await self.sync()
+                self.revoked.prune()
+                self.users.prune()
+            except Exception:
+                logger.exception('Не удалось очистить черный список токенов')
+
+
+class RefreshTokenSweeper:
+    """Фоновое удаление истекших refresh-токенов пачками.
+
+    Каждая пачка - своя короткая транзакция, между пачками цикл уступает
+    управление, так что очистка после долгого простоя не блокирует вход.
+    """
+
+    def __init__(self, interval: float, batch_size: int):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.deleted = 0
+        self.last_sweep: dict | None = None
+        self._task: asyncio.Task | None = None
+
+    async def sweep(self) -> int:
+        started = time.perf_counter()
+        total, batches = 0, 0
+        while True:
+            deleted = await UserRepository.delete_expired_refresh_tokens(self.batch_size)
+            total += deleted
+            batches += 1
+            if deleted < self.batch_size:
+                break
+            await asyncio.sleep(0)
+        self.deleted += total
+        REFRESH_TOKENS.inc('expired', amount=total)
+        self.last_sweep = {
+            'deleted': total,
+            'batches': batches,
+            'duration_ms': round((time.perf_counter() - started) * 1000, 1),
+            'finished_at': datetime.now(timezone.utc).isoformat(),
+        }
+        return total
+
+    async def start(self):
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.sweep()
+            except Exception:
+                logger.exception('Не удалось удалить истекшие refresh-токены')
+            await asyncio.sleep(self.interval)
+
+    def snapshot(self) -> dict:
+        return {
+            'interval': self.interval,
+            'batch_size': self.batch_size,
+            'deleted': self.deleted,
+            'last_sweep': self.last_sweep,
+        }
+
+
+token_revocation = TokenRevocation(
+    cleanup_interval=settings.blacklist_cleanup_interval,
+    user_cache=UserCache(maxsize=settings.user_cache_size, ttl=settings.user_cache_ttl),
+)
+refresh_token_sweeper = RefreshTokenSweeper(
+    interval=settings.refresh_token_sweep_interval,
+    batch_size=settings.refresh_token_sweep_batch,
+)
@@ -0,0 +1,221 @@
+import re
+import html
+import logging
+from collections import defaultdict
+from database import engine
+from repositories.search import SearchRepository
+from config import settings
+
+
+
+
+logger = logging.getLogger(__name__)
+
+# postgres - tsvector + pg_trgm, memory - инвертированный индекс в процессе
+SEARCH_BACKEND = settings.search_backend or ('postgres' if engine.dialect.name == 'postgresql' else 'memory')
+
+WORD = re.compile(r'\w+')
+
+# Окончания для грубого стемминга в индексе в памяти, от длинных к коротким
+RUSSIAN_ENDINGS = sorted(
+    [
+        'иями', 'ями', 'ами', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ость', 'ости', 'ение', 'ения', 'ании',
+        'ой', 'ей', 'ий', 'ый', 'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ых', 'их', 'ам', 'ям', 'ах', 'ях',
+        'ом', 'ем', 'ов', 'ев', 'ую', 'юю', 'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й',
+    ],
+    key=len,
+    reverse=True,
+)
+
+# Веса полей как у setweight A/B/C в Postgres
+FIELD_WEIGHTS = (1.0, 0.4, 0.2)
+FUZZY_MIN_SIMILARITY = 0.35
+
+
+def stem(word: str) -> str:
+    word = word.lower().replace('ё', 'е')
+    for ending in RUSSIAN_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= 3:
+            return word[:-len(ending)]
+    return word
+
+
+def trigrams(term: str) -> set[str]:
+    padded = f'  {term} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def highlight(text: str, stems: set[str], max_words: int | None = None) -> str:
+    """Экранирует текст и оборачивает найденные слова в <mark>.
+
+    С max_words вырезает окно вокруг первого совпадения.
+    """
+    text = text or ''
+    words = list(WORD.finditer(text))
+    if not words:
+        return html.escape(text)
+    start, end = 0, len(words)
+    if max_words is not None and len(words) > max_words:
+        first = next((i for i, match in enumerate(words) if stem(match.group()) in stems), 0)
+        start = max(0, first - max_words // 3)
+        end = min(len(words), start + max_words)
+
+    position = words[start].start() if start else 0
+    parts = ['… '] if start else []
+    for match in words[start:end]:
+        parts.append(html.escape(text[position:match.start()]))
+        word = html.escape(match.group())
+        parts.append(f'<mark>{word}</mark>' if stem(match.group()) in stems else word)
+        position = match.end()
+    parts.append(html.escape(text[position:]) if end == len(words) else ' …')
+    return ''.join(parts)
+
+
+class InvertedIndex:
+    """Инвертированный индекс фондов в памяти для SQLite и тестов.
+
+    Термы - основы слов после stem(); для слов, которых нет в словаре,
+    подбираются похожие термы по триграммам (опечатки).
+    """
+
+    def __init__(self):
+        self.postings: dict[str, dict[int, float]] = defaultdict(dict)
+        self.doc_terms: dict[int, set[str]] = {}
+        self.docs: dict[int, tuple[str, str]] = {}
+        self.by_trigram: dict[str, set[str]] = defaultdict(set)
+
+    def add(self, fund_id: int, title: str, description: str, location: str | None, team_info: str | None):
+        self.remove(fund_id)
+        fields = (title, description, f'{location or ""} {team_info or ""}')
+        terms = {}
+        for text, weight in zip(fields, FIELD_WEIGHTS):
+            for word in WORD.findall(text or ''):
+                term = stem(word)
+                terms[term] = max(terms.get(term, 0.0), weight)
+
+        for term, weight in terms.items():
+            if term not in self.postings:
+                for gram in trigrams(term):
+                    self.by_trigram[gram].add(term)
+            self.postings[term][fund_id] = weight
+        self.doc_terms[fund_id] = set(terms)
+        self.docs[fund_id] = (title, description)
+
+    def remove(self, fund_id: int):
+        for term in self.doc_terms.pop(fund_id, ()):
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            posting.pop(fund_id, None)
+            if not posting:
+                del self.postings[term]
+                for gram in trigrams(term):
+                    self.by_trigram[gram].discard(term)
+        self.docs.pop(fund_id, None)
+
+    def similar_terms(self, term: str, limit: int = 3) -> list[tuple[str, float]]:
+        grams = trigrams(term)
+        counts: dict[str, int] = defaultdict(int)
+        for gram in grams:
+            for candidate in self.by_trigram.get(gram, ()):
+                counts[candidate] += 1
+        scored = [
+            (candidate, common / (len(grams) + len(trigrams(candidate)) - common))
+            for candidate, common in counts.items()
+        ]
+        scored = [item for item in scored if item[1] >= FUZZY_MIN_SIMILARITY]
+        return sorted(scored, key=lambda item: -item[1])[:limit]
+
+    def search(self, q: str, limit: int, offset: int) -> list[tuple[int, float, str, str, bool]]:
+        """Возвращает [(id фонда, ранг, название с подсветкой, фрагмент, нечеткое ли совпадение)]."""
+        query_terms = {stem(word) for word in WORD.findall(q)}
+        if not query_terms:
+            return []
+
+        scores: dict[int, float] | None = None
+        matched: set[str] = set()
+        fuzzy = False
+        # Все слова запроса должны найтись (как AND в websearch_to_tsquery)
+        for term in query_terms:
+            if term in self.postings:
+                candidates = [(term, 1.0)]
+            else:
+                candidates = self.similar_terms(term)
+                fuzzy = fuzzy or bool(candidates)
+            term_scores: dict[int, float] = {}
+            for candidate, similarity in candidates:
+                matched.add(candidate)
+                for fund_id, weight in self.postings[candidate].items():
+                    term_scores[fund_id] = max(term_scores.get(fund_id, 0.0), weight * similarity)
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {fund_id: score + term_scores[fund_id] for fund_id, score in scores.items() if fund_id in term_scores}
+            if not scores:
+                return []
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[offset:offset + limit]
+        return [
+            (
+                fund_id,
+                score,
+                highlight(self.docs[fund_id][0], matched),
+                highlight(self.docs[fund_id][1], matched, max_words=30),
+                fuzzy,
+            )
+            for fund_id, score in ranked
+        ]
+
+
+class FundSearch:
+    """Поиск фондов: Postgres или индекс в памяти, в зависимости от SEARCH_BACKEND."""
+
+    def __init__(self, backend: str):
+        self.backend = backend
+        self.trigram = False
+        self.index = InvertedIndex() if backend == 'memory' else None
+
+    async def start(self):
+        if self.backend == 'postgres':
+            self.trigram = await SearchRepository.has_trigram_index()
+            if not self.trigram:
+                logger.warning('Нет индекса ix_funds_title_trgm (pg_trgm недоступен), поиск с опечатками отключен')
+            return
+        for row in await SearchRepository.get_documents():
+            self.index.add(*row)
+        logger.info('Индекс поиска построен: %s фондов', len(self.index.docs))
+
+    def index_fund(self, fund):
+        # Вызывается репозиторием после коммита; для Postgres индекс обновляет сама база
+        if self.index is not None:
+            self.index.add(fund.id, fund.title, fund.description, fund.location, fund.team_info)
+
+    def remove_fund(self, fund_id: int):
+        if self.index is not None:
+            self.index.remove(fund_id)
+
+    async def search(self, q: str, limit: int, offset: int) -> list[tuple]:
+        """Возвращает [(фонд, ранг, совпадение, название с подсветкой, фрагмент)]."""
+        if self.backend == 'postgres':
+            hits = [
+                (fund, rank, 'fulltext', title, snippet)
+                for fund, rank, title, snippet in await SearchRepository.search_fulltext(q, limit, offset)
+            ]
+            # Добираем похожие по триграммам названия, если точных совпадений мало
+            if self.trigram and offset == 0 and len(hits) < limit:
+                exclude = [hit[0].id for hit in hits]
+                for fund, similarity in await SearchRepository.search_fuzzy(q, limit - len(hits), exclude):
+                    title = highlight(fund.title, set())
+                    hits.append((fund, similarity, 'fuzzy', title, highlight(fund.description, set(), max_words=30)))
+            return hits
+
+        found = self.index.search(q, limit, offset)
+        funds = await SearchRepository.get_funds_by_ids([hit[0] for hit in found]) if found else {}
+        return [
+            (funds[fund_id], rank, 'fuzzy' if fuzzy else 'fulltext', title, snippet)
+            for fund_id, rank, title, snippet, fuzzy in found
+            if fund_id in funds
+        ]
+
+
+fund_search = FundSearch(SEARCH_BACKEND)
@@ -1,31 +1,25 @@
-import os
-from dotenv import load_dotenv
-from fastapi import Depends, HTTPException, status
+import hmac
+from fastapi import Depends, Header, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from jose import jwt, JWTError
 from datetime import datetime, timedelta, timezone
-from database import new_session
-from models.auth import BlacklistedTokenOrm, UserOrm
-from sqlalchemy import select, delete
-from repositories.auth import UserRepository
+from models.auth import UserOrm
+from utils.revocation import token_revocation
+from config import settings
 
 
 
 
-load_dotenv()
-
-SECRET_KEY = os.getenv('SECRET_KEY')
-ALGORITHM = os.getenv('ALGORITHM')
-ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv('ACCESS_TOKEN_EXPIRE_MINUTES'))
-
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
+oauth2_scheme_optional = OAuth2PasswordBearer(tokenUrl="auth/login", auto_error=False)
 
 
 def create_access_token(data: dict) -> str:
+    from jose import jwt
+
     to_encode = data.copy()
-    expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    expire = datetime.now(timezone.utc) + timedelta(minutes=settings.access_token_expire_minutes)
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    encoded_jwt = jwt.encode(to_encode, settings.secret_key, algorithm=settings.algorithm)
     return encoded_jwt
 
 
@@ -36,27 +30,50 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> UserOrm:
         headers={"WWW-Authenticate": "Bearer"},
     )
     
-    async with new_session() as session:
-        query = delete(BlacklistedTokenOrm).where(BlacklistedTokenOrm.expires_at < datetime.now(timezone.utc))
-        await session.execute(query)
-        await session.commit()
-    
-    async with new_session() as session:
-        query = select(BlacklistedTokenOrm).where(BlacklistedTokenOrm.token == token)
-        result = await session.execute(query)
-        if result.scalars().first():
-            raise credentials_exception
-    
+    # Проверка целиком в памяти: подпись и срок токена, черный список, кэш пользователей
+    from jose import jwt, JWTError
+
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
         email: str = payload.get("sub")
         if email is None:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
     
-    user = await UserRepository.get_user_by_email(email)
+    if token_revocation.is_revoked(token):
+        raise credentials_exception
+    
+    user = await token_revocation.get_user(email)
     if user is None:
         raise credentials_exception
     
-    return user
\ No newline at end of file
+    return user
+
+
+async def get_optional_user(token: str | None = Depends(oauth2_scheme_optional)) -> UserOrm | None:
+    # Без токена запрос анонимный, но с неверным токеном - все равно 401
+    if token is None:
+        return None
+    return await get_current_user(token)
+
+
+async def revoke_access_token(token: str):
+    from jose import jwt, JWTError
+
+    try:
+        payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
+    except JWTError:
+        return
+    expires_at = datetime.fromtimestamp(payload["exp"], tz=timezone.utc)
+    await token_revocation.revoke(token, expires_at)
+
+
+async def require_admin(x_admin_token: str | None = Header(None)):
+    # Ручки /system/* отдают SQL, профили и внутреннее состояние сервисов.
+    # Без ADMIN_TOKEN (или PROFILING_TOKEN) их как будто нет; сравнение за постоянное время
+    admin_token = settings.admin_token or settings.profiling_token
+    if not admin_token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if x_admin_token is None or not hmac.compare_digest(x_admin_token.encode(), admin_token.encode()):
+        raise HTTPException(status_code=403, detail="Нужен верный X-Admin-Token")
@@ -0,0 +1,90 @@
+import io
+import csv
+from datetime import datetime, timezone
+from typing import AsyncIterable, AsyncIterator, Iterable
+import orjson
+from schemas.funds import SFund
+
+
+
+
+# Поля в том же порядке, что у SFund, чтобы JSON совпадал с model_dump_json
+FUND_FIELDS = tuple(SFund.model_fields)
+NDJSON_BATCH = 500
+
+
+def fund_dicts(funds: Iterable, now: datetime | None = None) -> list[dict]:
+    """Фонды из базы в словари формата SFund без повторной валидации.
+
+    Данные уже прошли валидацию при записи, поэтому здесь только читаем
+    атрибуты, а days_left считаем от одного now на весь ответ.
+    """
+    now = now or datetime.now(timezone.utc)
+    rows = []
+    for fund in funds:
+        row = {name: getattr(fund, name) for name in FUND_FIELDS}
+        target_date = row['target_date']
+        if target_date.tzinfo is None:
+            # SQLite возвращает даты без часового пояса, в базе они в UTC
+            target_date = target_date.replace(tzinfo=timezone.utc)
+        row['days_left'] = (target_date - now).days
+        rows.append(row)
+    return rows
+
+
+def dumps(value) -> bytes:
+    # OPT_UTC_Z: даты в UTC пишутся с Z, как у pydantic
+    return orjson.dumps(value, option=orjson.OPT_UTC_Z)
+
+
+def dump_funds(funds: Iterable, now: datetime | None = None) -> bytes:
+    return dumps(fund_dicts(funds, now))
+
+
+def dump_fund_page(funds: Iterable, next_cursor: str | None, now: datetime | None = None) -> bytes:
+    return dumps({'items': fund_dicts(funds, now), 'next_cursor': next_cursor})
+
+
+async def batches(funds: AsyncIterable, batch_size: int) -> AsyncIterator[list]:
+    batch = []
+    async for fund in funds:
+        batch.append(fund)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def stream_ndjson(funds: AsyncIterable, batch_size: int = NDJSON_BATCH) -> AsyncIterator[bytes]:
+    """Отдает фонды построчно (NDJSON) пачками, не собирая весь список в памяти."""
+    now = datetime.now(timezone.utc)
+    async for batch in batches(funds, batch_size):
+        yield b''.join(dumps(row) + b'\n' for row in fund_dicts(batch, now))
+
+
+def csv_value(value) -> str:
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, dict):
+        return dumps(value).decode()
+    return value
+
+
+async def stream_csv(funds: AsyncIterable, batch_size: int = NDJSON_BATCH) -> AsyncIterator[bytes]:
+    """То же в CSV с заголовком; колонки как у SFund, его можно загрузить обратно в /funds/bulk."""
+    now = datetime.now(timezone.utc)
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow([*FUND_FIELDS, 'days_left'])
+    async for batch in batches(funds, batch_size):
+        for row in fund_dicts(batch, now):
+            writer.writerow([csv_value(value) for value in row.values()])
+        yield output.getvalue().encode()
+        output.seek(0)
+        output.truncate()
+    if output.tell():
+        # Пустой результат: только заголовок
+        yield output.getvalue().encode()
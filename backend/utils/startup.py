@@ -0,0 +1,101 @@
+import json
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from sqlalchemy import text
+from database import engine, replicas
+from utils.passwords import password_hasher
+from config import settings
+
+
+
+
+logger = logging.getLogger(__name__)
+
+
+class StartupTimer:
+    """Длительность фаз запуска приложения."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: list[tuple[str, float]] = []
+        self.total: float | None = None
+
+    @asynccontextmanager
+    async def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def record(self, name: str, seconds: float):
+        self.phases.append((name, seconds))
+
+    def finish(self):
+        self.total = time.perf_counter() - self.started
+        logger.info('Запуск за %.0f мс: %s', self.total * 1000, ', '.join(
+            f'{name} {seconds * 1000:.0f}' for name, seconds in self.phases
+        ))
+        if settings.startup_timings_file:
+            with open(settings.startup_timings_file, 'w') as file:
+                json.dump(self.snapshot(), file, ensure_ascii=False, indent=2)
+
+    def snapshot(self) -> dict:
+        return {
+            'total_ms': round(self.total * 1000, 1) if self.total is not None else None,
+            'phases': [{'name': name, 'ms': round(seconds * 1000, 1)} for name, seconds in self.phases],
+        }
+
+
+async def asgi_get(app, path: str) -> int:
+    """GET к приложению в обход сети; возвращает статус ответа."""
+    status = 0
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+        'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'',
+        'root_path': '', 'headers': [(b'host', b'warmup')], 'client': None, 'server': None,
+    }
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+
+    await app(scope, receive, send)
+    return status
+
+
+async def warm_connections(target_engine, count: int):
+    # Соединения открываются параллельно, иначе пул отдаст одно и то же
+    async def touch():
+        async with target_engine.connect() as conn:
+            await conn.execute(text('SELECT 1'))
+
+    await asyncio.gather(*(touch() for _ in range(count)))
+
+
+async def warm_up(app):
+    await warm_connections(engine, settings.db_pool_size if engine.dialect.name != 'sqlite' else 1)
+    for replica in replicas.replicas:
+        try:
+            await warm_connections(replica.engine, settings.db_pool_size)
+        except Exception as e:
+            logger.warning('Не удалось прогреть реплику %s: %s', replica.name, e)
+    await password_hasher.warm_up()
+    # Горячие списки попадают в кэш ответов, первый клиент не ждет базу
+    for path in settings.startup_warmup_paths:
+        try:
+            status = await asgi_get(app, path)
+        except Exception:
+            logger.exception('Прогрев %s не удался', path)
+            continue
+        if status != 200:
+            logger.warning('Прогрев %s: статус %s', path, status)
+
+
+startup_timer = StartupTimer()
@@ -0,0 +1,285 @@
+import os
+import re
+import stat
+import asyncio
+import mimetypes
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from config import settings
+
+
+
+
+UPLOADS_STREAM_CHUNK = 256 * 1024
+
+# Имена от save_upload и build_variants: содержимое под таким именем не меняется
+HASHED_NAME = re.compile(r'^[0-9a-f]{32}(-[a-z]+)?\.[a-z0-9]+$')
+SAFE_NAME = re.compile(r'^[\w-][\w.-]*$')
+
+CACHE_IMMUTABLE = b'public, max-age=31536000, immutable'
+CACHE_REVALIDATE = b'no-cache'
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+class UploadEntry:
+    """Метаданные файла из uploads, посчитанные один раз."""
+
+    __slots__ = ('name', 'path', 'size', 'mtime', 'etag', 'headers', 'not_modified_headers')
+
+    def __init__(self, directory: str, name: str, stat_result: os.stat_result):
+        self.name = name
+        self.path = os.path.join(directory, name)
+        self.size = stat_result.st_size
+        self.mtime = int(stat_result.st_mtime)
+
+        # Для имени по хэшу ETag - само имя, иначе mtime и размер
+        if HASHED_NAME.match(name):
+            self.etag = f'"{name}"'
+            cache_control = CACHE_IMMUTABLE
+        else:
+            self.etag = f'"{stat_result.st_mtime_ns:x}-{self.size:x}"'
+            cache_control = CACHE_REVALIDATE
+
+        content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        self.not_modified_headers = [
+            (b'etag', self.etag.encode()),
+            (b'last-modified', formatdate(self.mtime, usegmt=True).encode()),
+            (b'cache-control', cache_control),
+        ]
+        self.headers = [
+            *self.not_modified_headers,
+            (b'content-type', content_type.encode()),
+            (b'accept-ranges', b'bytes'),
+        ]
+
+    def is_not_modified(self, if_none_match: str | None, if_modified_since: str | None) -> bool:
+        if if_none_match is not None:
+            # Для If-None-Match сравнение слабое: W/"x" совпадает с "x"
+            tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+            return '*' in tags or self.etag in tags
+        if if_modified_since is not None:
+            try:
+                return parsedate_to_datetime(if_modified_since).timestamp() >= self.mtime
+            except (TypeError, ValueError):
+                return False
+        return False
+
+
+def parse_range(value: str, size: int) -> tuple[int, int] | None:
+    """Разбирает Range, возвращает [start, end) или None, если заголовок надо игнорировать.
+
+    Поддерживается один диапазон; на несколько диапазонов отдаем файл
+    целиком, это разрешено RFC 9110.
+    """
+    unit, _, spec = value.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        return None
+    first, dash, last = spec.strip().partition('-')
+    if not dash:
+        return None
+    try:
+        if first:
+            start = int(first)
+            end = int(last) + 1 if last else size
+            if last and end <= start:
+                return None
+        else:
+            start = max(0, size - int(last))
+            end = size
+    except ValueError:
+        return None
+    if start >= size or end <= start:
+        raise RangeNotSatisfiable()
+    return start, min(end, size)
+
+
+class UploadsIndex:
+    """Индекс файлов uploads в памяти, чтобы не делать stat на каждый запрос.
+
+    Заполняется сканированием при старте; файл, которого нет в индексе
+    (например, его записал другой воркер), добавляется после одного stat.
+    Небольшие файлы дополнительно держатся в памяти целиком (LRU).
+    """
+
+    def __init__(self, directory: str, memory_bytes: int, memory_max_file: int):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.memory_max_file = memory_max_file
+        self._entries: dict[str, UploadEntry] = {}
+        self._bodies: OrderedDict[str, bytes] = OrderedDict()
+        self._body_bytes = 0
+
+    def scan(self):
+        entries = {}
+        with os.scandir(self.directory) as items:
+            for item in items:
+                if not item.name.startswith('.') and item.is_file():
+                    entries[item.name] = UploadEntry(self.directory, item.name, item.stat())
+        self._entries = entries
+        self._bodies.clear()
+        self._body_bytes = 0
+
+    def get(self, name: str) -> UploadEntry | None:
+        entry = self._entries.get(name)
+        if entry is None:
+            try:
+                stat_result = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                return None
+            if not stat.S_ISREG(stat_result.st_mode):
+                return None
+            entry = self._entries[name] = UploadEntry(self.directory, name, stat_result)
+        return entry
+
+    def forget(self, name: str):
+        self._entries.pop(name, None)
+        body = self._bodies.pop(name, None)
+        if body is not None:
+            self._body_bytes -= len(body)
+
+    async def read_body(self, entry: UploadEntry) -> bytes | None:
+        """Содержимое файла из памяти; None, если файл слишком велик для кэша."""
+        if entry.size > self.memory_max_file:
+            return None
+        body = self._bodies.get(entry.name)
+        if body is not None:
+            self._bodies.move_to_end(entry.name)
+            return body
+
+        body = await asyncio.to_thread(_read_file, entry.path)
+        self._bodies[entry.name] = body
+        self._body_bytes += len(body)
+        while self._body_bytes > self.memory_bytes and self._bodies:
+            _, evicted = self._bodies.popitem(last=False)
+            self._body_bytes -= len(evicted)
+        return body
+
+    def snapshot(self) -> dict:
+        return {
+            "files": len(self._entries),
+            "cached_files": len(self._bodies),
+            "cached_bytes": self._body_bytes,
+        }
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def _read_chunk(fd: int, size: int, offset: int) -> bytes:
+    return os.pread(fd, size, offset)
+
+
+class UploadsApp:
+    """ASGI-приложение для /uploads вместо StaticFiles.
+
+    - имена по хэшу содержимого отдаются с Cache-Control: immutable;
+    - сильный ETag и Last-Modified, ответ 304 на If-None-Match/If-Modified-Since;
+    - один диапазон Range (206/416) с учетом If-Range;
+    - метаданные берутся из UploadsIndex без stat на запрос;
+    - тело отдается через расширения ASGI http.response.pathsend или
+      http.response.zerocopysend, если сервер их поддерживает (sendfile
+      на стороне сервера), иначе из памяти или кусками через pread.
+    """
+
+    def __init__(self, index: UploadsIndex):
+        self.index = index
+
+    async def start(self):
+        await asyncio.to_thread(self.index.scan)
+
+    async def __call__(self, scope, receive, send):
+        method = scope['method']
+        if method not in ('GET', 'HEAD'):
+            return await self._plain(send, 405, b'Method Not Allowed', [(b'allow', b'GET, HEAD')])
+
+        # uploads плоская папка, поэтому берем только последний сегмент пути
+        name = scope['path'].rsplit('/', 1)[-1]
+        entry = self.index.get(name) if SAFE_NAME.match(name) else None
+        if entry is None:
+            return await self._plain(send, 404, b'Not Found')
+
+        if_none_match = if_modified_since = http_range = if_range = None
+        for key, value in scope['headers']:
+            if key == b'if-none-match':
+                if_none_match = value.decode('latin-1')
+            elif key == b'if-modified-since':
+                if_modified_since = value.decode('latin-1')
+            elif key == b'range':
+                http_range = value.decode('latin-1')
+            elif key == b'if-range':
+                if_range = value.decode('latin-1')
+
+        if entry.is_not_modified(if_none_match, if_modified_since):
+            await send({'type': 'http.response.start', 'status': 304, 'headers': entry.not_modified_headers})
+            return await send({'type': 'http.response.body', 'body': b''})
+
+        status, start, end = 200, 0, entry.size
+        headers = list(entry.headers)
+        if http_range is not None and (if_range is None or if_range.strip() == entry.etag):
+            try:
+                byte_range = parse_range(http_range, entry.size)
+            except RangeNotSatisfiable:
+                extra = [(b'content-range', f'bytes */{entry.size}'.encode())]
+                return await self._plain(send, 416, b'Range Not Satisfiable', extra)
+            if byte_range is not None:
+                status, (start, end) = 206, byte_range
+                headers.append((b'content-range', f'bytes {start}-{end - 1}/{entry.size}'.encode()))
+        headers.append((b'content-length', str(end - start).encode()))
+
+        if method == 'HEAD':
+            await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+            return await send({'type': 'http.response.body', 'body': b''})
+
+        extensions = scope.get('extensions') or {}
+        if 'http.response.pathsend' in extensions and status == 200:
+            await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+            return await send({'type': 'http.response.pathsend', 'path': entry.path})
+
+        # Файл открываем до отправки заголовков: если его удалили, еще можно ответить 404
+        try:
+            body = None if 'http.response.zerocopysend' in extensions else await self.index.read_body(entry)
+            fd = None if body is not None else await asyncio.to_thread(os.open, entry.path, os.O_RDONLY)
+        except FileNotFoundError:
+            self.index.forget(name)
+            return await self._plain(send, 404, b'Not Found')
+
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        if body is not None:
+            return await send({'type': 'http.response.body', 'body': body[start:end] if status == 206 else body})
+
+        try:
+            if 'http.response.zerocopysend' in extensions:
+                with os.fdopen(fd, 'rb', closefd=False) as file:
+                    return await send({
+                        'type': 'http.response.zerocopysend', 'file': file, 'offset': start, 'count': end - start,
+                    })
+            offset = start
+            while offset < end:
+                chunk = await asyncio.to_thread(_read_chunk, fd, min(UPLOADS_STREAM_CHUNK, end - offset), offset)
+                if not chunk:
+                    break
+                offset += len(chunk)
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': offset < end})
+            if offset < end:
+                await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    async def _plain(send, status: int, body: bytes, extra_headers: list | None = None):
+        headers = [
+            (b'content-type', b'text/plain; charset=utf-8'),
+            (b'content-length', str(len(body)).encode()),
+            *(extra_headers or []),
+        ]
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
+
+
+uploads_index = UploadsIndex(settings.uploads_dir, settings.uploads_memory_bytes, settings.uploads_memory_max_file)
+uploads_app = UploadsApp(uploads_index)
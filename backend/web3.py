@@ -0,0 +1,199 @@
+import json
+import itertools
+from config import settings
+
+
+
+
+# keccak256 сигнатур событий из contracts/*.sol
+TOPIC_DONATED = '0x4928895ba6723e8e27b15f32e4c3054a1b6c7f8c03f133558d6fa42b3928d14c'
+TOPIC_REQUEST_CREATED = '0xf7365309cb3a1c4835d32acd2153ebf718723e270daad5bb2aac6dd47564583b'
+TOPIC_REQUEST_VOTED = '0x0e0d62b5b16c4b8eeae2ac186feec93f3d35096fe985e4a42b81aada87e0e037'
+TOPIC_REQUEST_EXECUTED = '0xef27be81927e7864d720b5f4416fa8a4a299f53cf459b679c616b7d7ae590618'
+TOPIC_REFUNDED = '0xd7dee2702d63ad89917b6a4da9981c90c4d24f8c2bdfd64c604ecae57d8d0651'
+TOPIC_CAMPAIGN_CREATED = '0x0ef2bf7802c393948d08caf4d04a02be072741662e1757a4b7c941f583cdf9f7'
+
+# Селекторы функций: первые 4 байта keccak256 сигнатуры
+SELECTOR_CREATE_CAMPAIGN = '0x22502268'  # createCampaign(uint256,uint256)
+SELECTOR_GOAL = '0x40193883'  # goal()
+SELECTOR_DEADLINE = '0x29dcb0cf'  # deadline()
+SELECTOR_TOTAL_DONATED = '0x00b37044'  # totalDonated()
+SELECTOR_TOTAL_SPENT = '0xfb346eab'  # totalSpent()
+SELECTOR_GOAL_REACHED = '0x7d3d6522'  # goalReached()
+SELECTOR_NEXT_REQUEST_ID = '0x6a84a985'  # nextRequestId()
+SELECTOR_GET_STATUS = '0x4e69d560'  # getStatus()
+SELECTOR_GET_CONTRACT_BALANCE = '0x6f9fb98a'  # getContractBalance()
+SELECTOR_SPENDING_REQUESTS = '0xe77e0f8e'  # spendingRequests(uint256)
+
+CAMPAIGN_TOPICS = [
+    TOPIC_DONATED,
+    TOPIC_REQUEST_CREATED,
+    TOPIC_REQUEST_VOTED,
+    TOPIC_REQUEST_EXECUTED,
+    TOPIC_REFUNDED,
+]
+
+
+class RpcError(Exception):
+    def __init__(self, code: int, message: str):
+        super().__init__(f'{code}: {message}')
+        self.code = code
+        self.message = message
+
+    @property
+    def too_many_results(self) -> bool:
+        # Формулировки у провайдеров разные: geth/anvil, Alchemy, Infura
+        text = self.message.lower()
+        return self.code == -32005 or any(
+            marker in text for marker in ('more than', 'too many', 'limit exceeded', 'range is too large', 'block range')
+        )
+
+
+class RpcClient:
+    """JSON-RPC клиент к RPC_URL с пулом keep-alive соединений и batch-запросами."""
+
+    def __init__(self, url: str = settings.rpc_url, timeout: float = 30):
+        if '://' not in url:
+            url = f'http://{url}'
+        self.url = url
+        self.timeout = timeout
+        self._client = None
+        self._ids = itertools.count(1)
+
+    @property
+    def client(self):
+        if self._client is None:
+            import httpx
+
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=20),
+            )
+        return self._client
+
+    async def call(self, method: str, params: list | None = None):
+        result = (await self.batch([(method, params or [])]))[0]
+        if isinstance(result, RpcError):
+            raise result
+        return result
+
+    async def batch(self, calls: list[tuple[str, list]]) -> list:
+        """Отправляет несколько вызовов одним HTTP-запросом.
+
+        Возвращает результаты в порядке вызовов; ошибка отдельного вызова
+        возвращается на его месте как RpcError, а не поднимается.
+        Ошибки транспорта поднимаются как RpcError.
+        """
+        if not calls:
+            return []
+        ids = [next(self._ids) for _ in calls]
+        payload = [
+            {'jsonrpc': '2.0', 'id': call_id, 'method': method, 'params': params}
+            for call_id, (method, params) in zip(ids, calls)
+        ]
+        import httpx
+
+        try:
+            response = await self.client.post(self.url, json=payload)
+            response.raise_for_status()
+            replies = response.json()
+        except (httpx.HTTPError, ValueError) as e:
+            # Сбой транспорта или не-JSON ответ - та же ошибка узла, что и JSON-RPC error
+            raise RpcError(0, f'{type(e).__name__}: {e}') from e
+        if isinstance(replies, dict):
+            # Узел отверг batch целиком
+            error = replies.get('error') or {}
+            raise RpcError(error.get('code', 0), error.get('message', 'batch rejected'))
+
+        by_id = {reply.get('id'): reply for reply in replies}
+        results = []
+        for call_id in ids:
+            reply = by_id.get(call_id, {'error': {'code': 0, 'message': 'no reply'}})
+            if 'error' in reply:
+                results.append(RpcError(reply['error'].get('code', 0), reply['error'].get('message', '')))
+            else:
+                results.append(reply.get('result'))
+        return results
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class RecordedRpc:
+    """Подмена RpcClient, отвечающая из записанной фикстуры.
+
+    Фикстура - JSON вида {"head": 123, "blocks": {"<номер>": "<hash>"}, "logs": [...]},
+    где logs - ответы eth_getLogs как их отдает узел.
+    """
+
+    def __init__(self, path: str):
+        with open(path) as f:
+            fixture = json.load(f)
+        self.head = fixture['head']
+        self.blocks = {int(number): block_hash for number, block_hash in fixture.get('blocks', {}).items()}
+        self.logs = fixture['logs']
+
+    async def call(self, method: str, params: list | None = None):
+        return (await self.batch([(method, params or [])]))[0]
+
+    async def batch(self, calls: list[tuple[str, list]]) -> list:
+        return [self._answer(method, params) for method, params in calls]
+
+    def _answer(self, method: str, params: list):
+        if method == 'eth_blockNumber':
+            return hex(self.head)
+        if method == 'eth_getBlockByNumber':
+            number = int(params[0], 16)
+            return {'number': params[0], 'hash': self.blocks.get(number, '0x%064x' % number)}
+        if method == 'eth_getLogs':
+            query = params[0]
+            from_block, to_block = int(query['fromBlock'], 16), int(query['toBlock'], 16)
+            addresses = {a.lower() for a in query.get('address', [])}
+            topics = set(query.get('topics', [[]])[0] or [])
+            return [
+                log for log in self.logs
+                if from_block <= int(log['blockNumber'], 16) <= to_block
+                and (not addresses or log['address'].lower() in addresses)
+                and (not topics or log['topics'][0] in topics)
+            ]
+        return RpcError(-32601, f'method {method} not recorded')
+
+    async def close(self):
+        pass
+
+
+# --- Кодирование и декодирование ABI для статических типов ---
+
+def encode_uint(value: int) -> str:
+    return f'{value:064x}'
+
+
+def encode_call(selector: str, *args: int) -> str:
+    return selector + ''.join(encode_uint(arg) for arg in args)
+
+
+def words(data: str) -> list[str]:
+    data = data[2:] if data.startswith('0x') else data
+    return [data[i:i + 64] for i in range(0, len(data), 64)]
+
+
+def decode_uint(word: str) -> int:
+    return int(word, 16)
+
+
+def decode_bool(word: str) -> bool:
+    return int(word, 16) != 0
+
+
+def decode_address(word: str) -> str:
+    return '0x' + word[-40:]
+
+
+def decode_string(data: str, offset_word: str) -> str:
+    data = data[2:] if data.startswith('0x') else data
+    start = int(offset_word, 16) * 2
+    length = int(data[start:start + 64], 16)
+    raw = bytes.fromhex(data[start + 64:start + 64 + length * 2])
+    return raw.decode('utf-8', errors='replace')
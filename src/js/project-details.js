@@ -332,6 +332,38 @@ function renderProjectData(project) {
 	}
 }
 
+// Обновления сбора без опроса: сервер присылает событие при каждом пожертвовании
+function subscribeProjectUpdates() {
+	if (!window.EventSource) return
+
+	const events = new EventSource(`${API_BASE_URL}/funds/${projectId}/events`)
+	events.addEventListener('progress', event => {
+		const progress = JSON.parse(event.data)
+
+		const donatorsCount = document.getElementById('donatorsCount')
+		if (donatorsCount) {
+			donatorsCount.textContent = progress.donate_count.toString()
+		}
+
+		if (ethers.isAddress(contractAddress)) {
+			loadProjectStats()
+			return
+		}
+
+		const progressPercent = document.getElementById('progressPercent')
+		const progressBar = document.getElementById('progressBar')
+		if (progressPercent && progressBar && progress.target > 0) {
+			const percent = Math.min(
+				100,
+				Math.floor((progress.collected / progress.target) * 100)
+			)
+			progressPercent.textContent = `${percent}%`
+			progressBar.style.width = `${percent}%`
+		}
+	})
+	window.addEventListener('beforeunload', () => events.close())
+}
+
 // Инициализация страницы
 async function initializePage() {
 	try {
@@ -340,6 +372,9 @@ async function initializePage() {
 
 		renderProjectData(projectData)
 		contractAddress = projectData.contract_address
+		subscribeProjectUpdates()
+		// Состояние контракта читает бэкенд, кошелек для этого не нужен
+		loadProjectStats()
 
 		// Загружаем ABI
 		const response = await fetch('/abi/CharityCampaign.json')
@@ -397,27 +432,29 @@ async function initContract() {
 
 // Загрузка статистики проекта
 async function loadProjectStats() {
-	if (!contract) return
+	if (!contractAddress || !ethers.isAddress(contractAddress)) return
 
 	try {
-		const stats = await contract.getProjectStats()
+		const response = await fetch(`${API_BASE_URL}/funds/${projectId}/onchain`)
+		if (!response.ok) return
+		const stats = await response.json()
 
 		const totalDonations = document.getElementById('totalDonations')
 		if (totalDonations) {
 			totalDonations.textContent = `${ethers.formatEther(
-				stats.totalDonations
+				stats.total_donated
 			)} ETH`
 		}
 
-		const donatorsCount = document.getElementById('donatorsCount')
-		if (donatorsCount) {
-			donatorsCount.textContent = stats.donatorsCount.toString()
-		}
-
+		// Суммы в wei приходят строками, считаем в BigInt
 		const progressPercent = document.getElementById('progressPercent')
 		const progressBar = document.getElementById('progressBar')
-		if (progressPercent && progressBar) {
-			const percent = Math.min(100, stats.progressPercent)
+		const goal = BigInt(stats.goal)
+		if (progressPercent && progressBar && goal > 0n) {
+			const percent = Math.min(
+				100,
+				Number((BigInt(stats.total_donated) * 100n) / goal)
+			)
 			progressPercent.textContent = `${percent}%`
 			progressBar.style.width = `${percent}%`
 		}
@@ -183,7 +183,15 @@ async function apiRequest(endpoint, method = 'GET', body = null) {
 async function loadProjects() {
     console.log("[Projects] Loading projects...");
     try {
-        const data = await apiRequest('/funds/');
+        // Листинг постраничный: идем по next_cursor, пока страницы не закончатся
+        const data = [];
+        let cursor = null;
+        do {
+            const query = cursor ? `?limit=100&cursor=${encodeURIComponent(cursor)}` : '?limit=100';
+            const page = await apiRequest(`/funds/${query}`);
+            data.push(...page.items);
+            cursor = page.next_cursor;
+        } while (cursor);
         console.log("[Projects] Projects loaded:", data.length);
         return data;
     } catch (error) {
@@ -279,10 +287,15 @@ function generateProjectCards(filteredProjects) {
         const categoryName = categories[project.category_id] || `Unknown (${project.category_id})`;
         console.log("[Projects] Category name:", categoryName);
         
+        // Уменьшенная копия для карточки, если сервер уже ее подготовил
+        const imageUrl = project.photo_variants?.card_webp
+            ? `${API_BASE_URL}${project.photo_variants.card_webp}`
+            : `${API_BASE_URL}/uploads/${project.id}.png`;
+        
         const projectCard = document.createElement('div');
         projectCard.className = 'project-card';
         projectCard.innerHTML = `
-            <img src="${API_BASE_URL}/uploads/${project.id}.png" class="project-image">
+            <img src="${imageUrl}" class="project-image" loading="lazy">
             <div class="project-content">
                 <span class="project-category">${categoryName}</span>
                 <h3 class="project-title">${project.title}</h3>